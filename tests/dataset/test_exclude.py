@@ -1,7 +1,8 @@
 # -*- coding=utf-8 -*-
 import pytest
+from unittest.mock import patch
 
-from zettarepl.dataset.exclude import should_exclude
+from zettarepl.dataset.exclude import ExcludeList, ExcludeMatcher, should_exclude, should_exclude_slow
 
 
 @pytest.mark.parametrize("dataset,exclude,result", [
@@ -16,3 +17,44 @@ from zettarepl.dataset.exclude import should_exclude
 ])
 def test__should_exclude(dataset, exclude, result):
     assert should_exclude(dataset, exclude) == result
+
+
+@pytest.mark.parametrize("dataset,exclude,result", [
+    ("data", ["data/.system"], False),
+    ("data/.system", ["data/.system"], True),
+    ("data/.system/cores", ["data/.system"], True),
+    ("data/.system-settings", ["data/.system"], False),
+    ("data/.system/cores", ["data/*/cores"], True),
+    ("data/.system/cores2", ["data/*/cores"], False),
+    ("data/a", ["data/[ab]", "backup"], True),
+    ("data/a/b", ["data/[ab]", "backup"], False),
+    ("data/c", ["data/[ab]", "backup"], False),
+    ("data/work", ["data/", "backup"], True),
+    ("data/work/", ["data/work", "backup"], True),
+    ("data/../data/work", ["data/work"], True),
+])
+def test__exclude_matcher(dataset, exclude, result):
+    matcher = ExcludeMatcher(exclude)
+    assert matcher.should_exclude(dataset) == should_exclude_slow(dataset, exclude) == result
+    assert matcher.should_exclude(dataset) == result
+
+
+def test__should_exclude__exclude_list():
+    exclude = ExcludeList(["data/.system", "data/*/cores"])
+
+    assert should_exclude("data/.system/cores", exclude)
+    assert should_exclude("data/work/cores", exclude)
+    assert not should_exclude("data/work", exclude)
+
+    assert exclude.matcher.results == {"data/.system/cores": True, "data/work/cores": True, "data/work": False}
+
+
+def test__exclude_matcher__memoized_results_are_bounded():
+    matcher = ExcludeMatcher(["data/*/cores"])
+
+    with patch("zettarepl.dataset.exclude.MAX_MEMOIZED_RESULTS", 2):
+        assert not matcher.should_exclude("data/a")
+        assert matcher.should_exclude("data/a/cores")
+        assert not matcher.should_exclude("data/b")
+
+    assert matcher.results == {"data/b": False}
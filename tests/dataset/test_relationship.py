@@ -11,6 +11,9 @@ from zettarepl.dataset.relationship import is_child, is_immediate_child
     ("data/.system-settings", "data/.system", False),
     ("my-data", "data/.system", False),
     ("my-data/.system", "data/.system", False),
+    ("data/..system", "data", False),
+    ("data/./work", "data", True),
+    ("data/work/", "data/work", True),
 ])
 def test__is_child(child, parent, result):
     assert is_child(child, parent) == result
@@ -21,6 +24,7 @@ def test__is_child(child, parent, result):
     ("data/.system/cores", "data/.system", True),
     ("data/.system/cores/linux", "data/.system", False),
     ("my-data/.system/cores/linux", "data/.system", False),
+    ("data/.system/./cores", "data/.system/", True),
 ])
 def test__is_immediate_child(child, parent, result):
     assert is_immediate_child(child, parent) == result
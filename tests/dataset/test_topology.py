@@ -0,0 +1,90 @@
+# -*- coding=utf-8 -*-
+from unittest.mock import Mock, patch
+
+import pytest
+
+from zettarepl.dataset.create import create_dataset
+from zettarepl.dataset.list import list_datasets, list_datasets_with_properties
+from zettarepl.dataset.topology import DatasetTopologies, DatasetTopology
+from zettarepl.transport.zfscli.exception import DatasetDoesNotExistException
+
+DATASETS = [
+    {"name": "data", "type": "filesystem", "readonly": "off"},
+    {"name": "data/work", "type": "filesystem", "readonly": "off"},
+    {"name": "data/work/vm", "type": "volume", "readonly": "on"},
+    {"name": "data/workspace", "type": "filesystem", "readonly": "off"},
+]
+
+
+def test__dataset_topology__parent_recursive_listing():
+    topology = DatasetTopology(60)
+    topology.put("data", True, ["name", "type", "readonly"], DATASETS, 10 ** 10, 0)
+
+    assert topology.get("data/work", True, ["name", "type"]) == [
+        {"name": "data/work", "type": "filesystem"},
+        {"name": "data/work/vm", "type": "volume"},
+    ]
+    assert topology.get("data/work", False, ["name"]) == [{"name": "data/work"}]
+    assert topology.get("data/work", True, ["name", "encryption"]) is None
+    assert topology.get("backup", True, ["name"]) is None
+
+
+def test__dataset_topology__does_not_exist():
+    topology = DatasetTopology(60)
+    topology.put("data", True, ["name", "type", "readonly"], DATASETS, 10 ** 10, 0)
+
+    with pytest.raises(DatasetDoesNotExistException):
+        topology.get("data/home", True, ["name"])
+
+
+def test__dataset_topology__non_recursive_entry():
+    topology = DatasetTopology(60)
+    topology.put("data", False, ["name", "type"], [{"name": "data", "type": "filesystem"}], 10 ** 10, 0)
+
+    assert topology.get("data", True, ["name"]) is None
+    assert topology.get("data/work", False, ["name"]) is None
+
+
+def test__dataset_topology__invalidate():
+    topology = DatasetTopology(60)
+    for dataset, recursive in [(None, True), ("data", False), ("data/work", True), ("data/home", True)]:
+        topology.put(dataset, recursive, ["name", "type"], [], 10 ** 10, 0)
+
+    topology.invalidate("data/work/vm", False)
+
+    assert set(topology.entries.keys()) == {("data", False), ("data/home", True)}
+
+
+def test__list_datasets__cached():
+    shell = Mock()
+    shell.exec.return_value = "data\tfilesystem\ndata/work\tfilesystem\n"
+
+    with patch("zettarepl.dataset.list.dataset_topologies", DatasetTopologies(60)):
+        assert list_datasets(shell, cached=True) == ["data", "data/work"]
+        assert list_datasets(shell, "data/work", cached=True) == ["data/work"]
+        assert list_datasets_with_properties(shell, "data", False, cached=True) == [{"name": "data"}]
+
+    shell.exec.assert_called_once_with(["zfs", "list", "-t", "filesystem,volume", "-H", "-o", "name,type", "-s",
+                                        "name", "-r"])
+
+
+def test__list_datasets__not_cached():
+    shell = Mock()
+    shell.exec.return_value = "data\n"
+
+    with patch("zettarepl.dataset.list.dataset_topologies", DatasetTopologies(60)):
+        list_datasets(shell)
+        list_datasets(shell)
+
+    assert shell.exec.call_count == 2
+
+
+def test__create_dataset__invalidates():
+    topologies = DatasetTopologies(60)
+    shell = Mock()
+    topologies.topology(shell).put("data", True, ["name", "type"], [], 10 ** 10, 0)
+
+    with patch("zettarepl.dataset.create.dataset_topologies", topologies):
+        create_dataset(shell, "data/backup/work")
+
+    assert topologies.topology(shell).get("data", True, ["name"]) is None
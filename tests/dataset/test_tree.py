@@ -0,0 +1,38 @@
+# -*- coding=utf-8 -*-
+from zettarepl.dataset.tree import DatasetTree
+
+
+def test__dataset_tree():
+    tree = DatasetTree(["data/work", "data/work/child", "data/home", "backup"])
+
+    assert list(tree) == ["backup", "data/home", "data/work", "data/work/child"]
+    assert len(tree) == 4
+    assert "data/work" in tree
+    assert "data" not in tree
+
+    assert tree.subtree("data") == ["data/home", "data/work", "data/work/child"]
+    assert tree.subtree("data/work") == ["data/work", "data/work/child"]
+    assert tree.subtree("data/workspace") == []
+
+    assert tree.ancestors("data/work/child/grandchild") == ["data/work", "data/work/child"]
+    assert tree.ancestors("data") == []
+
+    assert tree.has_ancestor("data/work/x")
+    assert not tree.has_ancestor("data")
+    assert tree.has_descendant("data")
+    assert not tree.has_descendant("data/work/child/x")
+    assert tree.intersects("data")
+    assert tree.intersects("data/home/x")
+    assert not tree.intersects("data/workspace")
+
+
+def test__dataset_tree__remove_subtree():
+    tree = DatasetTree(["data/work", "data/work/child", "data/home"])
+
+    assert tree.remove_subtree("data/work") == ["data/work", "data/work/child"]
+    assert list(tree) == ["data/home"]
+    assert len(tree) == 1
+
+    assert tree.remove_subtree("data/home") == ["data/home"]
+    assert not tree.has_descendant("data")
+    assert len(tree) == 0
@@ -0,0 +1,35 @@
+# -*- coding=utf-8 -*-
+from datetime import timedelta
+
+import pytest
+
+from zettarepl.definition.definition import Definition, DefinitionErrors
+
+
+def definition(spread):
+    return {
+        "timezone": "UTC",
+        "spread": spread,
+        "periodic-snapshot-tasks": {
+            "src": {
+                "dataset": "data/src",
+                "recursive": True,
+                "naming-schema": "auto-%Y-%m-%d-%H-%M",
+                "schedule": {"minute": "*"},
+            },
+        },
+    }
+
+
+def test__from_data__spread():
+    assert Definition.from_data(definition("PT30S")).tasks[0].spread == timedelta(seconds=30)
+
+
+@pytest.mark.parametrize("spread", ["PT1M", "P1M"])
+def test__from_data__invalid_spread(spread):
+    with pytest.raises(DefinitionErrors) as e:
+        Definition.from_data(definition(spread))
+
+    # The task itself does not fail as the global spread is not applied to it
+    assert len(e.value.errors) == 1
+    assert str(e.value.errors[0]).startswith(f"Invalid spread {spread!r}: ")
@@ -3,6 +3,7 @@ from datetime import datetime
 import pytest
 from unittest.mock import Mock, patch
 
+from zettarepl.replication.snapshots_to_send import get_parsed_incremental_base
 from zettarepl.snapshot.name import parse_snapshot_name
 from zettarepl.utils.test import mock_name
 
@@ -137,6 +138,25 @@ def test__pending_replication_task_snapshot_owner(replication_task, src_snapshot
     assert snapshot_owner.should_retain(dataset, parsed_snapshot_name) == should_retain
 
 
+def test__pending_replication_task_snapshot_owner__dataset_state_calculated_once():
+    replication_task = Mock(source_datasets=["data/work"], target_dataset="repl/work", recursive=True, exclude=[])
+    src_snapshots = {"data/work": ["2018-09-26_11-47", "2018-09-26_11-48", "2018-09-26_11-49"]}
+    dst_snapshots = {"repl/work": ["2018-09-26_11-47", "2018-09-26_11-48"]}
+
+    with patch("zettarepl.replication.task.snapshot_owner.replication_task_naming_schemas",
+               Mock(return_value=["%Y-%m-%d_%H-%M"])):
+        snapshot_owner = PendingPushReplicationTaskSnapshotOwner(replication_task, src_snapshots, dst_snapshots)
+
+    with patch("zettarepl.replication.task.snapshot_owner.get_parsed_incremental_base",
+               Mock(side_effect=get_parsed_incremental_base)) as get_parsed_incremental_base_mock:
+        assert [
+            snapshot_owner.should_retain("data/work", parse_snapshot_name(snapshot_name, "%Y-%m-%d_%H-%M"))
+            for snapshot_name in src_snapshots["data/work"]
+        ] == [False, True, True]
+
+    get_parsed_incremental_base_mock.assert_called_once()
+
+
 @pytest.mark.parametrize("dataset,snapshot,should_retain", [
     ("repl/work", "2018-09-26_11-47", False),
     ("repl/work", "2018-09-26_11-48", True),
@@ -66,3 +66,22 @@ def test__calculate_snapshots_to_remove():
 ])
 def test__calculate_dataset_snapshots_to_remove(owners, dataset, snapshots, result):
     assert calculate_dataset_snapshots_to_remove(owners, dataset, snapshots) == result
+
+
+def test__calculate_dataset_snapshots_to_remove__naming_schemas_evaluated_once():
+    owner = Mock(
+        get_naming_schemas=Mock(return_value={"snap-%Y-%m-%d_%H-%M-%S"}),
+        owns_snapshot=Mock(return_value=True),
+        should_retain=Mock(return_value=False),
+    )
+    other_owner = Mock(get_naming_schemas=Mock(return_value={"auto-%Y-%m-%d_%H-%M"}))
+
+    assert calculate_dataset_snapshots_to_remove([owner, other_owner], "data", [
+        "snap-2018-08-21_22-58-00",
+        "snap-2018-08-21_22-59-00",
+        "snap-2018-08-21_23-00-00",
+    ]) == ["snap-2018-08-21_22-58-00", "snap-2018-08-21_22-59-00"]
+
+    owner.get_naming_schemas.assert_called_once()
+    other_owner.get_naming_schemas.assert_called_once()
+    other_owner.owns_snapshot.assert_not_called()
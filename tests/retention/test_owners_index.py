@@ -0,0 +1,44 @@
+# -*- coding=utf-8 -*-
+from datetime import datetime, timedelta
+from unittest.mock import Mock
+
+from zettarepl.retention.owners_index import SnapshotOwnersIndex
+from zettarepl.retention.snapshot_removal_date_snapshot_owner import SnapshotRemovalDateSnapshotOwner
+from zettarepl.snapshot.task.snapshot_owner import PeriodicSnapshotTaskSnapshotOwner
+
+
+def periodic_snapshot_task_owner(dataset, recursive, exclude):
+    return PeriodicSnapshotTaskSnapshotOwner(
+        datetime(2019, 5, 30, 21, 52),
+        Mock(dataset=dataset, recursive=recursive, exclude=exclude, lifetime=timedelta(days=14),
+             naming_schema="auto-%Y-%m-%d_%H-%M"),
+    )
+
+
+def test__snapshot_owners_index():
+    unindexed_owner = Mock(get_root_datasets=Mock(return_value=None),
+                           owns_dataset=Mock(side_effect=lambda dataset: dataset.endswith("/vm")))
+    owners = [
+        periodic_snapshot_task_owner("data", True, ["data/work/tmp"]),
+        periodic_snapshot_task_owner("data/work", False, []),
+        unindexed_owner,
+        periodic_snapshot_task_owner("data/workspace", True, []),
+        SnapshotRemovalDateSnapshotOwner(datetime(2019, 5, 30, 21, 52), {"data/home@snap-1": datetime(2019, 6, 1)}),
+        periodic_snapshot_task_owner("backup", True, []),
+    ]
+    index = SnapshotOwnersIndex(owners)
+
+    for dataset in ["data", "data/work", "data/work/tmp", "data/work/vm", "data/workspace", "data/home",
+                    "backup/data", "data2", "tank/vm"]:
+        assert index.dataset_owners(dataset) == [owner for owner in owners if owner.owns_dataset(dataset)]
+
+
+def test__snapshot_owners_index__does_not_check_unrelated_owners():
+    owners = [
+        Mock(get_root_datasets=Mock(return_value=["data/work"]), owns_dataset=Mock(return_value=True)),
+        Mock(get_root_datasets=Mock(return_value=["backup"]), owns_dataset=Mock(return_value=True)),
+    ]
+    index = SnapshotOwnersIndex(owners)
+
+    assert index.dataset_owners("data/work/vm") == [owners[0]]
+    owners[1].owns_dataset.assert_not_called()
@@ -0,0 +1,122 @@
+# -*- coding=utf-8 -*-
+from datetime import datetime, time, timedelta
+import pytest
+from unittest.mock import Mock, patch
+
+from zettarepl.replication.task.retention_policy import (CustomSnapshotRetentionPolicy,
+                                                         CustomSnapshotRetentionPolicyLifetime)
+from zettarepl.retention.calculate import calculate_dataset_snapshots_to_remove
+from zettarepl.retention.vectorized import (calculate_custom_lifetimes_delete_snapshots,
+                                            calculate_dataset_snapshots_to_remove_vectorized)
+from zettarepl.scheduler.cron import CronSchedule
+from zettarepl.snapshot.name import parse_snapshots_names_with_multiple_schemas
+from zettarepl.snapshot.task.snapshot_owner import PeriodicSnapshotTaskSnapshotOwner
+from zettarepl.snapshot.task.task import PeriodicSnapshotTask
+
+numpy = pytest.importorskip("numpy")
+
+
+def periodic_snapshot_task_owner(now, naming_schema, lifetime, schedule):
+    return PeriodicSnapshotTaskSnapshotOwner(
+        now,
+        PeriodicSnapshotTask("task", "data", False, [], lifetime, naming_schema, schedule, True),
+    )
+
+
+def snapshot_names(naming_schema, start, step, count):
+    return [(start + step * i).strftime(naming_schema) for i in range(count)]
+
+
+@pytest.mark.parametrize("owners,snapshots", [
+    (
+        [
+            periodic_snapshot_task_owner(datetime(2024, 3, 1, 12, 30), "auto-%Y-%m-%d_%H-%M", timedelta(days=7),
+                                         CronSchedule("0", "*/3", "*", "*", "*", time(0, 0), time(23, 59))),
+            periodic_snapshot_task_owner(datetime(2024, 3, 1, 12, 30), "auto-%Y-%m-%d_%H-%M", timedelta(days=30),
+                                         CronSchedule("0", "0", "l", "*", "0", time(0, 0), time(23, 59))),
+            periodic_snapshot_task_owner(datetime(2024, 3, 1, 12, 30), "snap-%Y%m%d%H%M%S", timedelta(hours=5),
+                                         CronSchedule("*/15", "*", "*", "*", "*", time(9, 0), time(17, 0))),
+            Mock(
+                get_naming_schemas=Mock(return_value={"snap-%Y%m%d%H%M%S"}),
+                owns_snapshot=Mock(side_effect=lambda dataset, parsed_snapshot_name:
+                                   parsed_snapshot_name.datetime.day == 29),
+                wants_to_delete=Mock(return_value=False),
+                should_retain=Mock(return_value=False),
+            ),
+        ],
+        (
+            snapshot_names("auto-%Y-%m-%d_%H-%M", datetime(2024, 1, 1), timedelta(minutes=90), 1000) +
+            snapshot_names("snap-%Y%m%d%H%M%S", datetime(2024, 2, 27, 8), timedelta(minutes=7, seconds=30), 500) +
+            ["manual"]
+        ),
+    ),
+    # All snapshots are expired, the newest one is kept
+    (
+        [
+            periodic_snapshot_task_owner(datetime(2024, 3, 1), "auto-%Y-%m-%d_%H-%M", timedelta(days=1),
+                                         CronSchedule("0", "*", "*", "*", "*", time(0, 0), time(23, 59))),
+        ],
+        snapshot_names("auto-%Y-%m-%d_%H-%M", datetime(2023, 1, 1), timedelta(hours=1), 100)[::-1],
+    ),
+    # `nth` weekday of month can't be compiled into bitsets
+    (
+        [
+            periodic_snapshot_task_owner(datetime(2024, 3, 1), "auto-%Y-%m-%d_%H-%M", timedelta(days=14),
+                                         CronSchedule("0", "0", "*", "*", "5#1", time(0, 0), time(23, 59))),
+        ],
+        snapshot_names("auto-%Y-%m-%d_%H-%M", datetime(2023, 12, 1), timedelta(hours=12), 200),
+    ),
+])
+def test__calculate_dataset_snapshots_to_remove__same_as_scalar(owners, snapshots):
+    with patch("zettarepl.retention.vectorized.vectorized_retention_options", Mock(enabled=False)):
+        expected = calculate_dataset_snapshots_to_remove(owners, "data", snapshots)
+
+    with patch("zettarepl.retention.vectorized.vectorized_retention_options", Mock(enabled=True)):
+        with patch("zettarepl.retention.calculate.calculate_dataset_snapshots_to_remove_vectorized",
+                   wraps=calculate_dataset_snapshots_to_remove_vectorized) as vectorized:
+            assert calculate_dataset_snapshots_to_remove(owners, "data", snapshots) == expected
+
+    vectorized.assert_called_once()
+    assert expected
+
+
+def test__calculate_dataset_snapshots_to_remove__numpy_not_installed():
+    owners = [
+        periodic_snapshot_task_owner(datetime(2024, 3, 1), "auto-%Y-%m-%d_%H-%M", timedelta(days=1),
+                                     CronSchedule("0", "*", "*", "*", "*", time(0, 0), time(23, 59))),
+    ]
+    snapshots = snapshot_names("auto-%Y-%m-%d_%H-%M", datetime(2024, 2, 27), timedelta(hours=1), 72)
+
+    with patch("zettarepl.retention.vectorized.vectorized_retention_options", Mock(enabled=True)):
+        with patch("zettarepl.retention.vectorized.numpy", None):
+            with patch("zettarepl.retention.calculate.calculate_dataset_snapshots_to_remove_vectorized") as vectorized:
+                assert calculate_dataset_snapshots_to_remove(owners, "data", snapshots) == snapshots[:49]
+
+    vectorized.assert_not_called()
+
+
+def test__custom_snapshot_retention_policy__same_as_scalar():
+    policy = CustomSnapshotRetentionPolicy(timedelta(days=2), [
+        CustomSnapshotRetentionPolicyLifetime(CronSchedule("0", "0", "1", "*", "*", time(0, 0), time(23, 59)),
+                                              timedelta(days=365)),
+        CustomSnapshotRetentionPolicyLifetime(CronSchedule("0", "0", "*", "*", "1-5", time(0, 0), time(23, 59)),
+                                              timedelta(days=30)),
+        CustomSnapshotRetentionPolicyLifetime(CronSchedule("0", "*/6", "*", "*", "*", time(6, 0), time(18, 0)),
+                                              timedelta(days=7)),
+    ])
+    parsed_dst_snapshots_names = parse_snapshots_names_with_multiple_schemas(
+        snapshot_names("auto-%Y-%m-%d_%H-%M", datetime(2023, 1, 1), timedelta(hours=3), 5000),
+        {"auto-%Y-%m-%d_%H-%M"},
+    )
+    now = datetime(2024, 9, 15, 10, 0)
+
+    with patch("zettarepl.retention.vectorized.vectorized_retention_options", Mock(enabled=False)):
+        expected = policy.calculate_delete_snapshots(now, [], parsed_dst_snapshots_names)
+
+    with patch("zettarepl.retention.vectorized.vectorized_retention_options", Mock(enabled=True)):
+        with patch("zettarepl.replication.task.retention_policy.calculate_custom_lifetimes_delete_snapshots",
+                   wraps=calculate_custom_lifetimes_delete_snapshots) as vectorized:
+            assert policy.calculate_delete_snapshots(now, [], parsed_dst_snapshots_names) == expected
+
+    vectorized.assert_called_once()
+    assert 0 < len(expected) < len(parsed_dst_snapshots_names)
@@ -1,6 +1,7 @@
 # -*- coding=utf-8 -*-
-from datetime import datetime, time
+from datetime import datetime, time, timedelta
 
+from croniter import croniter
 import pytest
 
 from zettarepl.scheduler.cron import CronSchedule
@@ -15,3 +16,88 @@ from zettarepl.scheduler.cron import CronSchedule
 ])
 def test__cron(schedule, datetime, result):
     assert schedule.should_run(datetime) == result
+
+
+@pytest.mark.parametrize("schedule,datetime,result", [
+    (CronSchedule(0, "*", "*", "*", "*", time(0, 0), time(23, 59)), datetime(2018, 8, 31, 16, 0, 5, 54412),
+     datetime(2018, 8, 31, 16, 0)),
+    (CronSchedule(0, "*", "*", "*", "*", time(0, 0), time(23, 59)), datetime(2018, 8, 31, 16, 1),
+     datetime(2018, 8, 31, 17, 0)),
+    (CronSchedule(0, "*", "*", "*", "*", time(9, 0), time(15, 00)), datetime(2018, 8, 31, 16, 0),
+     datetime(2018, 9, 1, 9, 0)),
+    (CronSchedule(0, "*", "*", "*", "*", time(15, 0), time(9, 00)), datetime(2018, 8, 31, 9, 1),
+     datetime(2018, 8, 31, 15, 0)),
+    (CronSchedule(0, 10, "*", "*", "*", time(9, 0), time(9, 30)), datetime(2018, 8, 31, 9, 1),
+     None),
+    (CronSchedule(0, 10, "*", "*", "1#2", time(9, 0), time(9, 30)), datetime(2018, 8, 31, 9, 1),
+     None),
+    (CronSchedule(0, 0, "29", "2", "*", time(0, 0), time(23, 59)), datetime(2018, 8, 31, 9, 1),
+     datetime(2020, 2, 29, 0, 0)),
+    (CronSchedule(0, 0, "30", "2", "*", time(0, 0), time(23, 59)), datetime(2018, 8, 31, 9, 1),
+     None),
+    (CronSchedule(0, 0, "*", "*", "1#2", time(0, 0), time(23, 59)), datetime(2018, 9, 10, 0, 1),
+     datetime(2018, 10, 8, 0, 0)),
+])
+def test__next_run(schedule, datetime, result):
+    assert schedule.next_run(datetime) == result
+
+
+@pytest.mark.parametrize("expr", [
+    ("0", "*", "*", "*", "*"),
+    ("*/15", "1-5", "*/2", "*", "1-5"),
+    ("0", "0", "*", "*", "7"),
+    ("0", "0", "1,L", "*", "*"),
+    ("30", "2", "13", "*", "fri"),
+    ("0", "0", "*", "jan-mar", "*"),
+])
+@pytest.mark.parametrize("begin,end", [
+    (time(0, 0), time(23, 59)),
+    (time(15, 0), time(9, 00)),
+])
+def test__compiled(expr, begin, end):
+    schedule = CronSchedule(*expr, begin, end)
+    assert schedule.compiled is not None
+
+    datetimes = [
+        datetime(2020, 1, 1, hour, minute) + timedelta(days=day)
+        for day in range(0, 200)
+        for hour, minute in [(0, 0), (2, 30), (3, 15), (16, 0)]
+    ]
+    result = [schedule._is_within_window(d.time()) and
+              croniter(schedule.expr_format, d - timedelta(seconds=1)).get_next(datetime) == d
+              for d in datetimes]
+
+    assert schedule.should_run_many(datetimes) == result
+    assert [schedule.should_run(d) for d in datetimes] == result
+
+
+def test__compiled__nth_weekday_of_month():
+    schedule = CronSchedule(0, 0, "*", "*", "1#2", time(0, 0), time(23, 59))
+
+    assert schedule.compiled is None
+    assert schedule.should_run_many([datetime(2018, 9, 10, 0, 0), datetime(2018, 9, 17, 0, 0)]) == [True, False]
+
+
+@pytest.mark.parametrize("expr", [
+    ("0", "*", "*", "*", "*"),
+    ("*/15", "1-5", "*/2", "*", "1-5"),
+    ("0", "0", "1,L", "*", "*"),
+    ("30", "2", "13", "*", "fri"),
+    ("0", "0", "*", "jan-mar", "*"),
+])
+@pytest.mark.parametrize("begin,end", [
+    (time(0, 0), time(23, 59)),
+    (time(15, 0), time(9, 00)),
+])
+def test__compiled__next_run(expr, begin, end):
+    schedule = CronSchedule(*expr, begin, end)
+    assert schedule.compiled is not None
+
+    for d in [datetime(2020, 1, 1, 0, 0) + timedelta(days=day, minutes=minute)
+              for day in range(0, 200, 7)
+              for minute in [0, 150, 195, 960, 1439]]:
+        iterator = croniter(schedule.expr_format, d - timedelta(seconds=1))
+        while not schedule._is_within_window((expected := iterator.get_next(datetime)).time()):
+            pass
+
+        assert schedule.next_run(d) == expected
@@ -0,0 +1,100 @@
+# -*- coding=utf-8 -*-
+from datetime import datetime, time
+
+from unittest.mock import Mock, patch
+import pytest
+from pytz import timezone
+
+from zettarepl.scheduler.cron import CronSchedule
+from zettarepl.scheduler.event_clock import EventClock
+from zettarepl.scheduler.heap_scheduler import HeapScheduler
+from zettarepl.scheduler.tz_clock import TzClock
+
+
+@pytest.fixture()
+def sleep(monkeypatch):
+    mock = Mock()
+    mock.wait.return_value = False
+    monkeypatch.setattr("threading.Event", Mock(return_value=mock))
+    return mock.wait
+
+
+def test__sleep_until_next_minute(sleep):
+    with patch("zettarepl.scheduler.event_clock.datetime") as datetime_:
+        clock = EventClock()
+
+        clock.now = datetime(2018, 8, 31, 13, 20, 25)
+
+        datetime_.utcnow.return_value = datetime(2018, 8, 31, 13, 20, 35)
+        assert clock._tick() is None
+
+        sleep.assert_called_once_with(25)
+
+
+def test__sleep_until_next_wakeup(sleep):
+    with patch("zettarepl.scheduler.event_clock.datetime") as datetime_:
+        clock = EventClock()
+        clock.next_wakeup = Mock(return_value=datetime(2018, 8, 31, 13, 30))
+
+        clock.now = datetime(2018, 8, 31, 13, 20, 25)
+
+        datetime_.utcnow.return_value = datetime(2018, 8, 31, 13, 20, 35)
+        assert clock._tick() is None
+
+        sleep.assert_called_once_with(565)
+
+
+def test__sleep_at_most_max_sleep(sleep):
+    with patch("zettarepl.scheduler.event_clock.datetime") as datetime_:
+        clock = EventClock(max_sleep=300)
+        clock.next_wakeup = Mock(return_value=None)
+
+        clock.now = datetime(2018, 8, 31, 13, 20, 25)
+
+        datetime_.utcnow.return_value = datetime(2018, 8, 31, 13, 20, 35)
+        assert clock._tick() is None
+
+        sleep.assert_called_once_with(300)
+
+
+def test__reschedule_does_not_tick(sleep):
+    sleep.return_value = True
+    with patch("zettarepl.scheduler.event_clock.datetime") as datetime_:
+        clock = EventClock()
+        clock.reschedule()
+
+        clock.now = datetime(2018, 8, 31, 13, 20, 25)
+
+        datetime_.utcnow.return_value = datetime(2018, 8, 31, 13, 20, 35)
+        assert clock._tick() is None
+        assert clock.now == datetime(2018, 8, 31, 13, 20, 35)
+
+
+def test__interrupt_ticks(sleep):
+    sleep.return_value = True
+    with patch("zettarepl.scheduler.event_clock.datetime") as datetime_:
+        clock = EventClock()
+        clock.interrupt()
+
+        clock.now = datetime(2018, 8, 31, 13, 20, 25)
+
+        datetime_.utcnow.return_value = datetime(2018, 8, 31, 13, 20, 35)
+        assert clock._tick() == datetime(2018, 8, 31, 13, 20, 35)
+        assert clock.now == datetime(2018, 8, 31, 13, 20, 25)
+
+
+@pytest.mark.parametrize("tz,utcnow,next_run_utc", [
+    # Regular
+    ("Europe/Berlin", datetime(2018, 8, 31, 13, 20), datetime(2018, 8, 31, 14, 0)),
+    # Spring forward: 02:00 CET becomes 03:00 CEST at 01:00 UTC
+    ("Europe/Berlin", datetime(2018, 3, 25, 0, 50), datetime(2018, 3, 25, 1, 0)),
+    # Fall back: 03:00 CEST becomes 02:00 CET at 01:00 UTC. We must wake up when 02:00 CET comes again.
+    ("Europe/Berlin", datetime(2018, 10, 28, 0, 50), datetime(2018, 10, 28, 1, 0)),
+])
+def test__heap_scheduler_next_run_utc(tz, utcnow, next_run_utc):
+    hourly = Mock(schedule=CronSchedule(0, "*", "*", "*", "*", time(0, 0), time(23, 59)))
+
+    scheduler = HeapScheduler(Mock(), TzClock(timezone(tz), utcnow))
+    scheduler.set_tasks([hourly])
+
+    assert scheduler.next_run_utc(utcnow) == next_run_utc
@@ -0,0 +1,81 @@
+# -*- coding=utf-8 -*-
+from datetime import datetime, time
+from unittest.mock import Mock
+
+from pytz import timezone
+
+from zettarepl.scheduler.cron import CronSchedule
+from zettarepl.scheduler.heap_scheduler import HeapScheduler
+from zettarepl.scheduler.scheduler import Scheduler
+from zettarepl.scheduler.tz_clock import TzClock
+
+
+def run_schedulers(tasks, utcnows, tz=timezone("UTC")):
+    results = []
+    for scheduler_cls in [Scheduler, HeapScheduler]:
+        clock = Mock(tick=Mock(side_effect=utcnows + [None]))
+        scheduler = scheduler_cls(clock, TzClock(tz, utcnows[0]))
+        scheduler.set_tasks(tasks)
+        results.append([(result.datetime.datetime, result.tasks) for result in scheduler.schedule()])
+
+    assert results[0] == results[1]
+    return results[1]
+
+
+def test__same_as_scheduler():
+    hourly = Mock(schedule=CronSchedule(0, "*", "*", "*", "*", time(0, 0), time(23, 59)))
+    every_minute = Mock(schedule=CronSchedule("*", "*", "*", "*", "*", time(0, 0), time(23, 59)))
+    daily = Mock(schedule=CronSchedule(30, 1, "*", "*", "*", time(0, 0), time(23, 59)))
+
+    result = run_schedulers([daily, hourly, every_minute], [
+        datetime(2018, 8, 31, 0, 59, 10),
+        datetime(2018, 8, 31, 1, 0, 1),
+        datetime(2018, 8, 31, 1, 1, 1),
+        # Clock jumped forward
+        datetime(2018, 8, 31, 1, 30, 1),
+        datetime(2018, 8, 31, 2, 0, 1),
+    ])
+
+    assert [tasks for _, tasks in result] == [
+        [every_minute],
+        [hourly, every_minute],
+        [every_minute],
+        [daily, every_minute],
+        [hourly, every_minute],
+    ]
+
+
+def test__dst_step_back():
+    hourly = Mock(schedule=CronSchedule(0, "*", "*", "*", "*", time(0, 0), time(23, 59)))
+
+    # Europe/Moscow: 2010-10-31 03:00 local is 02:00 local again
+    result = run_schedulers([hourly], [
+        datetime(2010, 10, 30, 21, 59, 1),
+        datetime(2010, 10, 30, 22, 0, 1),
+        datetime(2010, 10, 30, 22, 59, 1),
+        datetime(2010, 10, 30, 23, 0, 1),
+        datetime(2010, 10, 30, 23, 1, 1),
+    ], timezone("Europe/Moscow"))
+
+    assert [(d.hour, d.minute, tasks) for d, tasks in result] == [
+        (1, 59, []),
+        (2, 0, [hourly]),
+        (2, 59, []),
+        (2, 0, [hourly]),
+        (2, 1, []),
+    ]
+
+
+def test__set_tasks_incremental():
+    hourly = Mock(schedule=Mock(wraps=CronSchedule(0, "*", "*", "*", "*", time(0, 0), time(23, 59))))
+    daily = Mock(schedule=Mock(wraps=CronSchedule(0, 0, "*", "*", "*", time(0, 0), time(23, 59))))
+
+    scheduler = HeapScheduler(Mock(), TzClock(timezone("UTC"), datetime(2018, 8, 31, 0, 30)))
+    scheduler.set_tasks([hourly])
+    scheduler.set_tasks([hourly, daily])
+    scheduler.set_tasks([daily])
+
+    assert hourly.schedule.next_run.call_count == 1
+    assert daily.schedule.next_run.call_count == 1
+    assert scheduler._pop_due_tasks(datetime(2018, 8, 31, 1, 0)) == []
+    assert scheduler._pop_due_tasks(datetime(2018, 9, 1, 0, 0)) == [daily]
@@ -0,0 +1,29 @@
+# -*- coding=utf-8 -*-
+from datetime import timedelta
+
+import pytest
+
+from zettarepl.scheduler.spread import parse_spread, spread_offset
+
+
+def test__spread_offset():
+    offsets = {spread_offset(f"task_{i}", timedelta(seconds=30)) for i in range(0, 100)}
+
+    assert all(timedelta(0) <= offset < timedelta(seconds=30) for offset in offsets)
+    assert len(offsets) > 50
+    assert spread_offset("task_1", timedelta(seconds=30)) == spread_offset("task_1", timedelta(seconds=30))
+
+
+def test__spread_offset__no_spread():
+    assert spread_offset("task_1", timedelta(0)) == timedelta(0)
+
+
+@pytest.mark.parametrize("value,error", [
+    ("P1M", "spread can't be specified in months or years"),
+    ("-PT10S", "spread can't be negative"),
+])
+def test__parse_spread__invalid(value, error):
+    with pytest.raises(ValueError) as e:
+        parse_spread(value)
+
+    assert str(e.value) == error
@@ -1,7 +1,8 @@
 # -*- coding=utf-8 -*-
 from unittest.mock import Mock
 
-from zettarepl.snapshot.task.nonintersecting_sets import tasks_intersect
+from zettarepl.snapshot.task.nonintersecting_sets import (calculate_nonintersecting_sets, interleave_sets_by_pool,
+                                                          tasks_intersect)
 
 
 def test__tasks_intersect__same_dataset():
@@ -50,3 +51,29 @@ def test__tasks_intersect__shortest_is_recursive_2():
     t1 = Mock(dataset="data/work", recursive=True)
     t2 = Mock(dataset="data/work/python", recursive=False)
     assert tasks_intersect(t1, t2)
+
+
+def test__calculate_nonintersecting_sets__transitive():
+    t1 = Mock(dataset="pool/a", recursive=False)
+    t2 = Mock(dataset="pool/b", recursive=False)
+    t3 = Mock(dataset="pool", recursive=True)
+    t4 = Mock(dataset="backup", recursive=True)
+    assert calculate_nonintersecting_sets([t1, t2, t3, t4]) == [[t1, t2, t3], [t4]]
+
+
+def test__calculate_nonintersecting_sets__keeps_order():
+    t1 = Mock(dataset="pool/a", recursive=False)
+    t2 = Mock(dataset="backup", recursive=True)
+    t3 = Mock(dataset="pool/b", recursive=False)
+    t4 = Mock(dataset="pool", recursive=True)
+    t5 = Mock(dataset="pool/c", recursive=False)
+    assert calculate_nonintersecting_sets([t1, t2, t3, t4, t5]) == [[t1, t3, t4, t5], [t2]]
+
+
+def test__interleave_sets_by_pool():
+    t1 = Mock(dataset="data/work")
+    t2 = Mock(dataset="data/home")
+    t3 = Mock(dataset="data/windows")
+    t4 = Mock(dataset="backup/work")
+    t5 = Mock(dataset="backup")
+    assert interleave_sets_by_pool([[t1], [t2], [t3], [t4, t5]]) == [[t1], [t4, t5], [t2], [t3]]
@@ -1,12 +1,16 @@
 # -*- coding=utf-8 -*-
 import pytest
 import textwrap
-from unittest.mock import ANY, Mock, call
+from unittest.mock import ANY, Mock, call, patch
 
 from zettarepl.snapshot.create import *
+from zettarepl.snapshot.create import get_zcp_snapshot, split_intersecting_snapshots
 from zettarepl.snapshot.snapshot import Snapshot
+from zettarepl.zcp.render_zcp import ZcpSnapshot
 from zettarepl.transport.interface import ExecException
 
+PROGRAM = ["zfs", "program", "-t", "100000000", "-m", "104857600"]
+
 
 def test__create_snapshot__zfscli_no_properties():
     shell = Mock()
@@ -30,39 +34,13 @@ def test__create_snapshot__zcp_ok():
 
     create_snapshot(shell, Snapshot("data/src", "snap-1"), True, ["data/src/garbage", "data/src/temp"], {})
 
-    shell.exec.assert_has_calls([call(["zfs", "list", "-t", "filesystem,volume", "-H", "-o", "name", "-s", "name", "-r", "data/src"]), call(["zfs", "program", "data", ANY])])
+    shell.exec.assert_called_once_with([*PROGRAM, "data", ANY, "data/src", "snap-1", "recursive",
+                                        "2", "data/src/garbage", "data/src/temp", "0", "0"])
 
 
 def test__create_snapshot__zcp_errors():
     shell = Mock()
 
-    list_dataset_shell_call = textwrap.dedent("""\
-       boot-pool	2.80G	15.6G	96K	none
-        boot-pool/ROOT	2.79G	15.6G	96K	none
-        boot-pool/ROOT/22.02.3	2.79G	15.6G	2.77G	legacy
-        boot-pool/ROOT/Initial-Install	8K	15.6G	2.66G	/
-        boot-pool/grub	8.18M	15.6G	8.18M	legacy
-        data	13.8M	2.61G	104K	/mnt/data
-        data/.system	9.95M	2.61G	104K	legacy
-        data/.system/configs-cd93307f360c4818ad53abf4dac4059c	96K	2.61G	96K	legacy
-        data/.system/cores	96K	1024M	96K	legacy
-        data/.system/ctdb_shared_vol	96K	2.61G	96K	legacy
-        data/.system/glusterd	104K	2.61G	104K	legacy
-        data/.system/rrd-cd93307f360c4818ad53abf4dac4059c	8.68M	2.61G	8.68M	legacy
-        data/.system/samba4	148K	2.61G	148K	legacy
-        data/.system/services	96K	2.61G	96K	legacy
-        data/.system/syslog-cd93307f360c4818ad53abf4dac4059c	464K	2.61G	464K	legacy
-        data/.system/webui	96K	2.61G	96K	legacy
-        data/src	792K	2.61G	112K	/mnt/data/src
-        data/src/DISK1	296K	2.61G	104K	/mnt/data/src/DISK1
-        data/src/DISK1/Apps	96K	2.61G	96K	/mnt/data/src/DISK1/Apps
-        data/src/DISK1/ISO	96K	2.61G	96K	/mnt/data/src/DISK1/ISO
-        data/src/DISK2	288K	2.61G	96K	/mnt/data/src/DISK2
-        data/src/DISK2/Apps	96K	2.61G	96K	/mnt/data/src/DISK2/Apps
-        data/src/DISK2/ISO	96K	2.61G	96K	/mnt/data/src/DISK2/ISO
-        data/src/waggnas	96K	2.61G	96K	/mnt/data/src/waggnas
-    """)
-
     zcp_program_shell_call = ExecException(1, textwrap.dedent("""\
         Channel program execution failed:
         [string "channel program"]:44: snapshot=data/src/home@snap-1 error=17, snapshot=data/src/work@snap-1 error=17
@@ -71,7 +49,7 @@ def test__create_snapshot__zcp_errors():
             [string "channel program"]:44: in main chunk
     """))
 
-    shell.exec.side_effect = [list_dataset_shell_call, zcp_program_shell_call]
+    shell.exec.side_effect = [zcp_program_shell_call]
 
     with pytest.raises(CreateSnapshotError) as e:
         create_snapshot(shell, Snapshot("data/src", "snap-1"), True, ["data/src/garbage"], {})
@@ -83,3 +61,204 @@ def test__create_snapshot__zcp_errors():
             (Snapshot(dataset="data/src/work", name="snap-1"), "snapshot already exists"),
         ]
     )
+
+
+def test__create_snapshot__zcp_properties():
+    shell = Mock()
+    shell.exec.return_value = "Channel program fully executed with no return value."
+
+    with patch("zettarepl.snapshot.create.put_file") as put_file:
+        create_snapshot(shell, Snapshot("data/src", "snap-1"), True, ["data/src/garbage"],
+                        {"org.truenas:managedby": "1", "compression": "off"})
+
+    shell.exec.assert_called_once_with([*PROGRAM, "data", put_file.return_value, "data/src", "snap-1",
+                                        "recursive", "1", "data/src/garbage", "0", "1", "org.truenas:managedby", "1"])
+
+
+def test__create_snapshot__zcp_properties_not_supported():
+    shell = Mock()
+    shell.exec.side_effect = [
+        ExecException(1, "Channel program execution failed:\n"
+                         "[string \"channel program\"]:24: setting snapshot properties is not supported\n"),
+        "",
+    ]
+
+    with patch("zettarepl.snapshot.create.put_file") as put_file:
+        create_snapshot(shell, Snapshot("data/src", "snap-1"), True, ["data/src/garbage"],
+                        {"org.truenas:managedby": "1"})
+
+    assert shell.exec.call_args_list[1:] == [
+        call([*PROGRAM, "data", put_file.return_value, "data/src", "snap-1", "recursive",
+              "1", "data/src/garbage", "0", "0"]),
+    ]
+
+
+def test__create_snapshots__one_program_per_pool():
+    shell = Mock()
+    shell.exec.return_value = "Channel program fully executed with no return value."
+
+    with patch("zettarepl.snapshot.create.put_file") as put_file:
+        assert create_snapshots(shell, [
+            SnapshotToCreate(Snapshot("data/src", "snap-1"), True, [], {}),
+            SnapshotToCreate(Snapshot("backup/src", "snap-1"), False, [], {}),
+            SnapshotToCreate(Snapshot("data/work", "snap-1"), False, [], {"org.truenas:managedby": "1\"2"}),
+        ]) == [None, None, None]
+
+    assert shell.exec.call_args_list == [
+        call([*PROGRAM, "data", put_file.return_value,
+              "data/src", "snap-1", "recursive", "0", "0", "0",
+              "data/work", "snap-1", "non-recursive", "0", "0", "1", "org.truenas:managedby", "1\"2"]),
+        call([*PROGRAM, "backup", put_file.return_value,
+              "backup/src", "snap-1", "non-recursive", "0", "0", "0"]),
+    ]
+
+
+def test__create_snapshots__same_dataset_separate_programs():
+    shell = Mock()
+    shell.exec.return_value = "Channel program fully executed with no return value."
+
+    with patch("zettarepl.snapshot.create.put_file") as put_file:
+        assert create_snapshots(shell, [
+            SnapshotToCreate(Snapshot("data", "auto-1"), True, [], {}),
+            SnapshotToCreate(Snapshot("data/src", "hourly-1"), False, [], {}),
+            SnapshotToCreate(Snapshot("data/work", "daily-1"), False, [], {}),
+        ]) == [None, None, None]
+
+    assert shell.exec.call_args_list == [
+        call([*PROGRAM, "data", put_file.return_value,
+              "data", "auto-1", "recursive", "0", "0", "0"]),
+        call([*PROGRAM, "data", put_file.return_value,
+              "data/src", "hourly-1", "non-recursive", "0", "0", "0",
+              "data/work", "daily-1", "non-recursive", "0", "0", "0"]),
+    ]
+
+
+@pytest.mark.parametrize("snapshots,programs", [
+    (
+        [
+            SnapshotToCreate(Snapshot("data/src", "auto-1"), False, [], {}),
+            SnapshotToCreate(Snapshot("data/work", "auto-1"), True, [], {}),
+            SnapshotToCreate(Snapshot("data/src", "hourly-1"), False, [], {}),
+            SnapshotToCreate(Snapshot("data/work/vm", "hourly-1"), False, [], {}),
+            SnapshotToCreate(Snapshot("data/src", "daily-1"), False, [], {}),
+            SnapshotToCreate(Snapshot("data/home", "daily-1"), False, [], {}),
+        ],
+        [[0, 1, 5], [2, 3], [4]],
+    ),
+    (
+        [
+            SnapshotToCreate(Snapshot("data/src", "auto-1"), False, [], {}),
+            SnapshotToCreate(Snapshot("data", "hourly-1"), True, [], {}),
+            SnapshotToCreate(Snapshot("data/work", "hourly-1"), False, [], {}),
+        ],
+        [[0], [1], [2]],
+    ),
+])
+def test__split_intersecting_snapshots(snapshots, programs):
+    assert split_intersecting_snapshots(snapshots) == programs
+
+
+@pytest.mark.parametrize("exclude_rules,zcp_snapshot,datasets", [
+    (
+        ["data/src/garbage", "data/src/*/tmp", "backup"],
+        ZcpSnapshot("data/src", "snap-1", True, ["data/src/garbage", "backup"], ["^data%/src%/.*%/tmp$"], {}),
+        None,
+    ),
+    (
+        ["data"],
+        ZcpSnapshot("data/src", "snap-1", False, [], [], {}),
+        None,
+    ),
+    (
+        ["data/src/[!a-c]", "data/src/[.]", "data/src/work/"],
+        ZcpSnapshot("data/src", "snap-1", True, ["data/src/.", "data/src/work"], ["^data%/src%/[^a-c]$"], {}),
+        ["data/src", "data/src/.", "data/src/a", "data/src/work"],
+    ),
+])
+def test__get_zcp_snapshot(exclude_rules, zcp_snapshot, datasets):
+    with patch("zettarepl.snapshot.create.list_datasets", Mock(return_value=datasets)) as list_datasets:
+        assert get_zcp_snapshot(Mock(), SnapshotToCreate(Snapshot("data/src", "snap-1"), True, exclude_rules,
+                                                         {})) == zcp_snapshot
+
+    assert list_datasets.called == (datasets is not None)
+
+
+def test__create_snapshots__errors():
+    shell = Mock()
+    shell.exec.side_effect = ExecException(1, textwrap.dedent("""\
+        Channel program execution failed:
+        [string "channel program"]:71: task=2 snapshot=data/a@snap-1 error=17, task=3 snapshot=data/b@snap-1 error=2
+        stack traceback:
+            [C]: in function 'error'
+            [string "channel program"]:71: in main chunk
+    """))
+
+    with patch("zettarepl.snapshot.create.put_file"):
+        result = create_snapshots(shell, [
+            SnapshotToCreate(Snapshot("data/src", "snap-1"), True, [], {}),
+            SnapshotToCreate(Snapshot("data/a", "snap-1"), False, [], {}),
+            SnapshotToCreate(Snapshot("data/b", "snap-1"), False, [], {}),
+        ])
+
+    assert result[0] is None
+    assert result[1].args == ("no snapshots were created",
+                              [(Snapshot("data/a", "snap-1"), "snapshot already exists")])
+    assert result[2].args == ("no snapshots were created",
+                              [(Snapshot("data/b", "snap-1"), "No such file or directory")])
+
+
+def test__create_snapshots__properties_not_supported():
+    shell = Mock()
+    shell.exec.side_effect = [
+        ExecException(1, "Channel program execution failed:\n"
+                         "[string \"channel program\"]:24: setting snapshot properties is not supported\n"),
+        "",
+        "",
+    ]
+
+    with patch("zettarepl.snapshot.create.put_file"):
+        assert create_snapshots(shell, [
+            SnapshotToCreate(Snapshot("data/src", "snap-1"), True, [], {"org.truenas:managedby": "1"}),
+            SnapshotToCreate(Snapshot("data/work", "snap-1"), False, [], {}),
+        ]) == [None, None]
+
+    assert shell.exec.call_args_list[1:] == [
+        call(["zfs", "snapshot", "-r", "-o", "org.truenas:managedby=1", "data/src@snap-1"]),
+        call(["zfs", "snapshot", "data/work@snap-1"]),
+    ]
+
+
+def test__create_snapshots__unknown_error_lists_snapshots():
+    shell = Mock()
+    shell.exec.side_effect = [
+        ExecException(1, "Channel program execution failed:\nMemory limit exhausted\n"),
+        ExecException(1, "data/a@snap-1\ncannot open 'data/b@snap-1': dataset does not exist\n"),
+    ]
+
+    with patch("zettarepl.snapshot.create.put_file"):
+        result = create_snapshots(shell, [
+            SnapshotToCreate(Snapshot("data/a", "snap-1"), True, [], {}),
+            SnapshotToCreate(Snapshot("data/b", "snap-1"), True, [], {}),
+        ])
+
+    assert shell.exec.call_args_list[1] == call(["zfs", "list", "-t", "snapshot", "-H", "-o", "name",
+                                                 "data/a@snap-1", "data/b@snap-1"])
+    assert result[0] is None
+    assert result[1].args == ("Channel program execution failed:\nMemory limit exhausted", [])
+
+
+def test__create_snapshots__arguments_chunks():
+    shell = Mock()
+    shell.exec.return_value = "Channel program fully executed with no return value."
+
+    with patch("zettarepl.snapshot.create.ARG_MAX", 50):
+        with patch("zettarepl.snapshot.create.put_file") as put_file:
+            assert create_snapshots(shell, [
+                SnapshotToCreate(Snapshot("data/a", "snap-1"), False, [], {}),
+                SnapshotToCreate(Snapshot("data/b", "snap-1"), False, [], {}),
+            ]) == [None, None]
+
+    assert shell.exec.call_args_list == [
+        call([*PROGRAM, "data", put_file.return_value, "data/a", "snap-1", "non-recursive", "0", "0", "0"]),
+        call([*PROGRAM, "data", put_file.return_value, "data/b", "snap-1", "non-recursive", "0", "0", "0"]),
+    ]
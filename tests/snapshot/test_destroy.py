@@ -1,8 +1,11 @@
 # -*- coding=utf-8 -*-
 from unittest.mock import ANY, call, Mock, patch
 
-from zettarepl.snapshot.destroy import destroy_snapshots
+from zettarepl.snapshot.destroy import (
+    ADAPTIVE_MIN_BATCH_SIZE, BatchSize, MAX_BATCH_SIZE, destroy_snapshots, get_snapshot_runs,
+)
 from zettarepl.snapshot.snapshot import Snapshot
+from zettarepl.transport.interface import ExecException
 
 
 def test__destroy_snapshots__works():
@@ -30,3 +33,129 @@ def test__destroy_snapshots__arg_max():
         call(["zfs", "destroy", "data@snap-1,snap-2"], timeout=ANY),
         call(["zfs", "destroy", "data@snap-3"], timeout=ANY)
     ], True)
+
+
+def test__destroy_snapshots__ranges():
+    shell = Mock()
+    shell.exec.side_effect = [
+        "".join(f"data@snap-{i:02d}\n" for i in range(1, 21)),
+        "",
+        "",
+    ]
+
+    with patch("zettarepl.snapshot.destroy.destroy_snapshots_options",
+               Mock(max_parallel_pools=1, adaptive=False, ranges=True, channel_program=False)):
+        with patch("zettarepl.snapshot.destroy.MAX_BATCH_SIZE", 12):
+            destroy_snapshots(shell, [Snapshot("data", f"snap-{i:02d}") for i in range(1, 21) if i not in (5, 16)] +
+                                     [Snapshot("data", "snap-00")])
+
+    assert shell.exec.call_args_list == [
+        call(["zfs", "list", "-t", "snapshot", "-H", "-o", "name", "-s", "createtxg", "-d", "1", "data"]),
+        call(["zfs", "destroy", "data@snap-01%snap-04,snap-06%snap-13"], timeout=ANY),
+        call(["zfs", "destroy", "data@snap-14,snap-15,snap-17%snap-20,snap-00"], timeout=ANY),
+    ]
+
+
+def test__get_snapshot_runs():
+    assert get_snapshot_runs({"c", "a", "b", "e"}, ["a", "b", "d", "e"]) == [["a", "b"], ["e"], ["c"]]
+    assert get_snapshot_runs({"c", "a", "b"}, None) == [["a"], ["b"], ["c"]]
+
+
+def test__destroy_snapshots__held_or_cloned_prefilter():
+    shell = Mock()
+    shell.exec.side_effect = [
+        "data@snap-1\tuserrefs\t0\ndata@snap-1\tclones\t\n"
+        "data@snap-2\tuserrefs\t1\ndata@snap-2\tclones\t\n"
+        "data/work@snap-1\tuserrefs\t0\ndata/work@snap-1\tclones\tdata/clone\n",
+        "",
+    ]
+
+    with patch("zettarepl.snapshot.destroy.destroy_snapshots_options",
+               Mock(max_parallel_pools=1, adaptive=True, ranges=False, channel_program=False)):
+        destroy_snapshots(shell, [Snapshot("data", "snap-1"), Snapshot("data/work", "snap-1"),
+                                  Snapshot("data", "snap-2")])
+
+    assert shell.exec.call_args_list == [
+        call(["zfs", "get", "-H", "-p", "-o", "name,property,value", "userrefs,clones", "data@snap-1",
+              "data@snap-2", "data/work@snap-1"]),
+        call(["zfs", "destroy", "data@snap-1"], timeout=ANY),
+    ]
+
+
+def test__destroy_snapshots__parallel_pools():
+    shell = Mock()
+
+    with patch("zettarepl.snapshot.destroy.destroy_snapshots_options",
+               Mock(max_parallel_pools=2, adaptive=False, ranges=False, channel_program=False)):
+        destroy_snapshots(shell, [Snapshot("data", "snap-1"), Snapshot("backup/work", "snap-1"),
+                                  Snapshot("data/work", "snap-1")])
+
+    assert sorted(c[0][0][2] for c in shell.exec.call_args_list) == ["backup/work@snap-1", "data/work@snap-1",
+                                                                     "data@snap-1"]
+
+
+def test__batch_size__adaptive():
+    batch_size = BatchSize(True)
+
+    # 100 snapshots in 10 seconds, growth is limited
+    batch_size.update(100, 10)
+    assert batch_size.size == 200
+
+    # 200 snapshots in 240 seconds
+    batch_size.update(200, 240)
+    assert batch_size.size == 50
+
+    batch_size.update(50, 3000)
+    assert batch_size.size == ADAPTIVE_MIN_BATCH_SIZE
+
+
+def test__batch_size__not_adaptive():
+    batch_size = BatchSize(False)
+
+    batch_size.update(100, 3000)
+    assert batch_size.size == MAX_BATCH_SIZE
+
+
+def test__destroy_snapshots__defer():
+    shell = Mock()
+
+    destroy_snapshots(shell, [Snapshot("data", "snap-1")], defer=True)
+
+    shell.exec.assert_called_once_with(["zfs", "destroy", "-d", "data@snap-1"], timeout=ANY)
+
+
+def test__destroy_snapshots__channel_program():
+    shell = Mock()
+    shell.exec.side_effect = [
+        ExecException(1, "Channel program execution failed:\n"
+                         "[string \"channel program\"]:22: snapshot=data@snap-2 error=16, "
+                         "snapshot=data/work@snap-1 error=17\n"),
+        "",
+    ]
+
+    with patch("zettarepl.snapshot.destroy.destroy_snapshots_options",
+               Mock(max_parallel_pools=1, adaptive=False, ranges=False, channel_program=True)):
+        with patch("zettarepl.snapshot.destroy.put_file", Mock(return_value="program.lua")):
+            destroy_snapshots(shell, [Snapshot("data", "snap-1"), Snapshot("data/work", "snap-1"),
+                                      Snapshot("data", "snap-2")], defer=True)
+
+    assert shell.exec.call_args_list == [
+        call(["zfs", "program", "data", "program.lua", "defer", "data/work@snap-1", "data@snap-1", "data@snap-2"],
+             timeout=ANY),
+        call(["zfs", "program", "data", "program.lua", "defer", "data@snap-1"], timeout=ANY),
+    ]
+
+
+def test__destroy_snapshots__channel_program_fallback():
+    shell = Mock()
+    shell.exec.side_effect = [
+        ExecException(1, "cannot execute channel program: Operation not supported\n"),
+        "",
+    ]
+
+    with patch("zettarepl.snapshot.destroy.destroy_snapshots_options",
+               Mock(max_parallel_pools=1, adaptive=False, ranges=False, channel_program=True)):
+        with patch("zettarepl.snapshot.destroy.put_file", Mock(return_value="program.lua")):
+            destroy_snapshots(shell, [Snapshot("data", "snap-1")])
+
+    assert shell.exec.call_args_list[1:] == [call(["zfs", "destroy", "data@snap-1"], timeout=ANY)]
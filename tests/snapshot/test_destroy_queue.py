@@ -0,0 +1,70 @@
+# -*- coding=utf-8 -*-
+import threading
+import time
+from unittest.mock import Mock, call, patch
+
+from zettarepl.snapshot.destroy_queue import DestroyQueue, DestroyQueues
+from zettarepl.snapshot.snapshot import Snapshot
+
+
+def wait_empty(queue):
+    deadline = time.monotonic() + 5
+    while len(queue) and time.monotonic() < deadline:
+        threading.Event().wait(0.01)
+
+
+def test__destroy_queue__batches_and_rate():
+    transport = Mock()
+    snapshots = [Snapshot("data", f"snap-{i}") for i in range(5)]
+
+    queue = DestroyQueue(transport, rate=2, defer=True)
+    with patch("zettarepl.snapshot.destroy_queue.destroy_snapshots") as destroy_snapshots:
+        with patch("zettarepl.snapshot.destroy_queue.time.sleep") as sleep:
+            queue.enqueue(snapshots)
+            wait_empty(queue)
+
+    assert destroy_snapshots.call_args_list == [
+        call(transport.shell.return_value, snapshots[0:2], defer=True),
+        call(transport.shell.return_value, snapshots[2:4], defer=True),
+        call(transport.shell.return_value, snapshots[4:5], defer=True),
+    ]
+    assert [round(c[0][0], 1) for c in sleep.call_args_list] == [1.0, 1.0, 0.5]
+
+
+def test__destroy_queue__does_not_enqueue_twice():
+    transport = Mock()
+    started = threading.Event()
+    release = threading.Event()
+
+    def destroy_snapshots(shell, snapshots, defer):
+        started.set()
+        release.wait(5)
+
+    queue = DestroyQueue(transport)
+    with patch("zettarepl.snapshot.destroy_queue.destroy_snapshots", Mock(side_effect=destroy_snapshots)) as destroy:
+        queue.enqueue([Snapshot("data", "snap-1")])
+        started.wait(5)
+        queue.enqueue([Snapshot("data", "snap-2"), Snapshot("data", "snap-3")])
+        queue.enqueue([Snapshot("data", "snap-3")])
+        release.set()
+        wait_empty(queue)
+
+    assert destroy.call_args_list == [
+        call(transport.shell.return_value, [Snapshot("data", "snap-1")], defer=False),
+        call(transport.shell.return_value, [Snapshot("data", "snap-2"), Snapshot("data", "snap-3")], defer=False),
+    ]
+
+
+def test__destroy_queues__per_transport():
+    queues = DestroyQueues()
+    shell_1 = Mock()
+    shell_2 = Mock()
+
+    with patch("zettarepl.snapshot.destroy_queue.DestroyQueue") as DestroyQueue:
+        queues.enqueue(shell_1, [Snapshot("data", "snap-1")])
+        queues.enqueue(shell_1, [Snapshot("data", "snap-2")])
+        queues.enqueue(shell_2, [Snapshot("data", "snap-1")])
+        queues.enqueue(shell_2, [])
+
+    assert DestroyQueue.call_count == 2
+    assert DestroyQueue.return_value.enqueue.call_count == 3
@@ -2,7 +2,8 @@
 import pytest
 from unittest.mock import Mock, patch
 
-from zettarepl.snapshot.empty import get_empty_snapshots_for_deletion, get_task_snapshots
+from zettarepl.snapshot.empty import (get_datasets_written, get_empty_snapshots_for_deletion, get_empty_snapshots_tasks,
+                                      get_task_snapshots)
 from zettarepl.snapshot.snapshot import Snapshot
 
 
@@ -54,3 +55,84 @@ def test__get_empty_snapshots_for_deletion__1(datasets, tasks_with_snapshot_name
 ])
 def test__get_task_snapshots(all_datasets, task, task_datasets):
     assert [snapshot.dataset for snapshot in get_task_snapshots(all_datasets, task, "")] == task_datasets
+
+
+def test__get_empty_snapshots_for_deletion__batch():
+    shell = Mock()
+    shell.exec.return_value = "data/src@snap-1\t0\ndata/src/work@snap-1\t0\ndata/dst@snap-1\t4096\n"
+
+    with patch("zettarepl.snapshot.empty.list_datasets",
+               Mock(return_value=["data/src", "data/src/work", "data/dst"])) as list_datasets:
+        assert get_empty_snapshots_for_deletion(shell, [
+            (Mock(dataset="data/src", recursive=True, exclude=[], allow_empty=False), "snap-1"),
+            (Mock(dataset="data/dst", recursive=False, exclude=[], allow_empty=False), "snap-1"),
+        ], True) == [Snapshot("data/src", "snap-1"), Snapshot("data/src/work", "snap-1")]
+
+    # Cached topology might not have the datasets that were created since it was listed
+    list_datasets.assert_called_once_with(shell)
+
+    shell.exec.assert_called_once_with(["zfs", "get", "-H", "-p", "-o", "name,value", "written",
+                                        "data/dst@snap-1", "data/src@snap-1", "data/src/work@snap-1"])
+
+
+@pytest.mark.parametrize("tasks_with_snapshot_names,written,result", [
+    # Nothing written
+    (
+        [(Mock(dataset="data/src", recursive=True, exclude=[], allow_empty=False), "snap-1")],
+        {"data/src": 0, "data/src/work": 0},
+        [0],
+    ),
+    # Child has changed, parent snapshot will be destroyed after creation
+    (
+        [(Mock(dataset="data/src", recursive=True, exclude=[], allow_empty=False), "snap-1")],
+        {"data/src": 0, "data/src/work": 4096},
+        [],
+    ),
+    # Excluded child does not matter
+    (
+        [(Mock(dataset="data/src", recursive=True, exclude=["data/src/work"], allow_empty=False), "snap-1")],
+        {"data/src": 0, "data/src/work": 4096},
+        [0],
+    ),
+    # Other task allows empty snapshots
+    (
+        [
+            (Mock(dataset="data/src", recursive=True, exclude=[], allow_empty=False), "snap-1"),
+            (Mock(dataset="data/src/work", recursive=False, exclude=[], allow_empty=True), "snap-1"),
+        ],
+        {"data/src": 0, "data/src/work": 0},
+        [],
+    ),
+    # No previous snapshot
+    (
+        [(Mock(dataset="data/src/work", recursive=False, exclude=[], allow_empty=False), "snap-1")],
+        {"data/src": 0, "data/src/work": None},
+        [],
+    ),
+])
+def test__get_empty_snapshots_tasks(tasks_with_snapshot_names, written, result):
+    with patch("zettarepl.snapshot.empty.list_datasets", Mock(return_value=["data/src", "data/src/work"])):
+        with patch("zettarepl.snapshot.empty.get_datasets_written", Mock(return_value=written)):
+            assert get_empty_snapshots_tasks(Mock(), tasks_with_snapshot_names) == [
+                tasks_with_snapshot_names[i] for i in result
+            ]
+
+
+def test__get_datasets_written():
+    shell = Mock()
+    shell.exec.return_value = "data/src\t0\ndata/src/work\t4096\n"
+
+    assert get_datasets_written(shell, ["data/src"]) == {"data/src": 0, "data/src/work": 4096}
+
+    shell.exec.assert_called_once_with(["zfs", "get", "-H", "-p", "-o", "name,value", "-t", "filesystem,volume", "-r",
+                                        "written", "data/src"])
+
+
+def test__get_datasets_written__chunks():
+    shell = Mock()
+    shell.exec.side_effect = ["data/a\t0\n", "data/b\t4096\n"]
+
+    with patch("zettarepl.snapshot.empty.ARG_MAX", 10):
+        assert get_datasets_written(shell, ["data/a", "data/b"]) == {"data/a": 0, "data/b": 4096}
+
+    assert [c[0][0][-1] for c in shell.exec.call_args_list] == ["data/a", "data/b"]
@@ -0,0 +1,87 @@
+# -*- coding=utf-8 -*-
+from unittest.mock import Mock, patch
+
+from zettarepl.snapshot.destroy import destroy_snapshots
+from zettarepl.snapshot.inventory import SnapshotInventories, SnapshotInventory
+from zettarepl.snapshot.list import list_snapshots_cached, multilist_snapshots
+from zettarepl.snapshot.snapshot import Snapshot
+
+
+def test__snapshot_inventory__parent_recursive_listing():
+    inventory = SnapshotInventory(60)
+    inventory.put("data", True, [
+        Snapshot("data", "snap-1"),
+        Snapshot("data/work", "snap-1"),
+        Snapshot("data/work/child", "snap-1"),
+        Snapshot("data/workspace", "snap-1"),
+    ], 10 ** 10, 0)
+
+    assert inventory.get("data/work", False) == [Snapshot("data/work", "snap-1")]
+    assert inventory.get("data/work", True) == [Snapshot("data/work", "snap-1"), Snapshot("data/work/child", "snap-1")]
+    assert inventory.get("backup", True) is None
+
+
+def test__snapshot_inventory__ttl():
+    inventory = SnapshotInventory(60)
+    with patch("zettarepl.snapshot.inventory.time.monotonic", Mock(return_value=1000)):
+        inventory.put("data", True, [Snapshot("data", "snap-1")], 900, 0)
+        assert inventory.get("data", True) is None
+
+
+def test__snapshot_inventory__invalidate():
+    inventory = SnapshotInventory(60)
+    for dataset, recursive in [("data", False), ("data/work", True), ("data/home", True), ("data/work/child", False)]:
+        inventory.put(dataset, recursive, [], 10 ** 10, 0)
+
+    inventory.invalidate("data/work/child", False)
+
+    assert set(inventory.entries.keys()) == {("data", False), ("data/home", True)}
+
+
+def test__snapshot_inventory__concurrent_invalidation():
+    inventory = SnapshotInventory(60)
+    generation = inventory.generation
+    inventory.invalidate("data", True)
+    inventory.put("data", True, [], 10 ** 10, generation)
+
+    assert inventory.get("data", True) is None
+
+
+def test__list_snapshots_cached():
+    shell = Mock()
+    shell.exec.return_value = "data@snap-1\ndata/work@snap-1\n"
+
+    with patch("zettarepl.snapshot.list.snapshot_inventories", SnapshotInventories(60)):
+        assert list_snapshots_cached(shell, "data", True) == [
+            Snapshot("data", "snap-1"),
+            Snapshot("data/work", "snap-1"),
+        ]
+        assert list_snapshots_cached(shell, "data/work", True) == [Snapshot("data/work", "snap-1")]
+
+    assert shell.exec.call_count == 1
+
+
+def test__multilist_snapshots__batch__cached():
+    shell = Mock()
+    shell.exec.side_effect = ["data/a@snap-1\ndata/a/child@snap-1\ndata/b@snap-1\n"]
+
+    with patch("zettarepl.snapshot.list.snapshot_inventories", SnapshotInventories(60)):
+        multilist_snapshots(shell, [("data/a", True), ("data/b", True)], batch=True)
+
+        assert multilist_snapshots(shell, [("data/a/child", True), ("data/b", False)], batch=True) == [
+            Snapshot("data/a/child", "snap-1"),
+            Snapshot("data/b", "snap-1"),
+        ]
+
+    assert shell.exec.call_count == 1
+
+
+def test__destroy_snapshots__invalidates():
+    inventories = SnapshotInventories(60)
+    shell = Mock()
+    inventories.inventory(shell).put("data", True, [Snapshot("data/work", "snap-1")], 10 ** 10, 0)
+
+    with patch("zettarepl.snapshot.destroy.snapshot_inventories", inventories):
+        destroy_snapshots(shell, [Snapshot("data/work", "snap-1")])
+
+    assert inventories.inventory(shell).get("data", True) is None
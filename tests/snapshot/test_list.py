@@ -1,7 +1,13 @@
 # -*- coding=utf-8 -*-
+import threading
+from unittest.mock import call, Mock, patch
+
 import pytest
 
-from zettarepl.snapshot.list import simplify_snapshot_list_queries
+from zettarepl.snapshot.list import iter_list_snapshots, multilist_snapshots, simplify_snapshot_list_queries
+from zettarepl.snapshot.snapshot import Snapshot
+from zettarepl.transport.interface import ExecException
+from zettarepl.transport.zfscli.exception import DatasetDoesNotExistException
 
 
 @pytest.mark.parametrize("queries,simple", [
@@ -32,3 +38,137 @@ from zettarepl.snapshot.list import simplify_snapshot_list_queries
 ])
 def test__simplify_snapshot_list_queries(queries, simple):
     assert simplify_snapshot_list_queries(queries) == simple
+
+
+def test__multilist_snapshots__batch():
+    shell = Mock()
+    shell.exec.side_effect = [
+        "data/a@snap-1\ndata/a/child@snap-1\ndata/b@snap-1\n",
+        "data/c@snap-1\n",
+    ]
+
+    assert multilist_snapshots(shell, [("data/a", True), ("data/b", True), ("data/c", False)], batch=True) == [
+        Snapshot("data/a", "snap-1"),
+        Snapshot("data/a/child", "snap-1"),
+        Snapshot("data/b", "snap-1"),
+        Snapshot("data/c", "snap-1"),
+    ]
+    shell.exec.assert_has_calls([
+        call(["zfs", "list", "-t", "snapshot", "-H", "-o", "name", "-s", "name", "-r", "data/a", "data/b"]),
+        call(["zfs", "list", "-t", "snapshot", "-H", "-o", "name", "-s", "name", "-d", "1", "data/c"]),
+    ])
+
+
+@pytest.mark.parametrize("ignore_nonexistent", [True, False])
+def test__multilist_snapshots__batch__nonexistent(ignore_nonexistent):
+    shell = Mock()
+    shell.exec.side_effect = ExecException(1, "data/a@snap-1\ncannot open 'data/b': dataset does not exist\n")
+
+    if ignore_nonexistent:
+        assert multilist_snapshots(shell, [("data/a", True), ("data/b", True)], ignore_nonexistent=True,
+                                   batch=True) == [Snapshot("data/a", "snap-1")]
+    else:
+        with pytest.raises(DatasetDoesNotExistException):
+            multilist_snapshots(shell, [("data/a", True), ("data/b", True)], batch=True)
+
+    assert shell.exec.call_count == 1
+
+
+def test__multilist_snapshots__batch__unknown_error_falls_back():
+    shell = Mock()
+    shell.exec.side_effect = [
+        ExecException(1, "data/a@snap-1\nsomething went wrong\n"),
+        "data/a@snap-1\n",
+        "data/b@snap-1\n",
+    ]
+
+    assert multilist_snapshots(shell, [("data/a", True), ("data/b", True)], batch=True) == [
+        Snapshot("data/a", "snap-1"),
+        Snapshot("data/b", "snap-1"),
+    ]
+    assert shell.exec.call_count == 3
+
+
+def _streaming_shell(lines, returncode):
+    shell = Mock()
+
+    def exec_async(args, stdout, stdout_lines_per_chunk):
+        for i in range(0, len(lines), stdout_lines_per_chunk):
+            stdout.put("".join(lines[i:i + stdout_lines_per_chunk]))
+        stdout.put(None)
+
+        async_exec = shell.async_exec
+        if returncode:
+            async_exec.wait.side_effect = ExecException(returncode, None)
+        return async_exec
+
+    shell.exec_async.side_effect = exec_async
+    return shell
+
+
+def test__iter_list_snapshots():
+    shell = _streaming_shell(["data@snap-1\n", "data/work@snap-1\n"], 0)
+
+    assert list(iter_list_snapshots(shell, "data", True)) == [
+        Snapshot("data", "snap-1"),
+        Snapshot("data/work", "snap-1"),
+    ]
+    assert shell.exec_async.call_args[0][0] == ["zfs", "list", "-t", "snapshot", "-H", "-o", "name", "-s", "name",
+                                                "-r", "data"]
+
+
+def test__iter_list_snapshots__error():
+    shell = _streaming_shell(["cannot open 'data': dataset does not exist\n"], 1)
+
+    with pytest.raises(ExecException) as e:
+        list(iter_list_snapshots(shell, "data", True))
+
+    assert e.value.stdout == "cannot open 'data': dataset does not exist\n"
+
+
+def test__iter_list_snapshots__chunks():
+    shell = _streaming_shell([f"data@snap-{i}\n" for i in range(5)], 0)
+
+    with patch("zettarepl.snapshot.list.ITER_LIST_SNAPSHOTS_CHUNK", 2):
+        assert list(iter_list_snapshots(shell, "data", True)) == [Snapshot("data", f"snap-{i}") for i in range(5)]
+
+    shell.async_exec.stop.assert_not_called()
+
+
+def test__iter_list_snapshots__stops_when_consumer_stops():
+    shell = _streaming_shell(["data@snap-1\n", "data@snap-2\n"], 0)
+
+    snapshots = iter_list_snapshots(shell, "data", True)
+    assert next(snapshots) == Snapshot("data", "snap-1")
+    snapshots.close()
+
+    shell.async_exec.stop.assert_called_once_with()
+    shell.async_exec.wait.assert_not_called()
+
+
+def test__iter_list_snapshots__stops_blocked_reader():
+    shell = Mock()
+    reader = None
+
+    def exec_async(args, stdout, stdout_lines_per_chunk):
+        nonlocal reader
+
+        def target():
+            for i in range(10):
+                stdout.put(f"data@snap-{i}\n")
+            stdout.put(None)
+
+        reader = threading.Thread(target=target, daemon=True)
+        reader.start()
+        return shell.async_exec
+
+    shell.exec_async.side_effect = exec_async
+
+    with patch("zettarepl.snapshot.list.ITER_LIST_SNAPSHOTS_QUEUE_SIZE", 2):
+        snapshots = iter_list_snapshots(shell, "data", True)
+        assert next(snapshots) == Snapshot("data", "snap-0")
+        snapshots.close()
+
+    reader.join(5)
+    assert not reader.is_alive()
+    shell.async_exec.stop.assert_called_once_with()
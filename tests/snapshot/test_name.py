@@ -5,7 +5,8 @@ from unittest.mock import ANY
 import pytest
 
 from zettarepl.snapshot.name import (
-    ParsedSnapshotName, parse_snapshot_name, parse_snapshots_names_with_multiple_schemas,
+    CompiledNamingSchema, ParsedSnapshotName, ParsedSnapshotNameCache, compile_naming_schema, parse_snapshot_name,
+    parse_snapshots_names_with_multiple_schemas,
 )
 
 
@@ -122,3 +123,78 @@ def test__parse_snapshots_names_with_multiple_schemas__none(has_none):
             naming_schemas
         )
     ) == result
+
+
+@pytest.mark.parametrize("name,naming_schema", [
+    ("auto-2022-11-04_10-00", "auto-%Y-%m-%d_%H-%M"),
+    ("AUTO-2022-11-04_10-00", "auto-%Y-%m-%d_%H-%M"),
+    ("auto-2022-11-04_10-00-59", "auto-%Y-%m-%d_%H-%M-%S"),
+    ("auto-2022-1-4_1-0", "auto-%Y-%m-%d_%H-%M"),
+    ("auto 2022-11-04   10-00", "auto %Y-%m-%d %H-%M"),
+    ("auto-2022-11-04_10-00_--0200", "auto-%Y-%m-%d_%H-%M_%z"),
+    ("auto-2022-11-04_10-00_-02:00", "auto-%Y-%m-%d_%H-%M_%z"),
+    ("auto-2022-11-04_10-00_--02:00:30.5", "auto-%Y-%m-%d_%H-%M_%z"),
+    ("auto-2022-11-04_10-00_--02:0030", "auto-%Y-%m-%d_%H-%M_%z"),
+    ("auto-2022-11-04_10-00_Z", "auto-%Y-%m-%d_%H-%M_%z"),
+    ("auto-2022-11-04_10-00", "manual-%Y-%m-%d_%H-%M"),
+    ("auto-2022-11-04", "auto-%Y-%m-%d_%H-%M"),
+    ("auto-2022-11-04_10-001", "auto-%Y-%m-%d_%H-%M"),
+    ("auto-2022-02-30_10-00", "auto-%Y-%m-%d_%H-%M"),
+    ("auto-2022-11-04_10-00-61", "auto-%Y-%m-%d_%H-%M-%S"),
+])
+def test__compiled_naming_schema__same_as_strptime(name, naming_schema):
+    compiled_naming_schema = CompiledNamingSchema(naming_schema)
+    assert compiled_naming_schema.regex is not None
+
+    strptime_naming_schema = CompiledNamingSchema(naming_schema)
+    strptime_naming_schema.regex = None
+
+    def parse(naming_schema):
+        try:
+            return naming_schema.parse(name)
+        except ValueError as e:
+            return str(e)
+
+    assert parse(compiled_naming_schema) == parse(strptime_naming_schema)
+
+
+@pytest.mark.parametrize("name,result", [
+    ("auto-2022-11-04_10-00", True),
+    ("Auto-2022-11-04_10-00", True),
+    ("manual-2022-11-04_10-00", False),
+    ("auto-2022", False),
+])
+def test__compiled_naming_schema__prefilter(name, result):
+    assert CompiledNamingSchema("auto-%Y-%m-%d_%H-%M")._prefilter(name) == result
+
+
+def test__compile_naming_schema__cached():
+    assert compile_naming_schema("auto-%Y-%m-%d_%H-%M") is compile_naming_schema("auto-%Y-%m-%d_%H-%M")
+
+
+def test__parsed_snapshot_name_cache():
+    cache = ParsedSnapshotNameCache(maxsize=2)
+    compiled_naming_schema = compile_naming_schema("auto-%Y-%m-%d_%H-%M")
+
+    parsed = cache.parse("auto-2022-11-04_10-00", compiled_naming_schema)
+    assert parsed.datetime == datetime(2022, 11, 4, 10, 0)
+    assert cache.parse("auto-2022-11-04_10-00", compiled_naming_schema) is parsed
+
+    for i in range(2):
+        with pytest.raises(ValueError) as e:
+            cache.parse("manual-2022-11-04_10-00", compiled_naming_schema)
+        assert "does not match format" in str(e.value)
+
+    assert cache.cache_info() == (2, 2, 2, 2)
+
+    # Least recently used entry is evicted
+    cache.parse("auto-2022-11-04_10-00", compiled_naming_schema)
+    cache.parse("auto-2022-11-04_11-00", compiled_naming_schema)
+    assert ("manual-2022-11-04_10-00", "auto-%Y-%m-%d_%H-%M") not in cache.cache
+    assert ("auto-2022-11-04_10-00", "auto-%Y-%m-%d_%H-%M") in cache.cache
+
+    cache.resize(1)
+    assert list(cache.cache.keys()) == [("auto-2022-11-04_11-00", "auto-%Y-%m-%d_%H-%M")]
+
+    cache.cache_clear()
+    assert cache.cache_info() == (0, 0, 1, 0)
@@ -0,0 +1,32 @@
+# -*- coding=utf-8 -*-
+from zettarepl.snapshot.snapshot import Snapshot
+from zettarepl.snapshot.table import SnapshotTable
+
+
+def test__snapshot_table():
+    table = SnapshotTable.from_snapshots([
+        Snapshot("data/work", "snap-1"),
+        Snapshot("data", "snap-1"),
+        Snapshot("data/work", "snap-2"),
+    ])
+
+    assert list(table.keys()) == ["data", "data/work"]
+    assert dict(table) == {"data": ["snap-1"], "data/work": ["snap-1", "snap-2"]}
+    assert "data" in table
+    assert "backup" not in table
+    assert table.get("backup") is None
+    assert len(table) == 2
+    assert table.snapshots_count() == 3
+    assert list(table.snapshots()) == [
+        Snapshot("data", "snap-1"),
+        Snapshot("data/work", "snap-1"),
+        Snapshot("data/work", "snap-2"),
+    ]
+
+
+def test__snapshot_table__interns_names():
+    table = SnapshotTable()
+    table.add("data", "".join(["snap", "-1"]))
+    table.add("data/work", "".join(["snap", "-1"]))
+
+    assert table["data"][0] is table["data/work"][0]
@@ -1,12 +1,18 @@
 # -*- coding=utf-8 -*-
-from datetime import datetime
+from datetime import datetime, timedelta
+import threading
 
 import pytest
 from unittest.mock import ANY, call, Mock, patch
 
 from zettarepl.replication.task.direction import ReplicationDirection
 from zettarepl.replication.task.task import ReplicationTask
+from zettarepl.scheduler.event_clock import EventClock
+from zettarepl.scheduler.scheduler import SchedulerResult
+from zettarepl.snapshot.destroy_queue import DestroyQueues
+from zettarepl.snapshot.empty import EmptySnapshotsCheck
 from zettarepl.snapshot.snapshot import Snapshot
+from zettarepl.snapshot.task.task import PeriodicSnapshotTask
 from zettarepl.zettarepl import Zettarepl
 
 
@@ -125,3 +131,378 @@ def test__can_run_in_parallel__different_direction(t1, t2, can):
     zettarepl = Zettarepl(Mock(), Mock())
 
     assert zettarepl._replication_tasks_can_run_in_parallel(t1, t2) == can
+
+
+def test__spread_periodic_snapshot_tasks__intersecting_tasks_together():
+    zettarepl = Zettarepl(Mock(), Mock())
+
+    pst1 = Mock(id="pst1", dataset="data", recursive=True, spread=timedelta(seconds=30))
+    pst2 = Mock(id="pst2", dataset="data/work", recursive=False, spread=timedelta(seconds=30))
+    pst3 = Mock(id="pst3", dataset="tank", recursive=True, spread=timedelta(seconds=30))
+
+    with patch("zettarepl.zettarepl.spread_offset", lambda id, spread: {
+        "pst1": timedelta(seconds=20),
+        "pst2": timedelta(seconds=10),
+        "pst3": timedelta(seconds=15),
+    }[id]):
+        assert zettarepl._spread_periodic_snapshot_tasks([pst1, pst2, pst3], False) == [
+            (timedelta(seconds=10), [pst1, pst2]),
+            (timedelta(seconds=15), [pst3]),
+        ]
+
+        assert zettarepl._spread_periodic_snapshot_tasks([pst1, pst2, pst3], True) == [
+            (timedelta(0), [pst1, pst2, pst3]),
+        ]
+
+
+def test__spread_periodic_snapshot_tasks__transitively_intersecting_tasks_together():
+    zettarepl = Zettarepl(Mock(), Mock())
+
+    pst1 = Mock(id="pst1", dataset="pool/a", recursive=False, spread=timedelta(seconds=30))
+    pst2 = Mock(id="pst2", dataset="pool/b", recursive=False, spread=timedelta(seconds=30))
+    pst3 = Mock(id="pst3", dataset="pool", recursive=True, spread=timedelta(seconds=30))
+
+    with patch("zettarepl.zettarepl.spread_offset", lambda id, spread: {
+        "pst1": timedelta(seconds=20),
+        "pst2": timedelta(seconds=10),
+        "pst3": timedelta(seconds=15),
+    }[id]):
+        assert zettarepl._spread_periodic_snapshot_tasks([pst1, pst2, pst3], False) == [
+            (timedelta(seconds=10), [pst1, pst2, pst3]),
+        ]
+
+
+def test__run_scheduled_tasks__spread_does_not_block():
+    pst1 = Mock(id="pst1", dataset="data", recursive=True, spread=timedelta(seconds=30))
+    pst2 = Mock(id="pst2", dataset="tank", recursive=True, spread=timedelta(seconds=30))
+    replication_task = Mock(auto=True, schedule=None, spread=timedelta(0), periodic_snapshot_tasks=[pst1, pst2])
+    for task in [pst1, pst2]:
+        task.__class__ = PeriodicSnapshotTask
+    replication_task.__class__ = ReplicationTask
+
+    zettarepl = Zettarepl(Mock(), Mock())
+    zettarepl.tasks = [pst1, pst2, replication_task]
+    with patch("zettarepl.zettarepl.spread_offset", lambda id, spread: {
+        "pst1": timedelta(seconds=0),
+        "pst2": timedelta(seconds=20),
+    }.get(id, timedelta(0))):
+        with patch("zettarepl.zettarepl.datetime") as datetime_:
+            datetime_.utcnow.return_value = datetime(2018, 9, 1, 15, 11, 5)
+            with patch("zettarepl.zettarepl.threading.Timer") as timer:
+                with patch.object(zettarepl, "_schedule_periodic_snapshot_tasks",
+                                  Mock(return_value=[(pst1, "snap-1"), (pst2, "snap-2")])):
+                    with patch.object(zettarepl, "_create_periodic_snapshots", Mock(return_value=[])) as create:
+                        with patch.object(zettarepl, "_destroy_empty_snapshots") as destroy:
+                            with patch.object(zettarepl, "_spawn_replication_tasks_at") as spawn_at:
+                                zettarepl._run_scheduled_tasks(
+                                    SchedulerResult(Mock(utc_datetime=datetime(2018, 9, 1, 15, 11)), [pst1, pst2],
+                                                    False),
+                                    False,
+                                )
+
+                                assert [c[0][0] for c in create.call_args_list] == [[(pst1, "snap-1")]]
+                                assert timer.call_args[0][0] == 15
+                                destroy.assert_not_called()
+                                spawn_at.assert_not_called()
+
+                                timer.call_args[0][1]()
+
+                                assert [c[0][0] for c in create.call_args_list] == [[(pst1, "snap-1")],
+                                                                                    [(pst2, "snap-2")]]
+                                # Empty snapshots of all the groups are checked at once
+                                destroy.assert_called_once_with([(pst1, "snap-1"), (pst2, "snap-2")])
+                                spawn_at.assert_called_once_with(ANY, ANY, [replication_task])
+
+
+def test__run_periodic_snapshot_tasks_at__done_on_error():
+    zettarepl = Zettarepl(Mock(), Mock())
+    on_done = Mock()
+    with patch.object(zettarepl, "_create_periodic_snapshots", Mock(side_effect=ValueError("error"))):
+        with pytest.raises(ValueError):
+            zettarepl._run_periodic_snapshot_tasks_at(datetime(2018, 9, 1, 15, 11), [], False, False, None, on_done)
+
+    on_done.assert_called_once_with([])
+
+
+def test__run_periodic_snapshot_tasks__batch():
+    with patch("zettarepl.zettarepl.create_snapshots") as create_snapshots:
+        create_snapshots.return_value = [None, Mock(snapshots_errors=[])]
+        with patch("zettarepl.zettarepl.create_snapshot") as create_snapshot:
+            with patch("zettarepl.zettarepl.get_empty_snapshots_for_deletion", Mock(return_value=[])):
+                with patch("zettarepl.zettarepl.notify") as notify:
+                    zettarepl = Zettarepl(Mock(), Mock(), batch_snapshot_creation=True)
+                    zettarepl._run_periodic_snapshot_tasks(
+                        datetime(2018, 9, 1, 15, 11),
+                        [
+                            Mock(id="1", dataset="data", recursive=True, naming_schema="snap-%Y-%m-%d_%H-%M"),
+                            Mock(id="2", dataset="data", recursive=False, naming_schema="snap-%Y-%m-%d_%H-%M"),
+                            Mock(id="3", dataset="backup", recursive=False, naming_schema="snap-%Y-%m-%d_%H-%M"),
+                        ],
+                        None,
+                        False,
+                    )
+
+    create_snapshots.assert_called_once_with(ANY, [
+        (Snapshot("data", "snap-2018-09-01_15-11"), True, ANY, ANY),
+        (Snapshot("backup", "snap-2018-09-01_15-11"), False, ANY, ANY),
+    ])
+    create_snapshot.assert_not_called()
+    assert [(type(c[0][1]).__name__, c[0][1].task_id) for c in notify.call_args_list] == [
+        ("PeriodicSnapshotTaskStart", "1"),
+        ("PeriodicSnapshotTaskStart", "3"),
+        ("PeriodicSnapshotTaskSuccess", "1"),
+        ("PeriodicSnapshotTaskError", "3"),
+        # Same snapshot as task "1" has created
+        ("PeriodicSnapshotTaskSuccess", "2"),
+    ]
+
+
+def test__run_periodic_snapshot_tasks__empty_snapshots_check_before_creation():
+    task_1 = Mock(id="1", dataset="data", recursive=False, naming_schema="snap-%Y-%m-%d_%H-%M")
+    task_2 = Mock(id="2", dataset="data/work", recursive=False, naming_schema="snap-%Y-%m-%d_%H-%M")
+    with patch("zettarepl.zettarepl.create_snapshot") as create_snapshot:
+        with patch("zettarepl.zettarepl.get_empty_snapshots_tasks",
+                   Mock(return_value=[(task_2, "snap-2018-09-01_15-11")])):
+            with patch("zettarepl.zettarepl.get_empty_snapshots_for_deletion", Mock(return_value=[])) as get_empty:
+                with patch("zettarepl.zettarepl.notify") as notify:
+                    zettarepl = Zettarepl(Mock(), Mock(),
+                                          empty_snapshots_check=EmptySnapshotsCheck.BEFORE_CREATION)
+                    zettarepl._run_periodic_snapshot_tasks(datetime(2018, 9, 1, 15, 11), [task_1, task_2], None,
+                                                           False)
+
+    create_snapshot.assert_called_once_with(ANY, Snapshot("data", "snap-2018-09-01_15-11"), False, ANY, ANY)
+    get_empty.assert_called_once_with(ANY, [(task_1, "snap-2018-09-01_15-11")], True)
+    assert [(type(c[0][1]).__name__, c[0][1].task_id) for c in notify.call_args_list] == [
+        ("PeriodicSnapshotTaskSuccess", "2"),
+        ("PeriodicSnapshotTaskStart", "1"),
+        ("PeriodicSnapshotTaskSuccess", "1"),
+    ]
+
+
+def test__run_periodic_snapshot_tasks__parallel():
+    tasks = [
+        Mock(id="1", dataset="data/work", recursive=True, naming_schema="snap-%Y-%m-%d_%H-%M"),
+        Mock(id="2", dataset="data/work/vm", recursive=False, naming_schema="snap-%Y-%m-%d_%H-%M"),
+        Mock(id="3", dataset="data/home", recursive=True, naming_schema="snap-%Y-%m-%d_%H-%M"),
+        Mock(id="4", dataset="backup", recursive=True, naming_schema="snap-%Y-%m-%d_%H-%M"),
+    ]
+    zettarepl = Zettarepl(Mock(), Mock(), max_parallel_periodic_snapshot_tasks=2)
+    with patch.object(zettarepl, "_run_periodic_snapshot_tasks_set") as run_set:
+        with patch.object(zettarepl, "_destroy_empty_snapshots") as destroy:
+            zettarepl._run_periodic_snapshot_tasks(datetime(2018, 9, 1, 15, 11), tasks, False, False)
+
+    assert sorted([task.id for task, _ in c[0][0]] for c in run_set.call_args_list) == [["1", "2"], ["3"], ["4"]]
+    destroy.assert_called_once()
+    assert sorted(task.id for task, _ in destroy.call_args[0][0]) == ["1", "2", "3", "4"]
+
+
+def test__run_periodic_snapshot_tasks__parallel_transitive():
+    tasks = [
+        Mock(id="1", dataset="pool/a", recursive=False, naming_schema="snap-%Y-%m-%d_%H-%M"),
+        Mock(id="2", dataset="pool/b", recursive=False, naming_schema="snap-%Y-%m-%d_%H-%M"),
+        Mock(id="3", dataset="pool", recursive=True, naming_schema="snap-%Y-%m-%d_%H-%M"),
+    ]
+    zettarepl = Zettarepl(Mock(), Mock(), max_parallel_periodic_snapshot_tasks=2)
+    with patch.object(zettarepl, "_run_periodic_snapshot_tasks_set") as run_set:
+        with patch.object(zettarepl, "_destroy_empty_snapshots"):
+            zettarepl._run_periodic_snapshot_tasks(datetime(2018, 9, 1, 15, 11), tasks, False, False)
+
+    run_set.assert_called_once_with([(tasks[2], "snap-2018-09-01_15-11"), (tasks[0], "snap-2018-09-01_15-11"),
+                                     (tasks[1], "snap-2018-09-01_15-11")], False, False)
+
+
+def test__run_periodic_snapshot_tasks__parallel_empty_snapshots():
+    pool = Mock(id="1", dataset="pool", recursive=False, exclude=[], allow_empty=False,
+                naming_schema="snap-%Y-%m-%d_%H-%M")
+    pool_a = Mock(id="2", dataset="pool/a", recursive=False, exclude=[], allow_empty=True,
+                  naming_schema="snap-%Y-%m-%d_%H-%M")
+    written = {
+        Snapshot("pool", "snap-2018-09-01_15-11"): 0,
+        Snapshot("pool/a", "snap-2018-09-01_15-11"): 1024,
+    }
+    zettarepl = Zettarepl(Mock(), Mock(), max_parallel_periodic_snapshot_tasks=2)
+    with patch.object(zettarepl, "_run_periodic_snapshot_tasks_set") as run_set:
+        with patch("zettarepl.snapshot.empty.list_datasets", Mock(return_value=["pool", "pool/a"])):
+            with patch("zettarepl.snapshot.empty.is_empty_snapshot",
+                       Mock(side_effect=lambda shell, snapshot: written[snapshot] == 0)):
+                with patch("zettarepl.zettarepl.destroy_snapshots") as destroy_snapshots:
+                    zettarepl._run_periodic_snapshot_tasks(datetime(2018, 9, 1, 15, 11), [pool, pool_a], False,
+                                                           False)
+
+    assert run_set.call_count == 2
+    # `pool` snapshot is not empty as `pool/a` snapshot that was created in parallel is not
+    destroy_snapshots.assert_not_called()
+
+
+def test__run__non_blocking_coalesces_late_ticks():
+    started = threading.Event()
+    release = threading.Event()
+
+    def scheduled(minute, tasks):
+        return SchedulerResult(Mock(utc_datetime=datetime(2018, 9, 1, 15, minute), legit_step_back=None), tasks,
+                               False)
+
+    def schedule():
+        yield scheduled(11, ["1"])
+        started.wait(5)
+        yield scheduled(12, ["1", "2"])
+        yield scheduled(13, [])
+        yield scheduled(15, ["3"])
+        release.set()
+
+    def run_scheduled_tasks(scheduled, legit_step_back):
+        started.set()
+        release.wait(5)
+
+    zettarepl = Zettarepl(Mock(schedule=schedule), Mock(), non_blocking_scheduler=True)
+    with patch.object(zettarepl, "_run_scheduled_tasks", Mock(side_effect=run_scheduled_tasks)) as run:
+        with patch("zettarepl.zettarepl.logger") as logger:
+            zettarepl.run()
+
+    assert [(c[0][0].datetime.utc_datetime.minute, c[0][0].tasks) for c in run.call_args_list] == [
+        (11, ["1"]),
+        (12, ["1", "2"]),
+        (15, ["3"]),
+    ]
+    assert [c[0][0].split(" ")[0] for c in logger.warning.call_args_list] == ["Missed", "Scheduled"]
+
+
+def test__run__non_blocking_does_not_run_pending_task_twice():
+    started = threading.Event()
+    release = threading.Event()
+
+    def scheduled(minute, tasks):
+        return SchedulerResult(Mock(utc_datetime=datetime(2018, 9, 1, 15, minute), legit_step_back=None), tasks,
+                               False)
+
+    def schedule():
+        yield scheduled(11, ["1"])
+        started.wait(5)
+        yield scheduled(12, ["2"])
+        yield scheduled(13, ["2", "3"])
+        release.set()
+
+    def run_scheduled_tasks(scheduled, legit_step_back):
+        started.set()
+        release.wait(5)
+
+    zettarepl = Zettarepl(Mock(schedule=schedule, clock=EventClock()), Mock(), non_blocking_scheduler=True)
+    with patch.object(zettarepl, "_run_scheduled_tasks", Mock(side_effect=run_scheduled_tasks)) as run:
+        zettarepl.run()
+
+    assert [(c[0][0].datetime.utc_datetime.minute, c[0][0].tasks) for c in run.call_args_list] == [
+        (11, ["1"]),
+        (12, ["2"]),
+        (13, ["3"]),
+    ]
+
+
+def test__run__non_blocking_event_clock_does_not_report_missed_ticks():
+    def schedule():
+        for minute in [11, 15]:
+            yield SchedulerResult(Mock(utc_datetime=datetime(2018, 9, 1, 15, minute), legit_step_back=None), [],
+                                  False)
+
+    zettarepl = Zettarepl(Mock(schedule=schedule, clock=EventClock()), Mock(), non_blocking_scheduler=True)
+    with patch("zettarepl.zettarepl.logger") as logger:
+        zettarepl.run()
+
+    logger.warning.assert_not_called()
+
+
+def test__run_scheduled_tasks__replication_trigger():
+    periodic_snapshot_task_1 = Mock(id="1", dataset="data/work", recursive=True, exclude=[],
+                                    naming_schema="snap-%Y-%m-%d_%H-%M")
+    periodic_snapshot_task_2 = Mock(id="2", dataset="backup/work", recursive=True, exclude=[],
+                                    naming_schema="snap-%Y-%m-%d_%H-%M")
+    replication_task_1 = Mock(auto=True, schedule=None, spread=timedelta(0),
+                              periodic_snapshot_tasks=[periodic_snapshot_task_1])
+    replication_task_2 = Mock(auto=True, schedule=None, spread=timedelta(0),
+                              periodic_snapshot_tasks=[periodic_snapshot_task_1, periodic_snapshot_task_2])
+    replication_task_3 = Mock(auto=True, schedule=None, spread=timedelta(minutes=1),
+                              periodic_snapshot_tasks=[periodic_snapshot_task_2])
+    for task in [periodic_snapshot_task_1, periodic_snapshot_task_2]:
+        task.__class__ = PeriodicSnapshotTask
+    for task in [replication_task_1, replication_task_2, replication_task_3]:
+        task.__class__ = ReplicationTask
+
+    zettarepl = Zettarepl(Mock(), Mock(), replication_trigger_debounce=0)
+    zettarepl.tasks = [periodic_snapshot_task_1, periodic_snapshot_task_2, replication_task_1, replication_task_2,
+                       replication_task_3]
+    with patch.object(zettarepl, "_run_periodic_snapshot_tasks_set"):
+        with patch.object(zettarepl, "_destroy_empty_snapshots"):
+            with patch.object(zettarepl, "_trigger_replication_tasks") as trigger:
+                with patch.object(zettarepl, "_spawn_replication_tasks_at") as spawn_at:
+                    zettarepl._run_scheduled_tasks(
+                        SchedulerResult(Mock(utc_datetime=datetime(2018, 9, 1, 15, 11),
+                                             offset_aware_datetime=datetime(2018, 9, 1, 15, 11)),
+                                        [periodic_snapshot_task_1, periodic_snapshot_task_2], True),
+                        False,
+                    )
+
+    assert trigger.call_args_list == [call(ANY, [replication_task_1, replication_task_2])]
+    spawn_at.assert_called_once_with(ANY, ANY, [replication_task_3])
+
+
+def test__trigger_replication_tasks__debounce():
+    zettarepl = Zettarepl(Mock(), Mock(), replication_trigger_debounce=1)
+    with patch("zettarepl.zettarepl.threading.Timer") as timer:
+        zettarepl._trigger_replication_tasks(datetime(2018, 9, 1, 15, 11), ["1", "2"])
+        zettarepl._trigger_replication_tasks(datetime(2018, 9, 1, 15, 11), ["2", "3"])
+
+    timer.assert_called_once_with(1, zettarepl._spawn_triggered_replication_tasks)
+
+    with patch.object(zettarepl, "_spawn_replication_tasks") as spawn:
+        zettarepl._spawn_triggered_replication_tasks()
+
+    spawn.assert_called_once_with(datetime(2018, 9, 1, 15, 11), ["1", "2", "3"])
+    assert zettarepl.triggered_timer is None
+
+
+def test__spawn_replication_tasks__waits_for_destroy_queue():
+    started = threading.Event()
+    release = threading.Event()
+    destroyed = threading.Event()
+
+    def destroy_snapshots(shell, snapshots, defer):
+        started.set()
+        release.wait(5)
+
+    local_transport, remote_transport, other_transport = Mock(), Mock(), Mock()
+
+    def replication_task(source_dataset, target_dataset):
+        return Mock(source_datasets=[source_dataset], target_dataset=target_dataset, recursive=True, exclude=[],
+                    direction=ReplicationDirection.PUSH, transport=remote_transport, name_pattern=None,
+                    periodic_snapshot_tasks=[], also_include_naming_schema=["auto-%Y-%m-%d_%H-%M"])
+
+    replication_task_1 = replication_task("data/src", "backup/src")
+    replication_task_2 = replication_task("data/work", "backup/work")
+    destroy_queues = DestroyQueues()
+    zettarepl = Zettarepl(Mock(), Mock(transport=local_transport), destroy_queues=destroy_queues)
+    with patch("zettarepl.snapshot.destroy_queue.destroy_snapshots", Mock(side_effect=destroy_snapshots)):
+        with patch.object(zettarepl, "_spawn_replication_task") as spawn:
+            spawn.side_effect = lambda now, replication_task: destroyed.set()
+
+            destroy_queues.enqueue(Mock(transport=local_transport), [
+                Snapshot("data/src/child", "auto-2018-09-01_15-00"),
+                # Replication task does not use this snapshot
+                Snapshot("data/work", "manual"),
+            ])
+            # Different host
+            destroy_queues.enqueue(Mock(transport=other_transport), [Snapshot("backup/work", "auto-2018-09-01_15-00")])
+            started.wait(5)
+
+            with patch("zettarepl.zettarepl.notify") as notify:
+                zettarepl._spawn_replication_tasks(datetime(2018, 9, 1, 15, 11),
+                                                   [replication_task_1, replication_task_2])
+
+            spawn.assert_called_once_with(datetime(2018, 9, 1, 15, 11), replication_task_2)
+            assert notify.call_args[0][1].waiting_reason == "Waiting for retention to destroy snapshots"
+            assert zettarepl.pending_tasks == [(datetime(2018, 9, 1, 15, 11), replication_task_1)]
+
+            destroyed.clear()
+            release.set()
+            destroyed.wait(5)
+
+            assert spawn.call_args_list[1] == call(datetime(2018, 9, 1, 15, 11), replication_task_1)
+            assert zettarepl.pending_tasks == []
@@ -0,0 +1,18 @@
+# -*- coding=utf-8 -*-
+import io
+import queue
+from unittest.mock import Mock
+
+from zettarepl.transport.interface import AsyncExec
+
+
+def test__async_exec__stdout_lines_per_chunk():
+    stdout = queue.Queue()
+    async_exec = AsyncExec(Mock(), ["zfs", "list"], stdout=stdout, stdout_lines_per_chunk=2)
+    async_exec._copy_stdout_from(io.StringIO("a\nb\nc\nd\ne\n"))
+
+    chunks = []
+    while (chunk := stdout.get(timeout=5)) is not None:
+        chunks.append(chunk)
+
+    assert chunks == ["a\nb\n", "c\nd\n", "e\n"]
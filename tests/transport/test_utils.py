@@ -0,0 +1,20 @@
+# -*- coding=utf-8 -*-
+from unittest.mock import Mock
+
+from zettarepl.transport.utils import forget_put_file, put_file
+
+
+def test__put_file__uploads_once():
+    shell = Mock()
+    shell.exists.return_value = False
+
+    remote_path = put_file("zcp/recursive_snapshot_exclude.lua", shell)
+    assert put_file("zcp/recursive_snapshot_exclude.lua", shell) == remote_path
+
+    shell.exists.assert_called_once_with(remote_path)
+    shell.put_file.assert_called_once()
+
+    forget_put_file(remote_path, shell)
+    put_file("zcp/recursive_snapshot_exclude.lua", shell)
+
+    assert shell.put_file.call_count == 2
@@ -0,0 +1,18 @@
+# -*- coding=utf-8 -*-
+import pytest
+
+from zettarepl.zcp.render_zcp import fnmatch_to_lua_pattern
+
+
+@pytest.mark.parametrize("pattern,result", [
+    ("data/*/cores", "^data%/.*%/cores$"),
+    ("data/vm-?", "^data%/vm%-.$"),
+    ("data/[a-c0-9]x", "^data%/[a-c0-9]x$"),
+    ("data/[!a]", "^data%/[^a]$"),
+    ("data/[abc", "^data%/%[abc$"),
+    ("data/[.]", None),
+    ("data/[]]", None),
+    ("data/ä*", None),
+])
+def test__fnmatch_to_lua_pattern(pattern, result):
+    assert fnmatch_to_lua_pattern(pattern) == result
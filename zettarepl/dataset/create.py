@@ -3,10 +3,15 @@ import logging
 
 from zettarepl.transport.interface import Shell
 
+from .topology import dataset_topologies
+
 logger = logging.getLogger(__name__)
 
 __all__ = ["create_dataset"]
 
 
 def create_dataset(shell: Shell, dataset: str) -> None:
-    shell.exec(["zfs", "create", "-p", dataset])
+    try:
+        shell.exec(["zfs", "create", "-p", dataset])
+    finally:
+        dataset_topologies.invalidate(shell, dataset, False)
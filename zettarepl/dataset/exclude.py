@@ -1,15 +1,93 @@
 # -*- coding=utf-8 -*-
+from collections.abc import Iterable
+import functools
 import logging
 import fnmatch
+import os
+import re
 
 import zettarepl.dataset.relationship
+import zettarepl.dataset.tree
 
 logger = logging.getLogger(__name__)
 
-__all__ = ["should_exclude"]
+__all__ = ["ExcludeList", "ExcludeMatcher", "should_exclude"]
+
+# Matchers live as long as their tasks (or the `compile_exclude` cache) do, so the memo must not grow indefinitely
+MAX_MEMOIZED_RESULTS = 10000
+
+
+class ExcludeMatcher:
+    """
+    Exclude rules compiled once: plain dataset names are put into a `DatasetTree` and glob patterns are combined into a
+    single regular expression. Results are memoized for each dataset (up to `MAX_MEMOIZED_RESULTS` datasets).
+    """
+
+    def __init__(self, exclude: Iterable[str]) -> None:
+        self.exclude = list(exclude)
+
+        self.tree = zettarepl.dataset.tree.DatasetTree()
+        # Rules that need `is_child` semantics that the tree does not implement
+        self.other_exclude = []
+        for excl in self.exclude:
+            if zettarepl.dataset.relationship.NOT_NORMALIZED_NAME.search(excl):
+                self.other_exclude.append(excl)
+            else:
+                self.tree.add(excl)
+
+        patterns = [fnmatch.translate(os.path.normcase(excl)) for excl in self.exclude if re.search(r"[*?\[]", excl)]
+        self.regex = re.compile("|".join(patterns)) if patterns else None
+
+        self.results: dict[str, bool] = {}
+
+    def should_exclude(self, dataset: str) -> bool:
+        result = self.results.get(dataset)
+        if result is None:
+            result = self._should_exclude(dataset)
+
+            if len(self.results) >= MAX_MEMOIZED_RESULTS:
+                self.results.clear()
+            self.results[dataset] = result
+
+        return result
+
+    def _should_exclude(self, dataset: str) -> bool:
+        if zettarepl.dataset.relationship.NOT_NORMALIZED_NAME.search(dataset):
+            return should_exclude_slow(dataset, self.exclude)
+
+        return (
+            self.tree.has_ancestor(dataset) or
+            any(zettarepl.dataset.relationship.is_child(dataset, excl) for excl in self.other_exclude) or
+            (self.regex is not None and self.regex.match(os.path.normcase(dataset)) is not None)
+        )
+
+
+class ExcludeList(list[str]):
+    """
+    Task exclude rules. Compiled into an `ExcludeMatcher` on first use (so they must not be modified afterwards).
+    """
+
+    @functools.cached_property
+    def matcher(self) -> ExcludeMatcher:
+        return ExcludeMatcher(self)
+
+
+@functools.lru_cache(maxsize=256)
+def compile_exclude(exclude: tuple[str, ...]) -> ExcludeMatcher:
+    return ExcludeMatcher(exclude)
 
 
 def should_exclude(dataset: str, exclude: list[str]) -> bool:
+    if isinstance(exclude, ExcludeList):
+        return exclude.matcher.should_exclude(dataset)
+
+    if not exclude:
+        return False
+
+    return compile_exclude(tuple(exclude)).should_exclude(dataset)
+
+
+def should_exclude_slow(dataset: str, exclude: list[str]) -> bool:
     return any(
         zettarepl.dataset.relationship.is_child(dataset, excl) or fnmatch.fnmatch(dataset, excl)
         for excl in exclude
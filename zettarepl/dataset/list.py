@@ -1,18 +1,21 @@
 # -*- coding=utf-8 -*-
 import logging
+import time
 from typing import Any
 
 from zettarepl.transport.interface import Shell
 from zettarepl.transport.zfscli import parse_property
 from zettarepl.transport.zfscli.exception import ZfsCliExceptionHandler
 
+from .topology import dataset_topologies
+
 logger = logging.getLogger(__name__)
 
 __all__ = ["list_datasets", "list_datasets_with_properties"]
 
 
-def list_datasets(shell: Shell, dataset: str | None = None, recursive: bool = True) -> list[str]:
-    return [dataset["name"] for dataset in list_datasets_with_properties(shell, dataset, recursive)]
+def list_datasets(shell: Shell, dataset: str | None = None, recursive: bool = True, cached: bool = False) -> list[str]:
+    return [dataset["name"] for dataset in list_datasets_with_properties(shell, dataset, recursive, cached=cached)]
 
 
 def list_datasets_with_properties(
@@ -20,11 +23,33 @@ def list_datasets_with_properties(
     dataset: str | None = None,
     recursive: bool = True,
     properties: dict[str, type] | None = None,
+    cached: bool = False,
 ) -> list[dict[str, Any]]:
-    properties = properties or {}
+    """
+    If `cached` is true, uses the dataset topology of the shell's transport (if it is enabled). Dataset types are
+    always listed (and cached) in that case so that they are available to all consumers.
+    """
+    properties = dict(properties or {}, name=str)
+
+    topology = dataset_topologies.topology(shell) if cached else None
+    if topology is None:
+        return _list_datasets_with_properties(shell, dataset, recursive, properties)
+
+    datasets = topology.get(dataset, recursive, list(properties.keys()))
+    if datasets is not None:
+        logger.debug("Using cached datasets list for %r on %r (recursive=%r)", dataset, shell, recursive)
+        return datasets
+
+    listed_at = time.monotonic()
+    generation = topology.generation
+    listed_properties = dict(properties, type=str)
+    datasets = _list_datasets_with_properties(shell, dataset, recursive, listed_properties)
+    topology.put(dataset, recursive, list(listed_properties.keys()), datasets, listed_at, generation)
+    return [{property: row[property] for property in properties} for row in datasets]
 
-    properties["name"] = str
 
+def _list_datasets_with_properties(shell: Shell, dataset: str | None, recursive: bool,
+                                   properties: dict[str, type]) -> list[dict[str, Any]]:
     args = ["zfs", "list", "-t", "filesystem,volume", "-H", "-o", ",".join(properties.keys()), "-s", "name"]
     if recursive:
         args.extend(["-r"])
@@ -1,6 +1,7 @@
 # -*- coding=utf-8 -*-
 import logging
 import os
+import re
 
 import zettarepl.dataset.exclude
 
@@ -9,14 +10,25 @@ logger = logging.getLogger(__name__)
 __all__ = ["is_child", "is_immediate_child", "belongs_to_tree"]
 
 
+# Names that need `os.path.relpath` semantics (empty, absolute, with `.` components, components starting with `..` or
+# repeated/trailing slashes)
+NOT_NORMALIZED_NAME = re.compile(r"^$|^/|/$|//|(^|/)\.(/|$)|(^|/)\.\.")
+
+
 def is_child(child: str, parent: str) -> bool:
-    rel = os.path.relpath(child, parent)
-    return rel == "." or not rel.startswith("..")
+    if NOT_NORMALIZED_NAME.search(child) or NOT_NORMALIZED_NAME.search(parent):
+        rel = os.path.relpath(child, parent)
+        return rel == "." or not rel.startswith("..")
+
+    return child == parent or (child.startswith(parent) and child[len(parent)] == "/")
 
 
 def is_immediate_child(child: str, parent: str) -> bool:
-    rel = os.path.relpath(child, parent)
-    return rel != "." and rel != ".." and "/" not in rel
+    if NOT_NORMALIZED_NAME.search(child) or NOT_NORMALIZED_NAME.search(parent):
+        rel = os.path.relpath(child, parent)
+        return rel != "." and rel != ".." and "/" not in rel
+
+    return child.startswith(parent) and child[len(parent):len(parent) + 1] == "/" and "/" not in child[len(parent) + 1:]
 
 
 def belongs_to_tree(dataset: str, root: str, recursive: bool, exclude: list[str]) -> bool:
@@ -0,0 +1,129 @@
+# -*- coding=utf-8 -*-
+import logging
+import threading
+import time
+from typing import Any
+
+from zettarepl.transport.interface import Shell, Transport
+from zettarepl.transport.zfscli.exception import DatasetDoesNotExistException
+
+from .relationship import is_child
+
+logger = logging.getLogger(__name__)
+
+__all__ = ["DatasetTopology", "DatasetTopologies", "dataset_topologies"]
+
+TopologyEntry = tuple[float, frozenset[str], list[dict[str, Any]]]
+
+
+class DatasetTopology:
+    """
+    Dataset listings (`zfs list -t filesystem,volume` results with their properties) for a single transport. Entries
+    are invalidated when zettarepl creates, receives or destroys datasets on that transport and expire after `ttl`
+    seconds to account for changes made by other processes.
+    """
+
+    def __init__(self, ttl: float) -> None:
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        # `(dataset, recursive)` -> (monotonic time of listing start, listed properties, datasets)
+        # `dataset` is `None` for the listing of all datasets
+        self.entries: dict[tuple[str | None, bool], TopologyEntry] = {}
+        # Incremented on each invalidation so that listings that were running concurrently are not stored
+        self.generation = 0
+
+    def get(self, dataset: str | None, recursive: bool, properties: list[str]) -> list[dict[str, Any]] | None:
+        """
+        Raises `DatasetDoesNotExistException` if a cached recursive listing of the parent dataset proves that
+        `dataset` does not exist.
+        """
+        now = time.monotonic()
+        with self.lock:
+            for (entry_dataset, entry_recursive), (listed_at, entry_properties, datasets) in list(self.entries.items()):
+                if now - listed_at >= self.ttl:
+                    self.entries.pop((entry_dataset, entry_recursive))
+                    continue
+
+                if not entry_properties.issuperset(properties):
+                    continue
+
+                if not (
+                    (entry_dataset == dataset and (entry_recursive or not recursive)) or
+                    (entry_recursive and (entry_dataset is None or (dataset is not None and
+                                                                    is_child(dataset, entry_dataset))))
+                ):
+                    continue
+
+                result = [
+                    {property: row[property] for property in properties}
+                    for row in datasets
+                    if (
+                        dataset is None or
+                        row["name"] == dataset or
+                        (recursive and is_child(row["name"], dataset))
+                    )
+                ]
+                if dataset is not None and not any(row["name"] == dataset for row in result):
+                    raise DatasetDoesNotExistException(1, f"cannot open '{dataset}': dataset does not exist\n")
+
+                return result
+
+        return None
+
+    def put(self, dataset: str | None, recursive: bool, properties: list[str], datasets: list[dict[str, Any]],
+            listed_at: float, generation: int) -> None:
+        with self.lock:
+            if generation != self.generation:
+                return
+
+            self.entries[(dataset, recursive)] = (listed_at, frozenset(properties), datasets)
+
+    def invalidate(self, dataset: str, recursive: bool) -> None:
+        """
+        Invalidates all listings that might contain `dataset` (and its children if `recursive`).
+        """
+        with self.lock:
+            self.generation += 1
+
+            for entry_dataset, entry_recursive in list(self.entries.keys()):
+                if (
+                    entry_dataset is None or
+                    entry_dataset == dataset or
+                    (recursive and is_child(entry_dataset, dataset)) or
+                    (entry_recursive and is_child(dataset, entry_dataset))
+                ):
+                    self.entries.pop((entry_dataset, entry_recursive))
+
+
+class DatasetTopologies:
+    """
+    `DatasetTopology` for each transport. Disabled (nothing is cached) when `ttl` is zero.
+    """
+
+    def __init__(self, ttl: float) -> None:
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.topologies: dict[Transport, DatasetTopology] = {}
+
+    def set_ttl(self, ttl: float) -> None:
+        with self.lock:
+            self.ttl = ttl
+            self.topologies = {}
+
+    def topology(self, shell: Shell) -> DatasetTopology | None:
+        if not self.ttl:
+            return None
+
+        with self.lock:
+            if shell.transport not in self.topologies:
+                self.topologies[shell.transport] = DatasetTopology(self.ttl)
+
+            return self.topologies[shell.transport]
+
+    def invalidate(self, shell: Shell, dataset: str, recursive: bool) -> None:
+        topology = self.topology(shell)
+        if topology is not None:
+            topology.invalidate(dataset, recursive)
+
+
+dataset_topologies = DatasetTopologies(ttl=0)
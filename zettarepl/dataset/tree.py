@@ -0,0 +1,150 @@
+# -*- coding=utf-8 -*-
+from collections.abc import Iterable, Iterator
+import logging
+
+logger = logging.getLogger(__name__)
+
+__all__ = ["DatasetTree"]
+
+
+class DatasetTreeNode:
+    __slots__ = ("children", "present")
+
+    def __init__(self) -> None:
+        self.children: dict[str, DatasetTreeNode] = {}
+        self.present = False
+
+
+class DatasetTree:
+    """
+    A set of dataset names stored as a prefix tree of their path components. Answers "which of the stored datasets are
+    children (or parents) of this dataset" without comparing it to every stored dataset.
+    """
+
+    def __init__(self, datasets: Iterable[str] = ()) -> None:
+        self.root = DatasetTreeNode()
+        self.count = 0
+
+        for dataset in datasets:
+            self.add(dataset)
+
+    def add(self, dataset: str) -> None:
+        node = self.root
+        for component in dataset.split("/"):
+            child = node.children.get(component)
+            if child is None:
+                child = node.children[component] = DatasetTreeNode()
+            node = child
+
+        if not node.present:
+            node.present = True
+            self.count += 1
+
+    def ancestors(self, dataset: str) -> list[str]:
+        """
+        Stored datasets that `dataset` is a child of (including `dataset` itself), top-level first.
+        """
+        result = []
+        node = self.root
+        components = dataset.split("/")
+        for i, component in enumerate(components):
+            child = node.children.get(component)
+            if child is None:
+                break
+            node = child
+
+            if node.present:
+                result.append("/".join(components[:i + 1]))
+
+        return result
+
+    def has_ancestor(self, dataset: str) -> bool:
+        node = self.root
+        for component in dataset.split("/"):
+            child = node.children.get(component)
+            if child is None:
+                return False
+            node = child
+
+            if node.present:
+                return True
+
+        return False
+
+    def subtree(self, dataset: str) -> list[str]:
+        """
+        Stored datasets that are children of `dataset` (including `dataset` itself).
+        """
+        node = self._find(dataset)
+        if node is None:
+            return []
+
+        return list(self._iterate(node, dataset))
+
+    def has_descendant(self, dataset: str) -> bool:
+        return self._find(dataset) is not None
+
+    def intersects(self, dataset: str) -> bool:
+        """
+        Whether any of the stored datasets is a parent or a child of `dataset` (or `dataset` itself).
+        """
+        return self.has_ancestor(dataset) or self.has_descendant(dataset)
+
+    def remove_subtree(self, dataset: str) -> list[str]:
+        """
+        Removes `dataset` and all its children. Returns removed datasets.
+        """
+        path = []
+        node = self.root
+        for component in dataset.split("/"):
+            child = node.children.get(component)
+            if child is None:
+                return []
+            path.append((node, component))
+            node = child
+
+        removed = list(self._iterate(node, dataset))
+        self.count -= len(removed)
+
+        # Do not leave nodes that lead to no datasets
+        for parent, component in reversed(path):
+            parent.children.pop(component)
+            if parent.present or parent.children:
+                break
+
+        return removed
+
+    def __contains__(self, dataset: object) -> bool:
+        if not isinstance(dataset, str):
+            return False
+
+        node = self._find(dataset)
+        return node is not None and node.present
+
+    def __iter__(self) -> Iterator[str]:
+        for component, node in sorted(self.root.children.items()):
+            yield from self._iterate(node, component)
+
+    def __len__(self) -> int:
+        return self.count
+
+    def _find(self, dataset: str) -> DatasetTreeNode | None:
+        # Each node in the tree is either a stored dataset or has stored datasets among its children
+        node = self.root
+        for component in dataset.split("/"):
+            child = node.children.get(component)
+            if child is None:
+                return None
+            node = child
+
+        return node
+
+    def _iterate(self, node: DatasetTreeNode, dataset: str) -> Iterator[str]:
+        stack = [(dataset, node)]
+        while stack:
+            dataset, node = stack.pop()
+            if node.present:
+                yield dataset
+
+            for component, child in sorted(node.children.items(), reverse=True):
+                stack.append((f"{dataset}/{component}", child))
@@ -2,7 +2,7 @@
 from __future__ import annotations
 
 import copy
-from datetime import tzinfo
+from datetime import timedelta, tzinfo
 import logging
 from typing import Any, Sequence
 
@@ -11,6 +11,8 @@ import pytz
 import pytz.exceptions
 
 from zettarepl.replication.task.task import ReplicationTask
+from zettarepl.scheduler.spread import parse_spread
+from zettarepl.snapshot.empty import EmptySnapshotsCheck
 from zettarepl.snapshot.task.task import PeriodicSnapshotTask
 from zettarepl.task import Task
 
@@ -60,11 +62,47 @@ class Definition:
         timezone: tzinfo,
         use_removal_dates: bool,
         errors: list[DefinitionError],
+        heap_scheduler: bool = False,
+        event_clock: bool = False,
+        snapshot_names_cache_size: int | None = None,
+        snapshot_inventory_ttl: float = 0,
+        dataset_topology_ttl: float = 0,
+        batch_snapshot_creation: bool = False,
+        empty_snapshots_check: EmptySnapshotsCheck = EmptySnapshotsCheck.AFTER_CREATION,
+        max_parallel_periodic_snapshot_tasks: int = 1,
+        non_blocking_scheduler: bool = False,
+        replication_trigger_debounce: float | None = None,
+        snapshot_destruction_max_parallel_pools: int = 1,
+        adaptive_snapshot_destruction: bool = False,
+        snapshot_destruction_ranges: bool = False,
+        snapshot_destruction_queue: bool = False,
+        snapshot_destruction_rate: float | None = None,
+        deferred_snapshot_destruction: bool = False,
+        snapshot_destruction_channel_program: bool = False,
+        vectorized_retention: bool = False,
     ) -> None:
         self.tasks = tasks
         self.max_parallel_replication_tasks = max_parallel_replication_tasks
         self.timezone = timezone
         self.use_removal_dates = use_removal_dates
+        self.heap_scheduler = heap_scheduler
+        self.event_clock = event_clock
+        self.snapshot_names_cache_size = snapshot_names_cache_size
+        self.snapshot_inventory_ttl = snapshot_inventory_ttl
+        self.dataset_topology_ttl = dataset_topology_ttl
+        self.batch_snapshot_creation = batch_snapshot_creation
+        self.empty_snapshots_check = empty_snapshots_check
+        self.max_parallel_periodic_snapshot_tasks = max_parallel_periodic_snapshot_tasks
+        self.non_blocking_scheduler = non_blocking_scheduler
+        self.replication_trigger_debounce = replication_trigger_debounce
+        self.snapshot_destruction_max_parallel_pools = snapshot_destruction_max_parallel_pools
+        self.adaptive_snapshot_destruction = adaptive_snapshot_destruction
+        self.snapshot_destruction_ranges = snapshot_destruction_ranges
+        self.snapshot_destruction_queue = snapshot_destruction_queue
+        self.snapshot_destruction_rate = snapshot_destruction_rate
+        self.deferred_snapshot_destruction = deferred_snapshot_destruction
+        self.snapshot_destruction_channel_program = snapshot_destruction_channel_program
+        self.vectorized_retention = vectorized_retention
 
         self.errors = errors
 
@@ -89,8 +127,22 @@ class Definition:
             except pytz.exceptions.UnknownTimeZoneError:
                 errors.append(DefinitionError(f"Unknown timezone: {data['timezone']!r}"))
 
+        spread = None
+        if "spread" in data:
+            try:
+                if parse_spread(data["spread"]) >= timedelta(minutes=1):
+                    raise ValueError("it also applies to periodic snapshot tasks, so it can't be a minute or more "
+                                     "(specify longer spread for each replication task instead)")
+            except ValueError as e:
+                errors.append(DefinitionError(f"Invalid spread {data['spread']!r}: {e}"))
+            else:
+                spread = data["spread"]
+
         periodic_snapshot_tasks = []
         for id, task in data.get("periodic-snapshot-tasks", {}).items():
+            if spread is not None:
+                task.setdefault("spread", spread)
+
             try:
                 periodic_snapshot_tasks.append(PeriodicSnapshotTask.from_data(id, task))
             except ValueError as e:
@@ -100,6 +152,9 @@ class Definition:
 
         replication_tasks = []
         for id, task in data.get("replication-tasks", {}).items():
+            if spread is not None:
+                task.setdefault("spread", spread)
+
             if not isinstance(task["transport"], dict):
                 try:
                     task["transport"] = transports[task["transport"]]
@@ -122,4 +177,22 @@ class Definition:
             timezone,
             data.get("use-removal-dates", False),
             errors,
+            data.get("heap-scheduler", False),
+            data.get("event-clock", False),
+            data.get("snapshot-names-cache-size"),
+            data.get("snapshot-inventory-ttl", 0),
+            data.get("dataset-topology-ttl", 0),
+            data.get("batch-snapshot-creation", False),
+            EmptySnapshotsCheck(data.get("empty-snapshots-check", EmptySnapshotsCheck.AFTER_CREATION.value)),
+            data.get("max-parallel-periodic-snapshot-tasks", 1),
+            data.get("non-blocking-scheduler", False),
+            data.get("replication-trigger-debounce"),
+            data.get("snapshot-destruction-max-parallel-pools", 1),
+            data.get("adaptive-snapshot-destruction", False),
+            data.get("snapshot-destruction-ranges", False),
+            data.get("snapshot-destruction-queue", False),
+            data.get("snapshot-destruction-rate"),
+            data.get("deferred-snapshot-destruction", False),
+            data.get("snapshot-destruction-channel-program", False),
+            data.get("vectorized-retention", False),
         )
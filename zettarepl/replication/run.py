@@ -14,9 +14,12 @@ from zettarepl.dataset.create import create_dataset
 from zettarepl.dataset.data import DatasetIsNotMounted, list_data, ensure_has_no_data
 from zettarepl.dataset.list import *
 from zettarepl.dataset.relationship import is_child
+from zettarepl.dataset.topology import dataset_topologies
+from zettarepl.dataset.tree import DatasetTree
 from zettarepl.observer import (notify, ReplicationTaskStart, ReplicationTaskSuccess, ReplicationTaskSnapshotStart,
                                 ReplicationTaskSnapshotProgress, ReplicationTaskSnapshotSuccess,
                                 ReplicationTaskDataProgress, ReplicationTaskError)
+from zettarepl.snapshot.inventory import snapshot_inventories
 from zettarepl.snapshot.list import *
 from zettarepl.transport.interface import ExecException, Shell, Transport
 from zettarepl.transport.local import LocalShell
@@ -260,6 +263,18 @@ def run_replication_task_part(replication_task: ReplicationTask, source_dataset:
                               observer: Callable | None) -> None:
     target_dataset = get_target_dataset(replication_task, source_dataset)
 
+    try:
+        _run_replication_task_part(replication_task, source_dataset, target_dataset, src_context, dst_context,
+                                   observer)
+    finally:
+        # Snapshots and datasets were (or might have been) received, destroyed or rolled back
+        snapshot_inventories.invalidate(dst_context.shell, target_dataset, True)
+        dataset_topologies.invalidate(dst_context.shell, target_dataset, True)
+
+
+def _run_replication_task_part(replication_task: ReplicationTask, source_dataset: str, target_dataset: str,
+                               src_context: ReplicationContext, dst_context: ReplicationContext,
+                               observer: Callable[..., None] | None) -> None:
     check_target_existence_and_type(replication_task, source_dataset, src_context, dst_context)
 
     step_templates = calculate_replication_step_templates(replication_task, source_dataset, src_context, dst_context)
@@ -279,6 +294,8 @@ def run_replication_task_part(replication_task: ReplicationTask, source_dataset:
     ):
         resumed = resume_replications(step_templates, observer)
         if resumed:
+            snapshot_inventories.invalidate(dst_context.shell, target_dataset, True)
+            dataset_topologies.invalidate(dst_context.shell, target_dataset, True)
             step_templates = calculate_replication_step_templates(replication_task, source_dataset,
                                                                   src_context, dst_context)
 
@@ -452,7 +469,7 @@ def calculate_replication_step_templates(
 
         try:
             datasets = list_datasets_with_properties(dst_context.shell, target_dataset, replication_task.recursive,
-                                                     {"readonly": str, "receive_resume_token": str})
+                                                     {"readonly": str, "receive_resume_token": str}, cached=True)
         except DatasetDoesNotExistException:
             pass
         else:
@@ -476,13 +493,13 @@ def calculate_replication_step_templates(
 
 
 def list_datasets_with_snapshots(shell: Shell, dataset: str, recursive: bool) -> OrderedDict[str, list[str]]:
-    datasets = list_datasets(shell, dataset, recursive)
+    datasets = list_datasets(shell, dataset, recursive, cached=True)
     return list_snapshots_for_datasets(shell, dataset, recursive, datasets)
 
 
 def list_snapshots_for_datasets(shell: Shell, dataset: str, recursive: bool,
                                 datasets: list[str]) -> OrderedDict[str, list[str]]:
-    datasets_from_snapshots = group_snapshots_by_datasets(list_snapshots(shell, dataset, recursive))
+    datasets_from_snapshots = list_snapshots_table(shell, dataset, recursive)
     datasets = dict({dataset: [] for dataset in datasets}, **datasets_from_snapshots)
     return OrderedDict(sorted(datasets.items(), key=lambda t: t[0]))
 
@@ -491,7 +508,8 @@ def get_datasets_encrypted(shell: Shell, dataset: str, recursive: bool) -> dict[
     try:
         return {
             dataset["name"]: dataset["encryption"] != "off"
-            for dataset in list_datasets_with_properties(shell, dataset, recursive, {"encryption": str})
+            for dataset in list_datasets_with_properties(shell, dataset, recursive, {"encryption": str},
+                                                         cached=True)
         }
     except ExecException as e:
         logger.debug("Encryption not supported on shell %r: %r (exit code = %d)", shell, e.stdout.split("\n")[0],
@@ -584,17 +602,14 @@ def run_replication_steps(step_templates: list[ReplicationStepTemplate], observe
                 raise ReplicationError(message)
 
     plan = []
-    ignored_roots = set()
+    ignored_roots = DatasetTree()
     for i, step_template in enumerate(step_templates):
         is_immediate_target_dataset = i == 0
 
-        ignore = False
-        for ignored_root in ignored_roots:
-            if is_child(step_template.src_dataset, ignored_root):
+        if ancestors := ignored_roots.ancestors(step_template.src_dataset):
+            for ignored_root in ancestors:
                 logger.debug("Not replicating dataset %r because its ancestor %r did not have any snapshots",
                              step_template.src_dataset, ignored_root)
-                ignore = True
-        if ignore:
             continue
 
         src_snapshots = step_template.src_context.datasets[step_template.src_dataset]
@@ -5,6 +5,7 @@ import logging
 
 import isodate
 
+from zettarepl.retention.vectorized import calculate_custom_lifetimes_delete_snapshots, vectorized_retention_enabled
 from zettarepl.scheduler.cron import CronSchedule
 from zettarepl.snapshot.name import ParsedSnapshotName
 
@@ -56,8 +57,9 @@ class SameAsSourceSnapshotRetentionPolicy(TargetSnapshotRetentionPolicy):
                                    now: datetime,
                                    parsed_src_snapshots_names: list[ParsedSnapshotName],
                                    parsed_dst_snapshots_names: list[ParsedSnapshotName]) -> list[str]:
+        parsed_src_snapshots_names_set = set(parsed_src_snapshots_names)
         return [parsed_dst_snapshot.name for parsed_dst_snapshot in parsed_dst_snapshots_names
-                if parsed_dst_snapshot not in parsed_src_snapshots_names]
+                if parsed_dst_snapshot not in parsed_src_snapshots_names_set]
 
 
 CustomSnapshotRetentionPolicyLifetime = namedtuple("CustomSnapshotRetentionPolicy", ["schedule", "lifetime"])
@@ -72,10 +74,21 @@ class CustomSnapshotRetentionPolicy(TargetSnapshotRetentionPolicy):
                                    now: datetime,
                                    parsed_src_snapshots_names: list[ParsedSnapshotName],
                                    parsed_dst_snapshots_names: list[ParsedSnapshotName]) -> list[str]:
+        if (
+            vectorized_retention_enabled() and
+            now.tzinfo is None and
+            all(parsed_dst_snapshot.datetime is not None for parsed_dst_snapshot in parsed_dst_snapshots_names)
+        ):
+            return calculate_custom_lifetimes_delete_snapshots(now, self.lifetime, self.lifetimes,
+                                                               parsed_dst_snapshots_names)
+
+        datetimes = [parsed_dst_snapshot.datetime for parsed_dst_snapshot in parsed_dst_snapshots_names]
+        lifetimes_matches = [lifetime.schedule.should_run_many(datetimes) for lifetime in self.lifetimes]
+
         result = []
-        for parsed_dst_snapshot in parsed_dst_snapshots_names:
-            for lifetime in self.lifetimes:
-                if lifetime.schedule.should_run(parsed_dst_snapshot.datetime):
+        for i, parsed_dst_snapshot in enumerate(parsed_dst_snapshots_names):
+            for lifetime, matches in zip(self.lifetimes, lifetimes_matches):
+                if matches[i]:
                     lifetime = lifetime.lifetime
                     break
             else:
@@ -41,6 +41,16 @@ class BaseReplicationTaskSnapshotOwner(SnapshotOwner):
 
         return naming_schemas
 
+    def get_root_datasets(self) -> list[str] | None:
+        if self.side == BaseReplicationTaskSnapshotOwner.Side.SOURCE:
+            return list(self.replication_task.source_datasets)
+
+        if self.side == BaseReplicationTaskSnapshotOwner.Side.TARGET:
+            return [get_target_dataset(self.replication_task, source_dataset)
+                    for source_dataset in self.replication_task.source_datasets]
+
+        raise ValueError(self.side)
+
     def owns_dataset(self, dataset: str) -> bool:
         if self.side == BaseReplicationTaskSnapshotOwner.Side.SOURCE:
             return replication_task_should_replicate_dataset(self.replication_task, dataset)
@@ -73,16 +83,21 @@ class PendingPushReplicationTaskSnapshotOwner(BaseReplicationTaskSnapshotOwner):
             for dataset, snapshots in self.dst_snapshots.items()
         }
 
+        # `should_retain` is called for each snapshot of the dataset, everything that only depends on the dataset is
+        # calculated once
+        self.datasets_states: dict[
+            str, tuple[bool, set[ParsedSnapshotName], set[ParsedSnapshotName], ParsedSnapshotName | None]
+        ] = {}
+
     def wants_to_delete(self) -> bool:
         return False
 
     def should_retain(self, dataset: str, parsed_snapshot_name: ParsedSnapshotName) -> bool:
-        target_dataset = get_target_dataset(self.replication_task, dataset)
-        parsed_src_snapshots_names = self.parsed_src_snapshots_names.get(dataset, [])
-        parsed_dst_snapshots_names = self.parsed_dst_snapshots_names.get(target_dataset, [])
-        incremental_base = get_parsed_incremental_base(parsed_src_snapshots_names, parsed_dst_snapshots_names)
+        should_replicate, parsed_src_snapshots_names, parsed_dst_snapshots_names, incremental_base = (
+            self._dataset_state(dataset)
+        )
         return (
-            replication_task_should_replicate_dataset(self.replication_task, dataset) and
+            should_replicate and
             (
                 (
                     parsed_snapshot_name in parsed_src_snapshots_names and
@@ -93,6 +108,22 @@ class PendingPushReplicationTaskSnapshotOwner(BaseReplicationTaskSnapshotOwner):
             )
         )
 
+    def _dataset_state(
+        self, dataset: str,
+    ) -> tuple[bool, set[ParsedSnapshotName], set[ParsedSnapshotName], ParsedSnapshotName | None]:
+        if dataset not in self.datasets_states:
+            target_dataset = get_target_dataset(self.replication_task, dataset)
+            parsed_src_snapshots_names = self.parsed_src_snapshots_names.get(dataset, [])
+            parsed_dst_snapshots_names = self.parsed_dst_snapshots_names.get(target_dataset, [])
+            self.datasets_states[dataset] = (
+                replication_task_should_replicate_dataset(self.replication_task, dataset),
+                set(parsed_src_snapshots_names),
+                set(parsed_dst_snapshots_names),
+                get_parsed_incremental_base(parsed_src_snapshots_names, parsed_dst_snapshots_names),
+            )
+
+        return self.datasets_states[dataset]
+
 
 def pending_push_replication_task_snapshot_owners(
     src_snapshots: dict[str, list[str]], shell: Shell,
@@ -101,7 +132,7 @@ def pending_push_replication_task_snapshot_owners(
     if replication_tasks:
         dst_snapshots_queries = replication_tasks_target_datasets_queries(replication_tasks)
         try:
-            dst_snapshots = multilist_snapshots(shell, dst_snapshots_queries)
+            dst_snapshots = multilist_snapshots(shell, dst_snapshots_queries, batch=True)
         except Exception as e:
             logger.error("Failed to list snapshots with %r: %r. Assuming remote has no snapshots", shell, e)
             dst_snapshots = {}
@@ -140,15 +171,20 @@ class ExecutedReplicationTaskSnapshotOwner(BaseReplicationTaskSnapshotOwner):
             for dst_dataset in self.dst_snapshots.keys()
             if replication_task_replicates_target_dataset(replication_task, dst_dataset)
         }
+        # Same as `delete_snapshots` but as sets (built when first needed)
+        self.delete_snapshots_sets: dict[str, set[str]] = {}
 
     def wants_to_delete(self) -> bool:
         return True
 
     def should_retain(self, dataset: str, parsed_snapshot_name: ParsedSnapshotName) -> bool:
-        return (
-            self.owns_dataset(dataset) and
-            parsed_snapshot_name.name not in self.delete_snapshots[dataset]
-        )
+        if not self.owns_dataset(dataset):
+            return False
+
+        if dataset not in self.delete_snapshots_sets:
+            self.delete_snapshots_sets[dataset] = set(self.delete_snapshots[dataset])
+
+        return parsed_snapshot_name.name not in self.delete_snapshots_sets[dataset]
 
 
 def executed_pull_replication_task_snapshot_owner(
@@ -1,10 +1,13 @@
 # -*- coding=utf-8 -*-
+from datetime import timedelta
 import logging
 import re
 
+from zettarepl.dataset.exclude import ExcludeList
 from zettarepl.dataset.relationship import is_child
 from zettarepl.definition.schema import replication_task_validator
 from zettarepl.scheduler.cron import CronSchedule
+from zettarepl.scheduler.spread import parse_spread
 from zettarepl.snapshot.task.task import PeriodicSnapshotTask
 from zettarepl.task import Task
 from zettarepl.transport.create import create_transport
@@ -56,14 +59,15 @@ class ReplicationTask(Task):
                  embed: bool,
                  compressed: bool,
                  retries: int,
-                 logging_level: int) -> None:
+                 logging_level: int,
+                 spread: timedelta = timedelta(0)) -> None:
         self.id = id
         self.direction = direction
         self.transport = transport
         self.source_datasets = source_datasets
         self.target_dataset = target_dataset
         self.recursive = recursive
-        self.exclude = exclude
+        self.exclude = ExcludeList(exclude)
         self.properties = properties
         self.properties_exclude = properties_exclude
         self.properties_override = properties_override
@@ -90,6 +94,7 @@ class ReplicationTask(Task):
         self.compressed = compressed
         self.retries = retries
         self.logging_level = logging_level
+        self.spread = spread
 
     def __repr__(self) -> str:
         return f"<Replication Task {self.id!r}>"
@@ -124,6 +129,7 @@ class ReplicationTask(Task):
         data.setdefault("compressed", False)
         data.setdefault("retries", 5)
         data.setdefault("logging-level", "notset")
+        data.setdefault("spread", "PT0S")
 
         resolved_periodic_snapshot_tasks = []
         for periodic_snapshot_task_id in data["periodic-snapshot-tasks"]:
@@ -277,7 +283,8 @@ class ReplicationTask(Task):
                    data["embed"],
                    data["compressed"],
                    data["retries"],
-                   logging._nameToLevel[data["logging-level"].upper()])
+                   logging._nameToLevel[data["logging-level"].upper()],
+                   parse_spread(data["spread"]))
 
     @classmethod
     def _validate_exclude(cls, data: dict, resolved_periodic_snapshot_tasks: list[PeriodicSnapshotTask]) -> None:
@@ -7,7 +7,9 @@ from zettarepl.snapshot.list import group_snapshots_by_datasets
 from zettarepl.snapshot.name import ParsedSnapshotName, parse_snapshots_names_with_multiple_schemas
 from zettarepl.snapshot.snapshot import Snapshot
 
+from .owners_index import SnapshotOwnersIndex
 from .snapshot_owner import SnapshotOwner
+from .vectorized import calculate_dataset_snapshots_to_remove_vectorized, vectorized_retention_enabled
 
 logger = logging.getLogger(__name__)
 
@@ -15,9 +17,11 @@ __all__ = ["calculate_snapshots_to_remove"]
 
 
 def calculate_snapshots_to_remove(owners: Sequence[SnapshotOwner], snapshots: list[Snapshot]) -> list[Snapshot]:
+    owners_index = SnapshotOwnersIndex(owners)
+
     result = []
     for dataset, dataset_snapshots in group_snapshots_by_datasets(snapshots).items():
-        dataset_owners = [owner for owner in owners if owner.owns_dataset(dataset)]
+        dataset_owners = owners_index.dataset_owners(dataset)
         result.extend([
             Snapshot(dataset, snapshot)
             for snapshot in calculate_dataset_snapshots_to_remove(dataset_owners, dataset, dataset_snapshots)
@@ -27,15 +31,27 @@ def calculate_snapshots_to_remove(owners: Sequence[SnapshotOwner], snapshots: li
 
 def calculate_dataset_snapshots_to_remove(owners: Sequence[SnapshotOwner], dataset: str,
                                           snapshots: list[str]) -> list[str]:
+    owners_naming_schemas = [(owner, owner.get_naming_schemas()) for owner in owners]
+
     try:
         parsed_snapshot_names = parse_snapshots_names_with_multiple_schemas(
             snapshots,
-            set().union(*[owner.get_naming_schemas() for owner in owners])
+            set().union(*[naming_schemas for owner, naming_schemas in owners_naming_schemas])
         )
     except ValueError as e:
         logger.warning("Error parsing snapshot names for dataset %r: %r", dataset, e)
         return []
 
+    # Owners that may own snapshots with each naming schema (owners owning `None` naming schema may own all snapshots)
+    naming_schema_owners = {
+        naming_schema: [owner for owner, naming_schemas in owners_naming_schemas
+                        if {naming_schema, None} & naming_schemas]
+        for naming_schema in {parsed_snapshot_name.naming_schema for parsed_snapshot_name in parsed_snapshot_names}
+    }
+
+    if vectorized_retention_enabled():
+        return calculate_dataset_snapshots_to_remove_vectorized(naming_schema_owners, dataset, parsed_snapshot_names)
+
     newest_snapshot_for_naming_schema: dict[str, ParsedSnapshotName] = {}
     for parsed_snapshot_name in parsed_snapshot_names:
         if parsed_snapshot_name.naming_schema is None:
@@ -59,12 +75,8 @@ def calculate_dataset_snapshots_to_remove(owners: Sequence[SnapshotOwner], datas
     for parsed_snapshot_name in parsed_snapshot_names:
         snapshot_owners = [
             owner
-            for owner in owners
-            if (
-                # Owners owning `None` naming schema may own all snapshots
-                {parsed_snapshot_name.naming_schema, None} & owner.get_naming_schemas() and
-                owner.owns_snapshot(dataset, parsed_snapshot_name)
-            )
+            for owner in naming_schema_owners[parsed_snapshot_name.naming_schema]
+            if owner.owns_snapshot(dataset, parsed_snapshot_name)
         ]
         if (
                 snapshot_owners and
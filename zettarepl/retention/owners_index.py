@@ -0,0 +1,57 @@
+# -*- coding=utf-8 -*-
+from collections.abc import Sequence
+import logging
+
+from .snapshot_owner import SnapshotOwner
+
+logger = logging.getLogger(__name__)
+
+__all__ = ["SnapshotOwnersIndex"]
+
+
+class SnapshotOwnersIndexNode:
+    __slots__ = ("children", "owners")
+
+    def __init__(self) -> None:
+        self.children: dict[str, SnapshotOwnersIndexNode] = {}
+        # Positions of the owners (in the original owners list) whose root datasets end at this node
+        self.owners: list[int] = []
+
+
+class SnapshotOwnersIndex:
+    """
+    Prefix tree of snapshot owners' root datasets. Returns the owners of a dataset checking only the owners whose root
+    datasets are the dataset itself or its parents (and the owners that do not know their root datasets) instead of
+    all the owners.
+    """
+
+    def __init__(self, owners: Sequence[SnapshotOwner]) -> None:
+        self.owners = owners
+        self.root = SnapshotOwnersIndexNode()
+        self.unindexed: list[int] = []
+
+        for i, owner in enumerate(owners):
+            root_datasets = owner.get_root_datasets()
+            if root_datasets is None:
+                self.unindexed.append(i)
+                continue
+
+            for root_dataset in set(root_datasets):
+                node = self.root
+                for component in root_dataset.split("/"):
+                    node = node.children.setdefault(component, SnapshotOwnersIndexNode())
+                node.owners.append(i)
+
+    def dataset_owners(self, dataset: str) -> list[SnapshotOwner]:
+        candidates = list(self.unindexed)
+        node = self.root
+        for component in dataset.split("/"):
+            child = node.children.get(component)
+            if child is None:
+                break
+
+            node = child
+            candidates.extend(node.owners)
+
+        # Same order as in the original owners list
+        return [self.owners[i] for i in sorted(set(candidates)) if self.owners[i].owns_dataset(dataset)]
@@ -12,6 +12,12 @@ class SnapshotOwner:
     def get_naming_schemas(self) -> set[str | None]:
         raise NotImplementedError
 
+    def get_root_datasets(self) -> list[str] | None:
+        """
+        Datasets that `owns_dataset` can only return `True` for (along with their children). `None` if unknown.
+        """
+        return None
+
     def owns_dataset(self, dataset: str) -> bool:
         raise NotImplementedError
 
@@ -20,6 +20,9 @@ class SnapshotRemovalDateSnapshotOwner(SnapshotOwner):
     def get_naming_schemas(self) -> set[str | None]:
         return {None}
 
+    def get_root_datasets(self) -> list[str] | None:
+        return list(self.datasets)
+
     def owns_dataset(self, dataset: str) -> bool:
         return dataset in self.datasets
 
@@ -0,0 +1,214 @@
+# -*- coding=utf-8 -*-
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+import functools
+import logging
+from typing import Any, Sequence
+
+from zettarepl.scheduler.cron import CronSchedule
+from zettarepl.snapshot.name import ParsedSnapshotName
+from zettarepl.snapshot.task.snapshot_owner import PeriodicSnapshotTaskSnapshotOwner
+
+from .snapshot_owner import SnapshotOwner
+
+try:
+    import numpy  # type: ignore[import-not-found,unused-ignore]
+except ImportError:
+    numpy = None  # type: ignore[assignment,unused-ignore]
+
+logger = logging.getLogger(__name__)
+
+__all__ = ["vectorized_retention_options", "vectorized_retention_enabled",
+           "calculate_dataset_snapshots_to_remove_vectorized", "calculate_custom_lifetimes_delete_snapshots"]
+
+EPOCH = datetime(1970, 1, 1)
+MICROSECOND = timedelta(microseconds=1)
+MICROSECONDS_PER_MINUTE = 60 * 1000000
+MINUTES_PER_DAY = 24 * 60
+
+
+class VectorizedRetentionOptions:
+    def __init__(self) -> None:
+        # Calculate retention for the whole dataset at once using NumPy arrays (if NumPy is installed)
+        self.enabled: bool = False
+
+
+vectorized_retention_options = VectorizedRetentionOptions()
+
+
+def vectorized_retention_enabled() -> bool:
+    return vectorized_retention_options.enabled and numpy is not None
+
+
+def calculate_dataset_snapshots_to_remove_vectorized(naming_schema_owners: dict[str | None, list[SnapshotOwner]],
+                                                     dataset: str,
+                                                     parsed_snapshot_names: list[ParsedSnapshotName]) -> list[str]:
+    """
+    Same as `calculate_dataset_snapshots_to_remove`, but computes keep/delete masks for all snapshots with the same
+    naming schema at once. Owners that can't be vectorized are asked about each snapshot one by one.
+    """
+    naming_schema_indexes = defaultdict(list)
+    for i, parsed_snapshot_name in enumerate(parsed_snapshot_names):
+        naming_schema_indexes[parsed_snapshot_name.naming_schema].append(i)
+
+    delete = numpy.zeros(len(parsed_snapshot_names), dtype=bool)
+    for naming_schema, indexes in naming_schema_indexes.items():
+        group = [parsed_snapshot_names[i] for i in indexes]
+        group_delete = _calculate_group_delete_mask(naming_schema_owners[naming_schema], dataset, naming_schema,
+                                                    group)
+
+        # We do not want this behavior for snapshots with unknown naming schema
+        if naming_schema is not None and group_delete.all():
+            newest = int(numpy.argmax(_datetimes_array([
+                _naive_utc(parsed_snapshot_name.parsed_datetime)  # type: ignore[arg-type]
+                for parsed_snapshot_name in group
+            ])))
+            logger.info("Not destroying %r as it is the only snapshot left for naming schema %r",
+                        group[newest].name, naming_schema)
+            group_delete[newest] = False
+
+        delete[indexes] = group_delete
+
+    return [parsed_snapshot_name.name
+            for parsed_snapshot_name, should_delete in zip(parsed_snapshot_names, delete)
+            if should_delete]
+
+
+def calculate_custom_lifetimes_delete_snapshots(now: datetime, lifetime: timedelta, lifetimes: list[Any],
+                                                parsed_dst_snapshots_names: list[ParsedSnapshotName]) -> list[str]:
+    """
+    Vectorized `CustomSnapshotRetentionPolicy.calculate_delete_snapshots`. `lifetimes` are sorted by priority, the
+    first one whose schedule matches the snapshot wins.
+    """
+    datetimes = [parsed_dst_snapshot.datetime for parsed_dst_snapshot in parsed_dst_snapshots_names]
+    epochs = _datetimes_array(datetimes)  # type: ignore[arg-type]
+    minutes = epochs // MICROSECONDS_PER_MINUTE
+
+    lifetimes_array = numpy.full(len(epochs), lifetime // MICROSECOND, dtype=numpy.int64)
+    matched = numpy.zeros(len(epochs), dtype=bool)
+    for custom_lifetime in lifetimes:
+        matches = _schedule_mask(custom_lifetime.schedule, datetimes, minutes)  # type: ignore[arg-type]
+        lifetimes_array[matches & ~matched] = custom_lifetime.lifetime // MICROSECOND
+        matched |= matches
+
+    delete = epochs < _epoch(now) - lifetimes_array
+    return [parsed_dst_snapshot.name
+            for parsed_dst_snapshot, should_delete in zip(parsed_dst_snapshots_names, delete)
+            if should_delete]
+
+
+def _calculate_group_delete_mask(owners: list[SnapshotOwner], dataset: str, naming_schema: str | None,
+                                 group: list[ParsedSnapshotName]) -> Any:
+    minutes = None
+    if naming_schema is not None:
+        minutes = _datetimes_array([
+            parsed_snapshot_name.datetime  # type: ignore[misc]
+            for parsed_snapshot_name in group
+        ]) // MICROSECONDS_PER_MINUTE
+
+    owned = numpy.zeros(len(group), dtype=bool)
+    wanted = numpy.zeros(len(group), dtype=bool)
+    retained = numpy.zeros(len(group), dtype=bool)
+    for owner in owners:
+        owns = _owns_snapshots_mask(owner, dataset, group, minutes)
+        if not owns.any():
+            continue
+
+        owned |= owns
+        if owner.wants_to_delete():
+            wanted |= owns
+        retained |= _should_retain_mask(owner, dataset, group, minutes, owns)
+
+    delete = owned & wanted & ~retained
+    if delete.any():
+        logger.debug("No one of %r retains snapshots %r", owners,
+                     [parsed_snapshot_name.name for parsed_snapshot_name, d in zip(group, delete) if d])
+
+    return delete
+
+
+def _owns_snapshots_mask(owner: SnapshotOwner, dataset: str, group: list[ParsedSnapshotName], minutes: Any) -> Any:
+    if (
+        minutes is not None and
+        isinstance(owner, PeriodicSnapshotTaskSnapshotOwner) and
+        isinstance(owner.periodic_snapshot_task.schedule, CronSchedule)
+    ):
+        return _schedule_mask(owner.periodic_snapshot_task.schedule,
+                              [parsed_snapshot_name.datetime for parsed_snapshot_name in group],  # type: ignore[misc]
+                              minutes)
+
+    return numpy.fromiter((owner.owns_snapshot(dataset, parsed_snapshot_name) for parsed_snapshot_name in group),
+                          dtype=bool, count=len(group))
+
+
+def _should_retain_mask(owner: SnapshotOwner, dataset: str, group: list[ParsedSnapshotName], minutes: Any,
+                        owns: Any) -> Any:
+    if (
+        minutes is not None and
+        isinstance(owner, PeriodicSnapshotTaskSnapshotOwner) and
+        isinstance(owner.periodic_snapshot_task.lifetime, timedelta)
+    ):
+        delete_before = owner.idealized_now - owner.periodic_snapshot_task.lifetime
+        return owns & (minutes * MICROSECONDS_PER_MINUTE > _epoch(delete_before))
+
+    return numpy.fromiter((bool(own) and owner.should_retain(dataset, parsed_snapshot_name)
+                           for own, parsed_snapshot_name in zip(owns, group)),
+                          dtype=bool, count=len(group))
+
+
+def _schedule_mask(schedule: CronSchedule, datetimes: Sequence[datetime], minutes: Any) -> Any:
+    """
+    Vectorized `schedule.should_run_many(datetimes)`. `minutes` are `datetimes` as minutes since epoch.
+    """
+    compiled = schedule.compiled
+    if compiled is None:
+        return numpy.array(schedule.should_run_many(datetimes), dtype=bool)
+
+    days = minutes // MINUTES_PER_DAY
+    months = days.astype("datetime64[D]").astype("datetime64[M]").astype(numpy.int64)
+    day_of_month = days - months.astype("datetime64[M]").astype("datetime64[D]").astype(numpy.int64) + 1
+    # 1970-01-01 is Thursday, cron weekdays start with Sunday
+    day_of_week = (days + 4) % 7
+
+    mask = _bitset_lookup(compiled.minutes_of_day, MINUTES_PER_DAY)[minutes - days * MINUTES_PER_DAY]
+    mask &= _bitset_lookup(compiled.months, 13)[months % 12 + 1]
+
+    day_of_month_matches = _bitset_lookup(compiled.days_of_month, 32)[day_of_month]
+    if compiled.last_day_of_month:
+        next_day_months = (days + 1).astype("datetime64[D]").astype("datetime64[M]").astype(numpy.int64)
+        day_of_month_matches = day_of_month_matches | (next_day_months != months)
+    day_of_week_matches = _bitset_lookup(compiled.days_of_week, 7)[day_of_week]
+    if compiled.day_or:
+        mask &= day_of_month_matches | day_of_week_matches
+    else:
+        mask &= day_of_month_matches & day_of_week_matches
+
+    return mask
+
+
+@functools.lru_cache(maxsize=1024)
+def _bitset_lookup(bitset: int, size: int) -> Any:
+    """
+    Boolean array that has `True` at index `n` if bit `n` of `bitset` is set.
+    """
+    lookup = numpy.array([(bitset >> n) & 1 for n in range(max(size, bitset.bit_length()))], dtype=bool)
+    lookup.flags.writeable = False
+    return lookup
+
+
+def _datetimes_array(datetimes: Sequence[datetime]) -> Any:
+    """
+    Naive `datetimes` as int64 array of microseconds since epoch.
+    """
+    return numpy.array(datetimes, dtype="datetime64[us]").astype(numpy.int64)
+
+
+def _epoch(d: datetime) -> int:
+    return (d - EPOCH) // MICROSECOND
+
+
+def _naive_utc(d: datetime) -> datetime:
+    if d.tzinfo is None:
+        return d
+
+    return d.astimezone(timezone.utc).replace(tzinfo=None)
@@ -1,4 +1,7 @@
 from .clock import *  # noqa: F401
 from .cron import *  # noqa: F401
+from .event_clock import *  # noqa: F401
+from .heap_scheduler import *  # noqa: F401
 from .scheduler import *  # noqa: F401
+from .spread import *  # noqa: F401
 from .tz_clock import *  # noqa: F401
@@ -33,6 +33,11 @@ class Clock:
     def interrupt(self) -> None:
         self.interrupt_event.set()
 
+    def reschedule(self) -> None:
+        """
+        Called when the moment of the next scheduled task might have changed. This clock polls so it does not care.
+        """
+
     def _tick(self) -> datetime | None:
         now = datetime.utcnow()
 
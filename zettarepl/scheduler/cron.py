@@ -1,17 +1,26 @@
 # -*- coding=utf-8 -*-
+from __future__ import annotations
+
+import calendar
+from collections.abc import Iterable
 from datetime import datetime, time, timedelta
+import functools
 import logging
 from typing import Any, Self
 
 import isodate
-from croniter import croniter
+from croniter import croniter, CroniterBadDateError
 
 from zettarepl.definition.schema import schedule_validator
 from zettarepl.utils.datetime import idealized_datetime
 
 logger = logging.getLogger(__name__)
 
-__all__ = ["CronSchedule"]
+__all__ = ["CompiledCronSchedule", "CronSchedule"]
+
+# How far ahead `CronSchedule.next_run` looks before deciding that the schedule never fires (i.e. its begin/end window
+# does not intersect the cron expression). Eight years is enough to reach the next February 29.
+NEXT_RUN_HORIZON = timedelta(days=366 * 8)
 
 
 class CronSchedule:
@@ -36,14 +45,179 @@ class CronSchedule:
         return cls(data["minute"], data["hour"], data["day-of-month"], data["month"], data["day-of-week"],
                    isodate.parse_time(data["begin"]), isodate.parse_time(data["end"]))
 
+    @functools.cached_property
+    def minutes_of_day(self) -> int:
+        """
+        Bitset of minutes of day (`hour * 60 + minute`) that match minute and hour fields and are within begin/end
+        window.
+        """
+        minutes, hours = croniter.expand(self.expr_format)[0][:2]
+
+        minutes_bitset = CompiledCronSchedule._bitset(minutes, range(0, 60))
+        hours_bitset = CompiledCronSchedule._bitset(hours, range(0, 24))
+        minutes_of_day = 0
+        for hour in range(0, 24):
+            if not (hours_bitset >> hour) & 1:
+                continue
+
+            for minute in range(0, 60):
+                if (minutes_bitset >> minute) & 1 and self._is_within_window(time(hour, minute)):
+                    minutes_of_day |= 1 << (hour * 60 + minute)
+
+        return minutes_of_day
+
+    @functools.cached_property
+    def compiled(self) -> CompiledCronSchedule | None:
+        return CompiledCronSchedule.compile(self)
+
     def should_run(self, d: datetime) -> bool:
+        if (compiled := self.compiled) is not None:
+            return compiled.should_run(d)
+
         idealized = idealized_datetime(d)
-        if self.begin < self.end:
-            if not (self.begin <= idealized.time() <= self.end):
-                return False
-        else:
-            if not (idealized.time() >= self.begin or idealized.time() <= self.end):
-                return False
+        if not self._is_within_window(idealized.time()):
+            return False
 
         next_datetime = croniter(self.expr_format, idealized - timedelta(seconds=1)).get_next(datetime)
         return next_datetime == idealized  # type: ignore
+
+    def next_run(self, d: datetime) -> datetime | None:
+        """
+        Returns the first (idealized) moment of time not earlier than `d` for which `should_run` is true, or `None` if
+        there is no such moment within `NEXT_RUN_HORIZON`.
+        """
+        idealized = idealized_datetime(d)
+        limit = idealized + NEXT_RUN_HORIZON
+
+        if self.minutes_of_day == 0:
+            # Begin/end window does not intersect minute/hour fields, the schedule never fires
+            return None
+
+        if (compiled := self.compiled) is not None:
+            return compiled.next_run(idealized, limit)
+
+        iterator = croniter(self.expr_format, idealized - timedelta(seconds=1))
+        while True:
+            try:
+                next_datetime: datetime = iterator.get_next(datetime)
+            except CroniterBadDateError:
+                return None
+
+            if next_datetime > limit:
+                return None
+
+            if self._is_within_window(next_datetime.time()):
+                return next_datetime
+
+    def should_run_many(self, datetimes: Iterable[datetime]) -> list[bool]:
+        if (compiled := self.compiled) is not None:
+            return compiled.should_run_many(datetimes)
+
+        return [self.should_run(d) for d in datetimes]
+
+    def _is_within_window(self, t: time) -> bool:
+        if self.begin < self.end:
+            return self.begin <= t <= self.end
+        else:
+            return t >= self.begin or t <= self.end
+
+
+class CompiledCronSchedule:
+    """
+    `CronSchedule` expression and begin/end window compiled into bitsets: bit `n` of each bitset is set when the
+    corresponding field matches value `n`. Minute, hour and begin/end window are combined into a single bitset indexed
+    by minute of day.
+    """
+
+    def __init__(self, minutes_of_day: int, days_of_month: int, last_day_of_month: bool, months: int,
+                 days_of_week: int, day_or: bool) -> None:
+        self.minutes_of_day = minutes_of_day
+        self.days_of_month = days_of_month
+        self.last_day_of_month = last_day_of_month
+        self.months = months
+        self.days_of_week = days_of_week
+        # Same as in `croniter`: when both day of month and day of week are restricted, either of them should match
+        self.day_or = day_or
+
+    @classmethod
+    def compile(cls, schedule: CronSchedule) -> CompiledCronSchedule | None:
+        """
+        Returns `None` for expressions that can't be represented with bitsets (i.e. `nth` weekday of month).
+        """
+        expanded, nth_weekday_of_month = croniter.expand(schedule.expr_format)
+        if nth_weekday_of_month:
+            return None
+
+        days_of_month, months, days_of_week = expanded[2:]
+
+        return cls(
+            schedule.minutes_of_day,
+            cls._bitset([day for day in days_of_month if day != "l"], range(1, 32)),
+            "l" in days_of_month,
+            cls._bitset(months, range(1, 13)),
+            cls._bitset(days_of_week, range(0, 7)),
+            days_of_month[0] != "*" and days_of_week[0] != "*",
+        )
+
+    @staticmethod
+    def _bitset(values: list[Any], all_values: range) -> int:
+        if values == ["*"]:
+            values = list(all_values)
+
+        bitset = 0
+        for value in values:
+            bitset |= 1 << value
+
+        return bitset
+
+    def should_run(self, d: datetime) -> bool:
+        if not (self.minutes_of_day >> (d.hour * 60 + d.minute)) & 1:
+            return False
+
+        return self._should_run_on_day(d.year, d.month, d.day, d.isoweekday() % 7)
+
+    def should_run_many(self, datetimes: Iterable[datetime]) -> list[bool]:
+        minutes_of_day = self.minutes_of_day
+        should_run_on_day = functools.lru_cache(maxsize=None)(self._should_run_on_day)
+        return [
+            bool((minutes_of_day >> (d.hour * 60 + d.minute)) & 1) and
+            should_run_on_day(d.year, d.month, d.day, d.isoweekday() % 7)
+            for d in datetimes
+        ]
+
+    def next_run(self, d: datetime, limit: datetime) -> datetime | None:
+        """
+        Same as `CronSchedule.next_run` for an idealized `d`, but steps day by day instead of iterating over every
+        moment that matches the cron expression.
+        """
+        day = d.replace(hour=0, minute=0)
+        first_minute_of_day = d.hour * 60 + d.minute
+        while day <= limit:
+            if self._should_run_on_day(day.year, day.month, day.day, day.isoweekday() % 7):
+                minutes_of_day = self.minutes_of_day >> first_minute_of_day
+                if minutes_of_day:
+                    # Index of the lowest set bit
+                    minute_of_day = first_minute_of_day + (minutes_of_day & -minutes_of_day).bit_length() - 1
+                    next_datetime = day.replace(hour=minute_of_day // 60, minute=minute_of_day % 60)
+                    if next_datetime > limit:
+                        return None
+
+                    return next_datetime
+
+            day += timedelta(days=1)
+            first_minute_of_day = 0
+
+        return None
+
+    def _should_run_on_day(self, year: int, month: int, day: int, day_of_week: int) -> bool:
+        if not (self.months >> month) & 1:
+            return False
+
+        day_of_month_matches = bool((self.days_of_month >> day) & 1) or (
+            self.last_day_of_month and day == calendar.monthrange(year, month)[1]
+        )
+        day_of_week_matches = bool((self.days_of_week >> day_of_week) & 1)
+        if self.day_or:
+            return day_of_month_matches or day_of_week_matches
+        else:
+            return day_of_month_matches and day_of_week_matches
@@ -0,0 +1,88 @@
+# -*- coding=utf-8 -*-
+from collections.abc import Callable
+from datetime import datetime, timedelta
+import logging
+import time
+
+from zettarepl.scheduler.clock import Clock
+
+logger = logging.getLogger(__name__)
+
+__all__ = ["EventClock"]
+
+# Difference between wall clock and monotonic clock elapsed times that is considered a wall clock step
+WALL_CLOCK_STEP_THRESHOLD = 1
+
+
+class EventClock(Clock):
+    """
+    A `Clock` that, instead of polling, sleeps until the moment returned by `next_wakeup` (usually the moment the
+    scheduler's next task is due) or until interrupted. Sleeps never exceed `max_sleep` seconds so that wall clock
+    steps (that `threading.Event.wait` does not notice as it uses the monotonic clock) are detected in a timely manner.
+    """
+
+    def __init__(self, once: bool = False, max_sleep: float = 900) -> None:
+        super().__init__(once)
+
+        self.max_sleep = max_sleep
+        # Accepts current UTC time, returns the UTC moment the clock should wake up at (or `None` if nothing is
+        # scheduled). Without it, the clock wakes up at the beginning of each minute.
+        self.next_wakeup: Callable[[datetime], datetime | None] | None = None
+
+        self.monotonic: float = time.monotonic()
+        self.interrupt_requested: bool = False
+        self.reschedule_requested: bool = False
+
+    def interrupt(self) -> None:
+        self.interrupt_requested = True
+        super().interrupt()
+
+    def reschedule(self) -> None:
+        self.reschedule_requested = True
+        self.interrupt_event.set()
+
+    def _tick(self) -> datetime | None:
+        now = datetime.utcnow()
+        monotonic = time.monotonic()
+
+        try:
+            drift = (now - self.now).total_seconds() - (monotonic - self.monotonic)
+            if abs(drift) > WALL_CLOCK_STEP_THRESHOLD:
+                logger.warning("Wall clock has stepped by %.3f seconds (%r -> %r)", drift, self.now, now)
+
+            if now < self.now:
+                logger.warning("Time has stepped back (%r -> %r)", self.now, now)
+                return None
+
+            if self._minutetuple(self.now) == self._minutetuple(now):
+                if self.interrupt_event.wait(self._sleep_duration(now)):
+                    self.interrupt_event.clear()
+                    self.reschedule_requested = False
+                    if self.interrupt_requested:
+                        logger.info("Interrupted")
+                        self.interrupt_requested = False
+                        try:
+                            return now
+                        finally:
+                            # To resume from the same moment next time
+                            now = self.now
+                            monotonic = self.monotonic
+
+                return None
+
+            return now
+        finally:
+            self.now = now
+            self.monotonic = monotonic
+
+    def _sleep_duration(self, now: datetime) -> float:
+        next_minute_begin = (now + timedelta(minutes=1)).replace(second=0, microsecond=0)
+
+        if self.next_wakeup is None:
+            wakeup = next_minute_begin
+        else:
+            wakeup = self.next_wakeup(now) or now + timedelta(seconds=self.max_sleep)
+            # We won't tick twice during the same minute anyway
+            wakeup = max(wakeup, next_minute_begin)
+
+        return min(self.max_sleep, (wakeup - now).total_seconds())
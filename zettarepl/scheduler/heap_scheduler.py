@@ -0,0 +1,161 @@
+# -*- coding=utf-8 -*-
+from __future__ import annotations
+
+from collections.abc import Generator
+from datetime import datetime, timedelta
+import heapq
+import itertools
+import logging
+import threading
+
+from zettarepl.scheduler.clock import Clock
+from zettarepl.scheduler.scheduler import Scheduler, SchedulerResult
+from zettarepl.scheduler.tz_clock import TzClock
+from zettarepl.task import Task
+from zettarepl.utils.datetime import idealized_datetime
+
+logger = logging.getLogger(__name__)
+
+__all__ = ["HeapScheduler"]
+
+
+class HeapScheduler(Scheduler):
+    """
+    A `Scheduler` that computes each task's next fire time once and keeps tasks in a min-heap keyed on it, so a tick
+    only touches the tasks that are due instead of evaluating every task schedule.
+    """
+
+    def __init__(self, clock: Clock, tz_clock: TzClock) -> None:
+        super().__init__(clock, tz_clock)
+
+        self.heap_lock: threading.Lock = threading.Lock()
+        self.heap: list[tuple[datetime, int, Task]] = []
+        self.heap_counter: itertools.count[int] = itertools.count()
+        # `id(task)` -> sequence number of its only valid heap entry. Entries with other sequence numbers are stale
+        # and are discarded when popped.
+        self.heap_entries: dict[int, int] = {}
+        # `id(task)` -> task position in `self.tasks`, so that due tasks are returned in the same order as `Scheduler`
+        # would return them.
+        self.tasks_positions: dict[int, int] = {}
+        self.heap_now: datetime = idealized_datetime(self.tz_clock.now_naive)
+
+    def set_tasks(self, tasks: list[Task]) -> None:
+        with self.heap_lock:
+            self.tasks = tasks
+            self.tasks_positions = {id(task): i for i, task in enumerate(tasks)}
+
+            for task_id in list(self.heap_entries.keys()):
+                if task_id not in self.tasks_positions:
+                    self.heap_entries.pop(task_id)
+
+            for task in tasks:
+                if id(task) not in self.heap_entries:
+                    self._push(task, self.heap_now)
+
+            # Do not let stale entries pile up when tasks are frequently replaced
+            if len(self.heap) > 2 * len(self.heap_entries) + 64:
+                self.heap = [entry for entry in self.heap if self._is_valid(entry)]
+                heapq.heapify(self.heap)
+
+        self.clock.reschedule()
+
+    def next_run_utc(self, utcnow: datetime) -> datetime | None:
+        """
+        Returns the earliest UTC moment at which a task might be due (`None` if no task will ever run). It can be
+        earlier than the actual moment (e.g. around DST offset changes) but is never later.
+        """
+        with self.heap_lock:
+            while self.heap and not self._is_valid(self.heap[0]):
+                heapq.heappop(self.heap)
+
+            if not self.heap:
+                return None
+
+            next_run = self.heap[0][0]
+
+        # `next_run` is in local time. UTC offset at that moment might be different from the current one, so we also
+        # try the offset that will be in effect at the moment we get using the current offset.
+        now = utcnow + self.tz_clock.utcoffset(utcnow)
+        candidates = {next_run - self.tz_clock.utcoffset(utcnow)}
+        candidates.add(next_run - self.tz_clock.utcoffset(min(candidates)))
+
+        # The candidate is good if at that moment local time has reached `next_run` (it might be later than `next_run`
+        # if `next_run` does not exist due to DST offset change) or if local time has stepped back by that moment
+        # (then we must wake up to repeat the tasks scheduled for the minutes we are going to see again).
+        good_candidates = []
+        for candidate in candidates:
+            local = candidate + self.tz_clock.utcoffset(candidate)
+            if local >= next_run or (candidate > utcnow and local < now):
+                good_candidates.append(candidate)
+
+        return min(good_candidates or candidates)
+
+    def schedule(self) -> Generator[SchedulerResult, None, None]:
+        while True:
+            utcnow = self.clock.tick()
+            if utcnow is None:
+                break
+
+            now = self.tz_clock.tick(utcnow)
+
+            tasks = []
+            interrupted = False
+            with self.interrupt_lock:
+                if self.interrupt_tasks:
+                    tasks = self.interrupt_tasks
+                    interrupted = True
+                    self.interrupt_tasks = []
+
+            if not interrupted:
+                # Only add these tasks if not interrupted. The interruption event will always arrive after the natural
+                # `tick()` event.
+                tasks = self._pop_due_tasks(idealized_datetime(now.datetime))
+
+            yield SchedulerResult(now, tasks, interrupted)
+
+    def _pop_due_tasks(self, now: datetime) -> list[Task]:
+        with self.heap_lock:
+            if now < self.heap_now:
+                # Local time has stepped back (e.g. DST offset change). Minutes that we have already seen will be seen
+                # again and `Scheduler` would run tasks scheduled for them again, so we must do the same.
+                logger.debug("Local time has stepped back (%r -> %r), rebuilding schedule", self.heap_now, now)
+                self._rebuild(now)
+
+            self.heap_now = now
+
+            tasks = []
+            while self.heap and self.heap[0][0] <= now:
+                entry = heapq.heappop(self.heap)
+                if not self._is_valid(entry):
+                    continue
+
+                next_run, _, task = entry
+                if next_run == now:
+                    tasks.append(task)
+                    self._push(task, now + timedelta(minutes=1))
+                else:
+                    # The clock has jumped over that minute, and `Scheduler` would not have run the task either.
+                    # The task might still be due right now.
+                    self._push(task, now)
+
+            return sorted(tasks, key=lambda task: self.tasks_positions[id(task)])
+
+    def _rebuild(self, now: datetime) -> None:
+        self.heap = []
+        self.heap_entries = {}
+        for task in self.tasks:
+            self._push(task, now)
+
+    def _push(self, task: Task, not_before: datetime) -> None:
+        seq = next(self.heap_counter)
+        self.heap_entries[id(task)] = seq
+
+        next_run = task.schedule.next_run(not_before)
+        if next_run is None:
+            logger.debug("Task %r will never run", task)
+            return
+
+        heapq.heappush(self.heap, (next_run, seq, task))
+
+    def _is_valid(self, entry: tuple[datetime, int, Task]) -> bool:
+        return self.heap_entries.get(id(entry[2])) == entry[1]
@@ -0,0 +1,33 @@
+# -*- coding=utf-8 -*-
+from datetime import timedelta
+import logging
+import zlib
+
+import isodate
+
+logger = logging.getLogger(__name__)
+
+__all__ = ["parse_spread", "spread_offset"]
+
+
+def parse_spread(value: str) -> timedelta:
+    spread = isodate.parse_duration(value)
+    if not isinstance(spread, timedelta):
+        raise ValueError("spread can't be specified in months or years")
+
+    if spread < timedelta(0):
+        raise ValueError("spread can't be negative")
+
+    return spread
+
+
+def spread_offset(id: str, spread: timedelta) -> timedelta:
+    """
+    Returns deterministic (the same across restarts and for all processes) offset in `[0, spread)` interval for a task
+    with the specified `id`.
+    """
+    milliseconds = int(spread.total_seconds() * 1000)
+    if milliseconds <= 0:
+        return timedelta(0)
+
+    return timedelta(milliseconds=zlib.crc32(id.encode("utf-8")) % milliseconds)
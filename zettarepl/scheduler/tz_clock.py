@@ -1,6 +1,6 @@
 # -*- coding=utf-8 -*-
 from collections import namedtuple
-from datetime import datetime, tzinfo
+from datetime import datetime, timedelta, tzinfo
 import logging
 
 import pytz
@@ -39,5 +39,8 @@ class TzClock:
             self.now = now
             self.now_naive = now_naive
 
+    def utcoffset(self, utcnow: datetime) -> timedelta:
+        return self._calculate_now(utcnow).utcoffset()  # type: ignore[return-value]
+
     def _calculate_now(self, utcnow: datetime) -> datetime:
         return utcnow.replace(tzinfo=pytz.UTC).astimezone(self.timezone)
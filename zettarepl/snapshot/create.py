@@ -1,5 +1,6 @@
 # -*- coding=utf-8 -*-
-import io
+from collections import defaultdict
+import errno
 import logging
 import os
 import re
@@ -7,16 +8,25 @@ import typing
 
 
 from zettarepl.transport.interface import *
-from zettarepl.transport.utils import put_buffer
+from zettarepl.transport.utils import forget_put_file, put_file
 from zettarepl.dataset.list import list_datasets
 from zettarepl.dataset.exclude import should_exclude
-from zettarepl.zcp.render_zcp import render_zcp
+from zettarepl.dataset.relationship import NOT_NORMALIZED_NAME, is_child
+from zettarepl.zcp.render_zcp import ZCP_PROGRAM, ZcpSnapshot, fnmatch_to_lua_pattern, render_zcp_args
 
+from .destroy import ARG_MAX
+from .inventory import snapshot_inventories
 from .snapshot import Snapshot
 
 logger = logging.getLogger(__name__)
 
-__all__ = ["CreateSnapshotError", "create_snapshot"]
+__all__ = ["CreateSnapshotError", "SnapshotToCreate", "create_snapshot", "create_snapshots"]
+
+PROPERTIES_NOT_SUPPORTED = "setting snapshot properties is not supported"
+# Default channel program limits (10 million instructions and 10 MB of memory) are not enough to snapshot many
+# datasets at once. These are the maximums allowed by default `zfs_lua_max_instrlimit` and `zfs_lua_max_memlimit`.
+ZCP_INSTRUCTION_LIMIT = 100000000
+ZCP_MEMORY_LIMIT = 100 * 1024 * 1024
 
 
 class CreateSnapshotError(Exception):
@@ -53,6 +63,13 @@ class CreateSnapshotError(Exception):
         return "\n".join(lines) + "\n"
 
 
+class SnapshotToCreate(typing.NamedTuple):
+    snapshot: Snapshot
+    recursive: bool
+    exclude_rules: list[str]
+    properties: dict[str, str]
+
+
 def iterate_excluded_datasets(exclude_rules: list[str], datasets: typing.Iterable[str]) -> typing.Iterator[str]:
     for dataset in datasets:
         if should_exclude(dataset, exclude_rules):
@@ -63,33 +80,41 @@ def create_snapshot(shell: Shell, snapshot: Snapshot, recursive: bool,
                     exclude_rules: list[str], properties: dict[str, str]) -> None:
     logger.info("On %r creating %s snapshot %r", shell, "recursive" if recursive else "non-recursive", snapshot)
 
-    if exclude_rules:
-        # TODO: support adding properties to snapshots created by channel program
+    try:
+        _create_snapshot(shell, snapshot, recursive, exclude_rules, properties)
+    finally:
+        # Even if the creation has failed, some of the snapshots might have been created
+        snapshot_inventories.invalidate(shell, snapshot.dataset, recursive)
 
+
+def _create_snapshot(shell: Shell, snapshot: Snapshot, recursive: bool,
+                     exclude_rules: list[str], properties: dict[str, str]) -> None:
+    if exclude_rules:
         pool_name = snapshot.dataset.split("/")[0]
 
-        snapshot_program = io.BytesIO()
-        render_zcp(
-            snapshot_program,
-            snapshot.dataset,
-            snapshot.name,
-            iterate_excluded_datasets(exclude_rules, list_datasets(shell, snapshot.dataset, recursive)),
-        )
-        program = put_buffer(snapshot_program, "recursive_snapshot_exclude.lua", shell)
+        # Channel programs can only set user properties
+        user_properties = {k: v for k, v in properties.items() if ":" in k}
+        if user_properties != properties:
+            logger.warning("Unable to set non-user properties %r for snapshot %r created with exclude rules",
+                           sorted(set(properties) - set(user_properties)), snapshot)
 
-        args = ["zfs", "program", pool_name, program]
+        zcp_snapshot = get_zcp_snapshot(shell, SnapshotToCreate(snapshot, True, exclude_rules, user_properties))
 
         try:
-            shell.exec(args)
+            try:
+                exec_snapshot_program(shell, pool_name, [zcp_snapshot])
+            except ExecException as e:
+                if not (zcp_snapshot.properties and PROPERTIES_NOT_SUPPORTED in e.stdout):
+                    raise
+
+                logger.warning("Setting snapshot properties using channel programs is not supported on %r, "
+                               "creating snapshot %r without properties", shell, snapshot)
+                exec_snapshot_program(shell, pool_name, [zcp_snapshot._replace(properties={})])
         except ExecException as e:
             logger.debug(e)
             snapshots_errors = []
             for snapshot_name, error in re.findall(r"snapshot=(.+?) error=([0-9]+)", e.stdout):
-                snapshot_error = os.strerror(int(error))
-                if snapshot_error == "File exists":
-                    snapshot_error = "snapshot already exists"
-
-                snapshots_errors.append((Snapshot(*snapshot_name.split("@", 1)), snapshot_error))
+                snapshots_errors.append((Snapshot(*snapshot_name.split("@", 1)), zcp_snapshot_error(int(error))))
             if snapshots_errors:
                 raise CreateSnapshotError("no snapshots were created", snapshots_errors) from None
             else:
@@ -119,3 +144,224 @@ def create_snapshot(shell: Shell, snapshot: Snapshot, recursive: bool,
             raise CreateSnapshotError(error.strip(), snapshots_errors) from None
 
     return
+
+
+def create_snapshots(shell: Shell, snapshots: list[SnapshotToCreate]) -> list[CreateSnapshotError | None]:
+    """
+    Creates snapshots in order using one channel program for each pool (so that all snapshots of the pool are created
+    in a single transaction group). Snapshots of the same dataset are created by subsequent programs. Each snapshot
+    (with all its recursive children) is still created atomically.
+    Returns an error (or `None` on success) for each snapshot.
+    """
+    results: list[CreateSnapshotError | None] = [None] * len(snapshots)
+
+    pools = defaultdict(list)
+    sequential = []
+    for i, snapshot in enumerate(snapshots):
+        if any(":" not in property for property in snapshot.properties):
+            # Channel programs can only set user properties
+            sequential.append(i)
+        else:
+            pools[snapshot.snapshot.dataset.split("/")[0]].append(i)
+
+    for pool_name, pool_indexes in pools.items():
+        programs = split_intersecting_snapshots([snapshots[i] for i in pool_indexes])
+        for n, program in enumerate(programs):
+            indexes = [pool_indexes[j] for j in program]
+            logger.info("On %r creating %d snapshots on pool %r", shell, len(indexes), pool_name)
+
+            try:
+                errors = _create_pool_snapshots(shell, pool_name, [snapshots[i] for i in indexes])
+            finally:
+                for i in indexes:
+                    snapshot_inventories.invalidate(shell, snapshots[i].snapshot.dataset, snapshots[i].recursive)
+
+            if errors is None:
+                logger.info("Setting snapshot properties using channel programs is not supported on %r, creating "
+                            "snapshots one by one", shell)
+                sequential.extend(pool_indexes[j] for program in programs[n:] for j in program)
+                break
+
+            for i, error in zip(indexes, errors):
+                results[i] = error
+
+    for i in sorted(sequential):
+        try:
+            create_snapshot(shell, snapshots[i].snapshot, snapshots[i].recursive, snapshots[i].exclude_rules,
+                            snapshots[i].properties)
+        except CreateSnapshotError as e:
+            results[i] = e
+
+    return results
+
+
+def split_intersecting_snapshots(snapshots: list[SnapshotToCreate]) -> list[list[int]]:
+    """
+    Splits snapshots (returning their indexes) into consecutive channel programs so that no program snapshots the same
+    dataset twice: ZFS refuses to create more than one snapshot of a dataset in a single transaction group. Snapshots
+    are still created in order as each one goes after all the programs that contain intersecting snapshots.
+    """
+    programs: list[list[int]] = []
+    for i, snapshot in enumerate(snapshots):
+        n = max(
+            (
+                n + 1
+                for n, program in enumerate(programs)
+                if any(snapshots_intersect(snapshot, snapshots[j]) for j in program)
+            ),
+            default=0,
+        )
+        if n == len(programs):
+            programs.append([])
+        programs[n].append(i)
+
+    return programs
+
+
+def snapshots_intersect(s1: SnapshotToCreate, s2: SnapshotToCreate) -> bool:
+    # Exclude rules are not taken into account, so this might give false positives
+    return (
+        s1.snapshot.dataset == s2.snapshot.dataset or
+        (s1.recursive and is_child(s2.snapshot.dataset, s1.snapshot.dataset)) or
+        (s2.recursive and is_child(s1.snapshot.dataset, s2.snapshot.dataset))
+    )
+
+
+def _create_pool_snapshots(shell: Shell, pool_name: str,
+                           snapshots: list[SnapshotToCreate]) -> list[CreateSnapshotError | None] | None:
+    results: list[CreateSnapshotError | None] = [None] * len(snapshots)
+
+    zcp_snapshots = []
+    indexes = []
+    for i, snapshot in enumerate(snapshots):
+        try:
+            zcp_snapshot = get_zcp_snapshot(shell, snapshot)
+        except ExecException as e:
+            results[i] = CreateSnapshotError(e.stdout.strip(), [])
+            continue
+
+        zcp_snapshots.append(zcp_snapshot)
+        indexes.append(i)
+
+    for chunk in _zcp_snapshots_chunks(zcp_snapshots, ARG_MAX):
+        chunk_zcp_snapshots = [zcp_snapshots[j] for j in chunk]
+        try:
+            exec_snapshot_program(shell, pool_name, chunk_zcp_snapshots)
+        except ExecException as e:
+            logger.debug(e)
+            if PROPERTIES_NOT_SUPPORTED in e.stdout:
+                return None
+
+            snapshots_errors = defaultdict(list)
+            for task, snapshot_name, error in re.findall(r"task=([0-9]+) snapshot=(.+?) error=([0-9]+)", e.stdout):
+                snapshots_errors[int(task) - 1].append((Snapshot(*snapshot_name.split("@", 1)),
+                                                        zcp_snapshot_error(int(error))))
+
+            if snapshots_errors:
+                for task, j in enumerate(chunk):
+                    if task in snapshots_errors:
+                        results[indexes[j]] = CreateSnapshotError("no snapshots were created", snapshots_errors[task])
+            else:
+                # The program might have failed midway (i.e. hitting one of its limits) after creating some of the
+                # snapshots
+                existing_snapshots = _list_existing_snapshots(shell, [
+                    Snapshot(zcp_snapshot.dataset, zcp_snapshot.snapshot_name)
+                    for zcp_snapshot in chunk_zcp_snapshots
+                ])
+                for zcp_snapshot, j in zip(chunk_zcp_snapshots, chunk):
+                    if Snapshot(zcp_snapshot.dataset, zcp_snapshot.snapshot_name) not in existing_snapshots:
+                        results[indexes[j]] = CreateSnapshotError(e.stdout.strip(), [])
+
+    return results
+
+
+def _zcp_snapshots_chunks(zcp_snapshots: list[ZcpSnapshot], max_len: int) -> list[list[int]]:
+    """
+    Splits snapshots (returning their indexes) into consecutive channel programs so that the arguments of each of them
+    fit into `max_len`.
+    """
+    chunks: list[list[int]] = []
+    sum_len = 0
+    for i, zcp_snapshot in enumerate(zcp_snapshots):
+        length = sum(len(arg) + 1 for arg in render_zcp_args([zcp_snapshot]))
+        if not chunks or sum_len + length >= max_len:
+            chunks.append([])
+            sum_len = 0
+
+        chunks[-1].append(i)
+        sum_len += length
+
+    return chunks
+
+
+def _list_existing_snapshots(shell: Shell, snapshots: list[Snapshot]) -> set[Snapshot]:
+    try:
+        output = shell.exec(["zfs", "list", "-t", "snapshot", "-H", "-o", "name"] + list(map(str, snapshots)))
+    except ExecException as e:
+        # Nonexistent snapshots are reported, the existing ones are still listed
+        output = e.stdout
+
+    return {
+        Snapshot(*line.split("@", 1))
+        for line in output.split("\n")
+        if "@" in line and not line.startswith("cannot open")
+    }
+
+
+def get_zcp_snapshot(shell: Shell, snapshot: SnapshotToCreate) -> ZcpSnapshot:
+    """
+    Exclude rules are evaluated by the channel program itself. Datasets are only listed for the rules that can't be
+    passed to it (non-normalized dataset names or glob patterns that can't be translated to Lua patterns).
+    """
+    recursive = snapshot.recursive
+    excluded_datasets = []
+    excluded_patterns = []
+    other_exclude_rules = []
+    if recursive:
+        for exclude_rule in snapshot.exclude_rules:
+            if re.search(r"[*?\[]", exclude_rule):
+                pattern = fnmatch_to_lua_pattern(exclude_rule)
+                if pattern is not None:
+                    excluded_patterns.append(pattern)
+                    continue
+            elif not NOT_NORMALIZED_NAME.search(exclude_rule):
+                if is_child(snapshot.snapshot.dataset, exclude_rule):
+                    # All children are excluded
+                    recursive = False
+                else:
+                    excluded_datasets.append(exclude_rule)
+                continue
+
+            other_exclude_rules.append(exclude_rule)
+
+    if recursive and other_exclude_rules:
+        excluded_datasets.extend(iterate_excluded_datasets(
+            other_exclude_rules,
+            list_datasets(shell, snapshot.snapshot.dataset, True, cached=True),
+        ))
+
+    return ZcpSnapshot(snapshot.snapshot.dataset, snapshot.snapshot.name, recursive, excluded_datasets,
+                       excluded_patterns, snapshot.properties)
+
+
+def exec_snapshot_program(shell: Shell, pool_name: str, zcp_snapshots: list[ZcpSnapshot]) -> None:
+    program = put_file(ZCP_PROGRAM, shell)
+    limits = ["-t", str(ZCP_INSTRUCTION_LIMIT), "-m", str(ZCP_MEMORY_LIMIT)]
+    args = render_zcp_args(zcp_snapshots)
+    try:
+        shell.exec(["zfs", "program"] + limits + [pool_name, program] + args)
+    except ExecException as e:
+        if f"cannot open '{program}'" not in e.stdout:
+            raise
+
+        logger.info("Channel program %r was removed from %r, uploading it again", program, shell)
+        forget_put_file(program, shell)
+        program = put_file(ZCP_PROGRAM, shell)
+        shell.exec(["zfs", "program"] + limits + [pool_name, program] + args)
+
+
+def zcp_snapshot_error(error: int) -> str:
+    if error == errno.EEXIST:
+        return "snapshot already exists"
+
+    return os.strerror(error)
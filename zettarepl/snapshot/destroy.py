@@ -1,63 +1,307 @@
 # -*- coding=utf-8 -*-
+from concurrent.futures import ThreadPoolExecutor
+import errno
 import re
 import logging
+import threading
+import time
 
 from zettarepl.transport.interface import ExecException, Shell
+from zettarepl.transport.utils import forget_put_file, put_file
 from zettarepl.utils.itertools import sortedgroupby
+from zettarepl.zcp.render_zcp import ZCP_DESTROY_PROGRAM
 
+from .inventory import snapshot_inventories
+from .list import list_snapshots
 from .snapshot import Snapshot
 
 logger = logging.getLogger(__name__)
 
-__all__ = ["destroy_snapshots"]
+__all__ = ["destroy_snapshots", "destroy_snapshots_options"]
 
 ARG_MAX = 262000  # FreeBSD, on Linux it is even higher
 MAX_BATCH_SIZE = 100  # Deleting too many snapshots at once can cause performance issues
+# Adaptive batch size bounds and the desired duration of one `zfs destroy` command (in seconds)
+ADAPTIVE_MIN_BATCH_SIZE = 10
+ADAPTIVE_MAX_BATCH_SIZE = 1000
+ADAPTIVE_TARGET_DURATION = 60
+# Snapshots are only listed in `createtxg` order to compress runs of them into ranges if there are that many of them
+# to destroy on one dataset
+RANGES_MIN_SNAPSHOTS = 10
 
 
-def destroy_snapshots(shell: Shell, snapshots: list[Snapshot]) -> None:
-    for dataset, snapshots in sortedgroupby(snapshots, lambda snapshot: snapshot.dataset):
+class DestroySnapshotsOptions:
+    def __init__(self) -> None:
+        # How many pools can have their snapshots destroyed at once
+        self.max_parallel_pools: int = 1
+        # Skip held and cloned snapshots beforehand and adapt batch size to the observed `zfs destroy` duration
+        self.adaptive: bool = False
+        # Destroy runs of consecutive snapshots using `dataset@first%last` syntax
+        self.ranges: bool = False
+        # Destroy all snapshots of the pool using one channel program (so in one transaction group)
+        self.channel_program: bool = False
+
+
+destroy_snapshots_options = DestroySnapshotsOptions()
+
+
+class BatchSize:
+    def __init__(self, adaptive: bool) -> None:
+        self.adaptive = adaptive
+        self.size = MAX_BATCH_SIZE
+
+    def update(self, count: int, duration: float) -> None:
+        if not self.adaptive:
+            return
+
+        if duration > 0:
+            size = int(ADAPTIVE_TARGET_DURATION * count / duration)
+        else:
+            size = ADAPTIVE_MAX_BATCH_SIZE
+
+        # Do not let one fast command inflate the batch size too much
+        self.size = max(ADAPTIVE_MIN_BATCH_SIZE, min(size, 2 * self.size, ADAPTIVE_MAX_BATCH_SIZE))
+
+
+def destroy_snapshots(shell: Shell, snapshots: list[Snapshot], defer: bool = False) -> None:
+    """
+    With `defer`, snapshots that can't be destroyed right now (i.e. held ones) are marked for deferred destruction
+    (`zfs destroy -d`).
+    """
+    adaptive = destroy_snapshots_options.adaptive
+    ranges = destroy_snapshots_options.ranges
+    channel_program = destroy_snapshots_options.channel_program
+
+    # Deferred destruction is what should happen to held and cloned snapshots
+    if adaptive and snapshots and not defer:
+        skipped_snapshots = get_held_or_cloned_snapshots(shell, snapshots)
+        for (dataset, reason), skipped in sortedgroupby(skipped_snapshots.items(), lambda v: (v[0].dataset, v[1])):
+            logger.info("Snapshots %r on dataset %r are %s, skipping", [snapshot.name for snapshot, _ in skipped],
+                        dataset, reason)
+
+        snapshots = [snapshot for snapshot in snapshots if snapshot not in skipped_snapshots]
+
+    datasets = sortedgroupby(snapshots, lambda snapshot: snapshot.dataset)
+    pools = sortedgroupby(datasets, lambda v: v[0].split("/")[0])
+    if destroy_snapshots_options.max_parallel_pools > 1 and len(pools) > 1:
+        # Each pool has its own transaction groups, so destroying snapshots on different pools at once does not make
+        # them compete with each other
+        with ThreadPoolExecutor(min(destroy_snapshots_options.max_parallel_pools, len(pools)),
+                                thread_name_prefix=f"{threading.current_thread().name}.destroy") as executor:
+            futures = [
+                executor.submit(_destroy_pool_snapshots, shell, pool, pool_datasets, adaptive, ranges, defer,
+                                channel_program)
+                for pool, pool_datasets in pools
+            ]
+            for future in futures:
+                future.result()
+    else:
+        for pool, pool_datasets in pools:
+            _destroy_pool_snapshots(shell, pool, pool_datasets, adaptive, ranges, defer, channel_program)
+
+
+def get_held_or_cloned_snapshots(shell: Shell, snapshots: list[Snapshot]) -> dict[Snapshot, str]:
+    result = {}
+    for chunk in _chunks(list(map(str, sorted(snapshots))), ARG_MAX):
+        try:
+            output = shell.exec(["zfs", "get", "-H", "-p", "-o", "name,property,value", "userrefs,clones"] + chunk)
+        except ExecException as e:
+            # I.e. some of the snapshots were already destroyed. Errors will be handled when destroying them.
+            logger.warning("Failed to check if snapshots are held or cloned: %r", e)
+            continue
+
+        for line in filter(None, output.split("\n")):
+            name, property, value = line.split("\t", 2)
+            if property == "userrefs" and value not in ("0", "-"):
+                result[Snapshot(*name.split("@", 1))] = "held"
+            elif property == "clones" and value not in ("", "-"):
+                result[Snapshot(*name.split("@", 1))] = "cloned"
+
+    return result
+
+
+def _chunks(args: list[str], max_len: int) -> list[list[str]]:
+    chunks: list[list[str]] = []
+    sum_len = 0
+    for arg in args:
+        if not chunks or sum_len + len(arg) + 1 >= max_len:
+            chunks.append([])
+            sum_len = 0
+
+        chunks[-1].append(arg)
+        sum_len += len(arg) + 1
+
+    return chunks
+
+
+def _destroy_pool_snapshots(shell: Shell, pool: str, datasets: list[tuple[str, list[Snapshot]]], adaptive: bool,
+                            ranges: bool, defer: bool, channel_program: bool) -> None:
+    if channel_program:
+        names = [str(snapshot) for _, snapshots in datasets for snapshot in snapshots]
+
+        logger.info("On %r for pool %r destroying snapshots %r using channel program", shell, pool, names)
+
+        try:
+            try:
+                _destroy_snapshots_zcp(shell, pool, names, defer)
+                return
+            finally:
+                for dataset, _ in datasets:
+                    snapshot_inventories.invalidate(shell, dataset, False)
+        except ExecException as e:
+            logger.warning("Failed to destroy snapshots on pool %r using channel program, falling back to "
+                           "`zfs destroy`: %r", pool, e)
+
+    _destroy_datasets_snapshots(shell, datasets, adaptive, ranges, defer)
+
+
+def _destroy_snapshots_zcp(shell: Shell, pool: str, names: list[str], defer: bool) -> None:
+    remaining = sorted(names)
+    while remaining:
+        # Arguments of the channel program are still limited
+        chunk = _chunks(remaining, ARG_MAX)[0]
+        try:
+            exec_destroy_program(shell, pool, chunk, defer)
+        except ExecException as e:
+            errors = re.findall(r"snapshot=(.+?) error=([0-9]+)", e.stdout)
+            if not errors:
+                raise
+
+            # No snapshots were destroyed, try again without the ones that can't be destroyed
+            discard_names = set()
+            for name, error in errors:
+                error = int(error)
+                if error == errno.EBUSY:
+                    reason = "busy or held"
+                elif error == errno.EEXIST:
+                    reason = "cloned"
+                else:
+                    raise
+
+                logger.info("Snapshot %r is %s, skipping", name, reason)
+                discard_names.add(name)
+
+            remaining = [name for name in remaining if name not in discard_names]
+            continue
+
+        remaining = remaining[len(chunk):]
+
+
+def exec_destroy_program(shell: Shell, pool: str, names: list[str], defer: bool) -> None:
+    program = put_file(ZCP_DESTROY_PROGRAM, shell)
+    args = ["defer" if defer else "no-defer"] + names
+    try:
+        shell.exec(["zfs", "program", pool, program] + args, timeout=3600)
+    except ExecException as e:
+        if f"cannot open '{program}'" not in e.stdout:
+            raise
+
+        logger.info("Channel program %r was removed from %r, uploading it again", program, shell)
+        forget_put_file(program, shell)
+        program = put_file(ZCP_DESTROY_PROGRAM, shell)
+        shell.exec(["zfs", "program", pool, program] + args, timeout=3600)
+
+
+def _destroy_datasets_snapshots(shell: Shell, datasets: list[tuple[str, list[Snapshot]]], adaptive: bool,
+                                ranges: bool, defer: bool = False) -> None:
+    # Batch size is shared by all datasets of the pool as `zfs destroy` duration depends on the pool mostly
+    batch_size = BatchSize(adaptive)
+    for dataset, snapshots in datasets:
         names = {snapshot.name for snapshot in snapshots}
 
         logger.info("On %r for dataset %r destroying snapshots %r", shell, dataset, names)
 
-        while names:
-            chunk: set[str] = set()
-            sum_len = len(dataset)
-            for name in sorted(names):
-                if len(chunk) >= MAX_BATCH_SIZE:
-                    break
+        try:
+            order = None
+            if ranges and len(names) >= RANGES_MIN_SNAPSHOTS:
+                try:
+                    order = [snapshot.name for snapshot in list_snapshots(shell, dataset, False, "createtxg")]
+                except ExecException as e:
+                    logger.warning("Failed to list snapshots of dataset %r in creation order: %r", dataset, e)
 
-                new_sum_len = sum_len + len(name) + 1
+            _destroy_dataset_snapshots(shell, dataset, names, batch_size, order, defer)
+        finally:
+            snapshot_inventories.invalidate(shell, dataset, False)
+
+
+def get_snapshot_runs(names: set[str], order: list[str] | None) -> list[list[str]]:
+    """
+    Splits `names` into runs of snapshots that are consecutive in `order` (all the snapshots of the dataset sorted by
+    `createtxg`). Snapshots that are not present in `order` (or all of them if it is `None`) form runs of their own.
+    """
+    runs = []
+    if order is not None:
+        run: list[str] = []
+        for name in order:
+            if name in names:
+                run.append(name)
+            elif run:
+                runs.append(run)
+                run = []
+        if run:
+            runs.append(run)
+
+        names = names - set(order)
+
+    runs.extend([name] for name in sorted(names))
+    return runs
+
+
+def _destroy_dataset_snapshots(shell: Shell, dataset: str, names: set[str], batch_size: BatchSize,
+                               order: list[str] | None = None, defer: bool = False) -> None:
+    while names:
+        chunk: set[str] = set()
+        items = []
+        sum_len = len(dataset)
+        for run in get_snapshot_runs(names, order):
+            # Ranges are still limited by batch size as it is the number of snapshots destroyed that matters
+            run = run[:batch_size.size - len(chunk)]
+            if not run:
+                break
+
+            if len(run) > 2:
+                run_items = [(f"{run[0]}%{run[-1]}", run)]
+            else:
+                run_items = [(name, [name]) for name in run]
+
+            for item, item_names in run_items:
+                new_sum_len = sum_len + len(item) + 1
                 if new_sum_len >= ARG_MAX:
                     break
 
-                chunk.add(name)
+                items.append(item)
+                chunk.update(item_names)
                 sum_len = new_sum_len
+            else:
+                continue
 
-            args = ["zfs", "destroy", f"{dataset}@" + ",".join(sorted(chunk))]
-            try:
-                try:
-                    shell.exec(args, timeout=3600)  # Destroying snapshots can take a really long time
-                except ExecException as e:
-                    if "could not find any snapshots to destroy; check snapshot names" in e.stdout:
-                        # Snapshots might be already removed by another process
-                        pass
-                    else:
-                        raise
+            break
 
-                names -= chunk
+        args = ["zfs", "destroy"] + (["-d"] if defer else []) + [f"{dataset}@" + ",".join(items)]
+        try:
+            try:
+                started_at = time.monotonic()
+                shell.exec(args, timeout=3600)  # Destroying snapshots can take a really long time
+                batch_size.update(len(chunk), time.monotonic() - started_at)
             except ExecException as e:
-                if m := re.search(r"cannot destroy snapshot .+?@(.+?): dataset is busy", e.stdout):
-                    reason = "busy"
-                    discard_names = [m.group(1)]
-                elif m := re.search(r"cannot destroy '.+?@(.+?)': snapshot has dependent clones", e.stdout):
-                    reason = "cloned"
-                    discard_names = [m.group(1)]
-                elif discard_names := re.findall(r"cannot destroy snapshot .+?@(.+?): it's being held", e.stdout):
-                    reason = "held"
+                if "could not find any snapshots to destroy; check snapshot names" in e.stdout:
+                    # Snapshots might be already removed by another process
+                    pass
                 else:
                     raise
 
-                logger.info("Snapshots %r on dataset %r are %s, skipping", discard_names, dataset, reason)
-                names -= set(discard_names)
+            names -= chunk
+        except ExecException as e:
+            if m := re.search(r"cannot destroy snapshot .+?@(.+?): dataset is busy", e.stdout):
+                reason = "busy"
+                discard_names = [m.group(1)]
+            elif m := re.search(r"cannot destroy '.+?@(.+?)': snapshot has dependent clones", e.stdout):
+                reason = "cloned"
+                discard_names = [m.group(1)]
+            elif discard_names := re.findall(r"cannot destroy snapshot .+?@(.+?): it's being held", e.stdout):
+                reason = "held"
+            else:
+                raise
+
+            logger.info("Snapshots %r on dataset %r are %s, skipping", discard_names, dataset, reason)
+            names -= set(discard_names)
@@ -0,0 +1,151 @@
+# -*- coding=utf-8 -*-
+from collections.abc import Callable
+import logging
+import threading
+import time
+
+from zettarepl.transport.interface import Shell, Transport
+
+from .destroy import destroy_snapshots, MAX_BATCH_SIZE
+from .snapshot import Snapshot
+
+logger = logging.getLogger(__name__)
+
+__all__ = ["DestroyQueue", "DestroyQueues"]
+
+
+class DestroyQueue:
+    """
+    Destroys snapshots on a single transport in a background thread, at most `rate` snapshots per second (if set).
+    Snapshots that are already queued are not queued again, so retention can enqueue the same snapshots on each run.
+    `on_batch_done` is called (without holding the lock) each time a batch of snapshots was processed.
+    """
+
+    def __init__(self, transport: Transport, rate: float | None = None, defer: bool = False,
+                 on_batch_done: Callable[[], None] | None = None) -> None:
+        self.transport = transport
+        self.rate = rate
+        self.defer = defer
+        self.on_batch_done = on_batch_done
+
+        self.lock = threading.Lock()
+        self.condition = threading.Condition(self.lock)
+        # Used as an ordered set
+        self.snapshots: dict[Snapshot, None] = {}
+        self.thread: threading.Thread | None = None
+
+    def enqueue(self, snapshots: list[Snapshot]) -> None:
+        with self.lock:
+            for snapshot in snapshots:
+                self.snapshots[snapshot] = None
+
+            if self.thread is None:
+                self.thread = threading.Thread(daemon=True, name="retention.destroy_queue", target=self._run)
+                self.thread.start()
+            else:
+                self.condition.notify()
+
+    def __len__(self) -> int:
+        with self.lock:
+            return len(self.snapshots)
+
+    def pending_snapshots(self) -> list[Snapshot]:
+        """
+        Snapshots that are queued or being destroyed.
+        """
+        with self.lock:
+            return list(self.snapshots)
+
+    def _run(self) -> None:
+        shell = None
+        try:
+            while True:
+                with self.lock:
+                    if not self.snapshots:
+                        if shell is not None:
+                            # Do not keep the connection open while idle
+                            shell.close()
+                            shell = None
+
+                        self.condition.wait()
+                        continue
+
+                    batch = list(self.snapshots.keys())[:self._batch_size()]
+
+                if shell is None:
+                    shell = self.transport.shell(self.transport)
+
+                started_at = time.monotonic()
+                try:
+                    destroy_snapshots(shell, batch, defer=self.defer)
+                except Exception as e:
+                    # Snapshots that were not destroyed will be enqueued again by the next retention run
+                    logger.warning("Failed to destroy snapshots %r on %r: %r", batch, self.transport, e)
+                    shell.close()
+                    shell = None
+
+                with self.lock:
+                    for snapshot in batch:
+                        self.snapshots.pop(snapshot, None)
+
+                if self.on_batch_done is not None:
+                    try:
+                        self.on_batch_done()
+                    except Exception:
+                        logger.error("Unhandled exception in snapshot destroy queue callback", exc_info=True)
+
+                if self.rate:
+                    delay = len(batch) / self.rate - (time.monotonic() - started_at)
+                    if delay > 0:
+                        time.sleep(delay)
+        except Exception:
+            logger.error("Unhandled exception in snapshot destroy queue for %r", self.transport, exc_info=True)
+            with self.lock:
+                self.thread = None
+
+    def _batch_size(self) -> int:
+        if self.rate:
+            # Destroy at most one second worth of snapshots at once so that rate limit is smooth
+            return max(1, min(int(self.rate), MAX_BATCH_SIZE))
+
+        return MAX_BATCH_SIZE
+
+
+class DestroyQueues:
+    """
+    `DestroyQueue` for each transport.
+    """
+
+    def __init__(self, rate: float | None = None, defer: bool = False) -> None:
+        self.rate = rate
+        self.defer = defer
+        self.on_batch_done: Callable[[], None] | None = None
+        self.lock = threading.Lock()
+        self.queues: dict[Transport, DestroyQueue] = {}
+
+    def enqueue(self, shell: Shell, snapshots: list[Snapshot]) -> None:
+        if not snapshots:
+            return
+
+        with self.lock:
+            if shell.transport not in self.queues:
+                self.queues[shell.transport] = DestroyQueue(shell.transport, self.rate, self.defer,
+                                                            self._on_batch_done)
+
+            queue = self.queues[shell.transport]
+
+        queue.enqueue(snapshots)
+
+    def pending_snapshots(self) -> dict[Transport, list[Snapshot]]:
+        with self.lock:
+            queues = list(self.queues.items())
+
+        return {
+            transport: snapshots
+            for transport, queue in queues
+            if (snapshots := queue.pending_snapshots())
+        }
+
+    def _on_batch_done(self) -> None:
+        if self.on_batch_done is not None:
+            self.on_batch_done()
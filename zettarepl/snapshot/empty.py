@@ -1,36 +1,66 @@
 # -*- coding=utf-8 -*-
 from collections import defaultdict
+import enum
 import logging
 
 from zettarepl.dataset.exclude import should_exclude
 from zettarepl.dataset.list import list_datasets
 from zettarepl.dataset.relationship import is_child
+from zettarepl.dataset.tree import DatasetTree
+from zettarepl.snapshot.destroy import ARG_MAX, _chunks
 from zettarepl.snapshot.task.task import PeriodicSnapshotTask
 from zettarepl.snapshot.snapshot import Snapshot
 from zettarepl.transport.interface import ExecException, Shell
+from zettarepl.transport.zfscli import parse_property
 
 logger = logging.getLogger(__name__)
 
-__all__ = ["get_empty_snapshots_for_deletion"]
+__all__ = ["EmptySnapshotsCheck", "get_empty_snapshots_for_deletion", "get_empty_snapshots_tasks"]
+
+
+class EmptySnapshotsCheck(enum.Enum):
+    # Create snapshots and then query `written` for each of them
+    AFTER_CREATION = "after-creation"
+    # Create snapshots and then query `written` for all of them at once
+    BATCHED = "batched"
+    # Query `written` of all datasets at once and do not create snapshots that would be destroyed right away
+    BEFORE_CREATION = "before-creation"
 
 
 def get_empty_snapshots_for_deletion(
-    shell: Shell, tasks_with_snapshot_names: list[tuple[PeriodicSnapshotTask, str]],
+    shell: Shell, tasks_with_snapshot_names: list[tuple[PeriodicSnapshotTask, str]], batch: bool = False,
 ) -> list[Snapshot]:
     datasets = list_datasets(shell)
 
-    datasets__allow_empty = defaultdict(list)
-    datasets__snapshots = defaultdict(list)
-    for task, snapshot_name in tasks_with_snapshot_names:
-        for snapshot in get_task_snapshots(datasets, task, snapshot_name):
-            datasets__allow_empty[snapshot.dataset].append(task.allow_empty)
-            datasets__snapshots[snapshot.dataset].append(snapshot)
+    datasets__allow_empty, datasets__snapshots = group_tasks_snapshots(datasets, tasks_with_snapshot_names)
+
+    datasets_tree = DatasetTree(datasets)
+
+    datasets_to_check = [dataset for dataset, allow_empty in datasets__allow_empty.items() if not any(allow_empty)]
+
+    snapshots_written = None
+    if batch and datasets_to_check:
+        snapshots = sorted({
+            snapshot
+            for dataset in datasets_to_check
+            for ds in datasets_tree.subtree(dataset)
+            for snapshot in datasets__snapshots[ds]
+        })
+        try:
+            snapshots_written = get_snapshots_written(shell, snapshots)
+        except ExecException as e:
+            logger.warning("Failed to check if snapshots are empty, checking them one by one. Error: %r", e)
 
     empty_snapshots = []
-    for dataset in [dataset for dataset, allow_empty in datasets__allow_empty.items() if not any(allow_empty)]:
+    for dataset in datasets_to_check:
         try:
-            if all(all(is_empty_snapshot(shell, snapshot) for snapshot in datasets__snapshots[ds])
-                   for ds in datasets if ds == dataset or is_child(ds, dataset)):
+            if snapshots_written is not None:
+                empty = all(all(snapshots_written.get(snapshot) == 0 for snapshot in datasets__snapshots[ds])
+                            for ds in datasets_tree.subtree(dataset))
+            else:
+                empty = all(all(is_empty_snapshot(shell, snapshot) for snapshot in datasets__snapshots[ds])
+                            for ds in datasets_tree.subtree(dataset))
+            if empty:
                 empty_snapshots.extend(datasets__snapshots[dataset])
         except ExecException as e:
             logger.warning("Failed to check if snapshots for dataset %r are empty, assuming they are is not. Error: %r",
@@ -39,6 +69,63 @@ def get_empty_snapshots_for_deletion(
     return empty_snapshots
 
 
+def get_empty_snapshots_tasks(
+    shell: Shell, tasks_with_snapshot_names: list[tuple[PeriodicSnapshotTask, str]],
+) -> list[tuple[PeriodicSnapshotTask, str]]:
+    """
+    Returns tasks all of whose snapshots would be destroyed by `get_empty_snapshots_for_deletion` right after being
+    created (because nothing was written to their datasets since their previous snapshots), so there is no need to
+    create them.
+    """
+    candidates = [(task, snapshot_name) for task, snapshot_name in tasks_with_snapshot_names if not task.allow_empty]
+    if not candidates:
+        return []
+
+    datasets = list_datasets(shell)
+
+    datasets__allow_empty, datasets__snapshots = group_tasks_snapshots(datasets, tasks_with_snapshot_names)
+
+    datasets_tree = DatasetTree(datasets)
+
+    roots = DatasetTree()
+    for task, snapshot_name in candidates:
+        if not roots.has_ancestor(task.dataset):
+            roots.remove_subtree(task.dataset)
+            roots.add(task.dataset)
+
+    try:
+        datasets_written = get_datasets_written(shell, list(roots))
+    except ExecException as e:
+        logger.warning("Failed to check if datasets have changed since their previous snapshots, creating all "
+                       "snapshots. Error: %r", e)
+        return []
+
+    empty_tasks = []
+    for task, snapshot_name in candidates:
+        task_datasets = [snapshot.dataset for snapshot in get_task_snapshots(datasets, task, snapshot_name)]
+        if task_datasets and all(
+            not any(datasets__allow_empty[dataset]) and
+            all(datasets_written.get(ds) == 0 for ds in datasets_tree.subtree(dataset) if datasets__snapshots[ds])
+            for dataset in task_datasets
+        ):
+            empty_tasks.append((task, snapshot_name))
+
+    return empty_tasks
+
+
+def group_tasks_snapshots(
+    datasets: list[str], tasks_with_snapshot_names: list[tuple[PeriodicSnapshotTask, str]],
+) -> tuple[dict[str, list[bool]], dict[str, list[Snapshot]]]:
+    datasets__allow_empty = defaultdict(list)
+    datasets__snapshots = defaultdict(list)
+    for task, snapshot_name in tasks_with_snapshot_names:
+        for snapshot in get_task_snapshots(datasets, task, snapshot_name):
+            datasets__allow_empty[snapshot.dataset].append(task.allow_empty)
+            datasets__snapshots[snapshot.dataset].append(snapshot)
+
+    return datasets__allow_empty, datasets__snapshots
+
+
 def get_task_snapshots(datasets: list[str], task: PeriodicSnapshotTask, snapshot_name: str) -> list[Snapshot]:
     if task.recursive:
         return [
@@ -52,3 +139,32 @@ def get_task_snapshots(datasets: list[str], task: PeriodicSnapshotTask, snapshot
 
 def is_empty_snapshot(shell: Shell, snapshot: Snapshot) -> bool:
     return shell.exec(["zfs", "get", "-H", "-o", "value", "written", str(snapshot)]).strip() == "0"
+
+
+def get_snapshots_written(shell: Shell, snapshots: list[Snapshot]) -> dict[Snapshot, int | None]:
+    result = {}
+    for chunk in _chunks(list(map(str, snapshots)), ARG_MAX):
+        output = shell.exec(["zfs", "get", "-H", "-p", "-o", "name,value", "written"] + chunk)
+        result.update({
+            Snapshot(*name.split("@", 1)): parse_property(value, int)
+            for name, value in map(lambda line: line.split("\t"), filter(None, output.split("\n")))
+        })
+
+    return result
+
+
+def get_datasets_written(shell: Shell, datasets: list[str]) -> dict[str, int | None]:
+    """
+    `written` of a dataset is the amount of data written since its previous snapshot (i.e. the `written` of the
+    snapshot that would be created now).
+    """
+    result = {}
+    for chunk in _chunks(datasets, ARG_MAX):
+        output = shell.exec(["zfs", "get", "-H", "-p", "-o", "name,value", "-t", "filesystem,volume", "-r",
+                             "written"] + chunk)
+        result.update({
+            name: parse_property(value, int)
+            for name, value in map(lambda line: line.split("\t"), filter(None, output.split("\n")))
+        })
+
+    return result
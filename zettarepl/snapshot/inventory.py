@@ -0,0 +1,106 @@
+# -*- coding=utf-8 -*-
+import logging
+import threading
+import time
+
+from zettarepl.dataset.relationship import is_child
+from zettarepl.transport.interface import Shell, Transport
+
+from .snapshot import Snapshot
+
+logger = logging.getLogger(__name__)
+
+__all__ = ["SnapshotInventory", "SnapshotInventories", "snapshot_inventories"]
+
+
+class SnapshotInventory:
+    """
+    Snapshot listings (`zfs list -t snapshot` results) for a single transport. Entries are invalidated when zettarepl
+    creates, receives or destroys snapshots on that transport and expire after `ttl` seconds to account for changes
+    made by other processes.
+    """
+
+    def __init__(self, ttl: float) -> None:
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        # `(dataset, recursive)` -> (monotonic time of listing start, snapshots)
+        self.entries: dict[tuple[str, bool], tuple[float, list[Snapshot]]] = {}
+        # Incremented on each invalidation so that listings that were running concurrently are not stored
+        self.generation = 0
+
+    def get(self, dataset: str, recursive: bool) -> list[Snapshot] | None:
+        now = time.monotonic()
+        with self.lock:
+            for (entry_dataset, entry_recursive), (listed_at, snapshots) in list(self.entries.items()):
+                if now - listed_at >= self.ttl:
+                    self.entries.pop((entry_dataset, entry_recursive))
+                    continue
+
+                if entry_dataset == dataset and entry_recursive == recursive:
+                    return list(snapshots)
+
+                # Recursive listing of the parent dataset contains everything we need
+                if entry_recursive and is_child(dataset, entry_dataset):
+                    return [
+                        snapshot
+                        for snapshot in snapshots
+                        if snapshot.dataset == dataset or (recursive and is_child(snapshot.dataset, dataset))
+                    ]
+
+        return None
+
+    def put(self, dataset: str, recursive: bool, snapshots: list[Snapshot], listed_at: float, generation: int) -> None:
+        with self.lock:
+            if generation != self.generation:
+                return
+
+            self.entries[(dataset, recursive)] = (listed_at, list(snapshots))
+
+    def invalidate(self, dataset: str, recursive: bool) -> None:
+        """
+        Invalidates all listings that might contain snapshots of `dataset` (and its children if `recursive`).
+        """
+        with self.lock:
+            self.generation += 1
+
+            for entry_dataset, entry_recursive in list(self.entries.keys()):
+                if (
+                    entry_dataset == dataset or
+                    (recursive and is_child(entry_dataset, dataset)) or
+                    (entry_recursive and is_child(dataset, entry_dataset))
+                ):
+                    self.entries.pop((entry_dataset, entry_recursive))
+
+
+class SnapshotInventories:
+    """
+    `SnapshotInventory` for each transport. Disabled (nothing is cached) when `ttl` is zero.
+    """
+
+    def __init__(self, ttl: float) -> None:
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.inventories: dict[Transport, SnapshotInventory] = {}
+
+    def set_ttl(self, ttl: float) -> None:
+        with self.lock:
+            self.ttl = ttl
+            self.inventories = {}
+
+    def inventory(self, shell: Shell) -> SnapshotInventory | None:
+        if not self.ttl:
+            return None
+
+        with self.lock:
+            if shell.transport not in self.inventories:
+                self.inventories[shell.transport] = SnapshotInventory(self.ttl)
+
+            return self.inventories[shell.transport]
+
+    def invalidate(self, shell: Shell, dataset: str, recursive: bool) -> None:
+        inventory = self.inventory(shell)
+        if inventory is not None:
+            inventory.invalidate(dataset, recursive)
+
+
+snapshot_inventories = SnapshotInventories(ttl=0)
@@ -1,35 +1,146 @@
 # -*- coding=utf-8 -*-
 from collections import defaultdict, OrderedDict
+from collections.abc import Iterator
+import contextlib
 import logging
+import queue
+import re
+import time
 
-from zettarepl.dataset.relationship import is_child
-from zettarepl.transport.interface import Shell
+from zettarepl.dataset.tree import DatasetTree
+from zettarepl.transport.interface import ExecException, Shell
 from zettarepl.transport.zfscli.exception import DatasetDoesNotExistException, ZfsCliExceptionHandler
 
+from .inventory import snapshot_inventories
 from .snapshot import Snapshot
+from .table import SnapshotTable
 
 logger = logging.getLogger(__name__)
 
-__all__ = ["list_snapshots", "multilist_snapshots", "group_snapshots_by_datasets"]
+__all__ = ["list_snapshots", "list_snapshots_cached", "iter_list_snapshots", "list_snapshots_table",
+           "multilist_snapshots", "group_snapshots_by_datasets"]
+
+# How many `zfs list` output lines `iter_list_snapshots` receives from the reader thread at once
+ITER_LIST_SNAPSHOTS_CHUNK = 1000
+# How many chunks the reader thread can read ahead of `iter_list_snapshots` consumer
+ITER_LIST_SNAPSHOTS_QUEUE_SIZE = 16
 
 
 def list_snapshots(shell: Shell, dataset: str, recursive: bool, sort: str = "name") -> list[Snapshot]:
+    args = list_snapshots_args([dataset], recursive, sort)
+    return list(map(lambda s: Snapshot(*s.split("@")), filter(None, shell.exec(args).split("\n"))))
+
+
+def list_snapshots_cached(shell: Shell, dataset: str, recursive: bool) -> list[Snapshot]:
+    """
+    Same as `list_snapshots` but uses the snapshot inventory of the shell's transport (if it is enabled).
+    """
+    inventory = snapshot_inventories.inventory(shell)
+    if inventory is None:
+        return list_snapshots(shell, dataset, recursive)
+
+    snapshots = inventory.get(dataset, recursive)
+    if snapshots is not None:
+        logger.debug("Using cached snapshots list for %r on %r (recursive=%r)", dataset, shell, recursive)
+        return snapshots
+
+    listed_at = time.monotonic()
+    generation = inventory.generation
+    snapshots = list_snapshots(shell, dataset, recursive)
+    inventory.put(dataset, recursive, snapshots, listed_at, generation)
+    return snapshots
+
+
+def iter_list_snapshots(shell: Shell, dataset: str, recursive: bool, sort: str = "name",
+                        timeout: float | None = None) -> Iterator[Snapshot]:
+    """
+    Same as `list_snapshots` but yields snapshots as `zfs list` outputs them instead of buffering the whole output.
+    `zfs list` is stopped if the iteration is not completed.
+    `timeout` is how long to wait for each chunk of `zfs list` output (the time the consumer spends between the
+    iterations does not count).
+    """
+    output: queue.Queue[str | None] = queue.Queue(maxsize=ITER_LIST_SNAPSHOTS_QUEUE_SIZE)
+    async_exec = shell.exec_async(list_snapshots_args([dataset], recursive, sort), stdout=output,
+                                  stdout_lines_per_chunk=ITER_LIST_SNAPSHOTS_CHUNK)
+
+    completed = False
+    try:
+        errors = []
+        while True:
+            try:
+                chunk = output.get(timeout=timeout)
+            except queue.Empty:
+                raise TimeoutError()
+
+            if chunk is None:
+                break
+
+            for line in chunk.split("\n"):
+                if "@" in line:
+                    yield Snapshot(*line.split("@", 1))
+                elif line:
+                    errors.append(line)
+
+        completed = True
+    finally:
+        if not completed:
+            # The consumer has stopped early (or we have timed out), do not let `zfs list` run for nothing
+            async_exec.stop()
+            # The reader thread might be waiting for a free slot in the queue
+            with contextlib.suppress(queue.Empty):
+                while output.get(timeout=10) is not None:
+                    pass
+
+    try:
+        async_exec.wait(timeout)
+    except ExecException as e:
+        # Command output was streamed to us so the exception does not contain it
+        raise ExecException(e.returncode, "".join([f"{error}\n" for error in errors])) from None
+
+
+def list_snapshots_table(shell: Shell, dataset: str, recursive: bool) -> SnapshotTable:
+    """
+    Lists snapshots into a `SnapshotTable` (using the snapshot inventory of the shell's transport if it is enabled).
+    """
+    if snapshot_inventories.inventory(shell) is not None:
+        return SnapshotTable.from_snapshots(list_snapshots_cached(shell, dataset, recursive))
+
+    return SnapshotTable.from_snapshots(iter_list_snapshots(shell, dataset, recursive))
+
+
+def list_snapshots_args(datasets: list[str], recursive: bool, sort: str = "name") -> list[str]:
     args = ["zfs", "list", "-t", "snapshot", "-H", "-o", "name", "-s", sort]
     if recursive:
         args.extend(["-r"])
     else:
         args.extend(["-d", "1"])
-    args.append(dataset)
-    return list(map(lambda s: Snapshot(*s.split("@")), filter(None, shell.exec(args).split("\n"))))
+    args.extend(datasets)
+    return args
 
 
 def multilist_snapshots(shell: Shell, queries: list[tuple[str, bool]], *,
-                        ignore_nonexistent: bool = False) -> list[Snapshot]:
+                        ignore_nonexistent: bool = False, batch: bool = False) -> list[Snapshot]:
+    simple_queries = simplify_snapshot_list_queries(queries)
+
     snapshots = []
-    for dataset, recursive in simplify_snapshot_list_queries(queries):
+    if (inventory := snapshot_inventories.inventory(shell)) is not None:
+        uncached_queries = []
+        for dataset, recursive in simple_queries:
+            if (cached_snapshots := inventory.get(dataset, recursive)) is not None:
+                snapshots.extend(cached_snapshots)
+            else:
+                uncached_queries.append((dataset, recursive))
+
+        simple_queries = uncached_queries
+
+    if batch and len(simple_queries) > 1:
+        if (batch_snapshots := batch_list_snapshots(shell, simple_queries, ignore_nonexistent)) is not None:
+            return snapshots + batch_snapshots
+
+    for dataset, recursive in simple_queries:
         try:
             with ZfsCliExceptionHandler():
-                dataset_snapshots = list_snapshots(shell, dataset, recursive)
+                dataset_snapshots = list_snapshots_cached(shell, dataset, recursive)
         except DatasetDoesNotExistException:
             if ignore_nonexistent:
                 continue
@@ -41,17 +152,88 @@ def multilist_snapshots(shell: Shell, queries: list[tuple[str, bool]], *,
     return snapshots
 
 
+def batch_list_snapshots(shell: Shell, simple_queries: list[tuple[str, bool]],
+                         ignore_nonexistent: bool) -> list[Snapshot] | None:
+    """
+    Lists snapshots for all the simplified queries using a single `zfs list` invocation for recursive queries and a
+    single one for non-recursive queries (as `-r`/`-d` apply to all the datasets passed).
+
+    Returns `None` if `zfs list` has failed for a reason other than some of the queried datasets not existing (so the
+    caller should list the datasets one by one to get the appropriate error).
+    """
+    inventory = snapshot_inventories.inventory(shell)
+
+    snapshots: list[Snapshot] = []
+    for recursive in [True, False]:
+        datasets = [dataset for dataset, r in simple_queries if r == recursive]
+        if not datasets:
+            continue
+
+        listed_at = time.monotonic()
+        generation = inventory.generation if inventory is not None else 0
+        nonexistent_datasets = set()
+        try:
+            output = shell.exec(list_snapshots_args(datasets, recursive))
+        except ExecException as e:
+            lines = list(filter(None, e.stdout.split("\n")))
+            nonexistent = set()
+            for line in lines:
+                if m := re.fullmatch("cannot open '(?P<dataset>[^@]+)': dataset does not exist", line):
+                    if m.group("dataset") not in datasets:
+                        return None
+
+                    nonexistent.add(line)
+                    nonexistent_datasets.add(m.group("dataset"))
+                elif "@" not in line:
+                    return None
+
+            if not nonexistent:
+                return None
+
+            if not ignore_nonexistent:
+                raise DatasetDoesNotExistException(e.returncode, "\n".join(sorted(nonexistent)) + "\n") from None
+
+            output = "\n".join([line for line in lines if line not in nonexistent])
+
+        datasets_snapshots = list(map(lambda s: Snapshot(*s.split("@")), filter(None, output.split("\n"))))
+        snapshots.extend(datasets_snapshots)
+
+        if inventory is not None:
+            # Simplified recursive queries do not intersect so each snapshot belongs to exactly one of them
+            snapshots_by_root: dict[str, list[Snapshot]] = {
+                dataset: [] for dataset in datasets if dataset not in nonexistent_datasets
+            }
+            for snapshot in datasets_snapshots:
+                root = snapshot.dataset
+                while root not in snapshots_by_root and "/" in root:
+                    root = root.rsplit("/", 1)[0]
+
+                if root in snapshots_by_root:
+                    snapshots_by_root[root].append(snapshot)
+
+            for root, root_snapshots in snapshots_by_root.items():
+                inventory.put(root, recursive, root_snapshots, listed_at, generation)
+
+    return snapshots
+
+
 def simplify_snapshot_list_queries(queries: list[tuple[str, bool]]) -> list[tuple[str, bool]]:
     simple: list[tuple[str, bool]] = []
+    recursive_datasets = DatasetTree()
+    non_recursive_datasets = set()
     for dataset, recursive in sorted(queries, key=lambda q: (q[0], 0 if q[1] else 1)):
+        if recursive_datasets.has_ancestor(dataset):
+            continue
+
         if recursive:
-            queries_may_include_this = list(filter(lambda q: q[1], simple))
+            recursive_datasets.add(dataset)
         else:
-            queries_may_include_this = simple
+            if dataset in non_recursive_datasets:
+                continue
+
+            non_recursive_datasets.add(dataset)
 
-        if not any(is_child(dataset, ds) if r else dataset == ds
-                   for ds, r in queries_may_include_this):
-            simple.append((dataset, recursive))
+        simple.append((dataset, recursive))
 
     return simple
 
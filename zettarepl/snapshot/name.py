@@ -1,14 +1,21 @@
 # -*- coding=utf-8 -*-
-from datetime import datetime, tzinfo
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone, tzinfo
+import functools
 import logging
 import re
+import threading
 from typing import Any, Iterable, NamedTuple
 
+import _strptime  # type: ignore[import-not-found]
+
 import pytz
 
 logger = logging.getLogger(__name__)
 
-__all__ = ["ParsedSnapshotName", "get_snapshot_name", "parse_snapshot_name", "parse_snapshots_names",
+__all__ = ["CompiledNamingSchema", "ParsedSnapshotName", "ParsedSnapshotNameCache", "ParsedSnapshotNameCacheInfo",
+           "compile_naming_schema", "get_snapshot_name", "parsed_snapshot_names_cache", "parse_snapshot_name",
+           "parse_snapshots_names",
            "parse_snapshots_names_with_multiple_schemas", "parsed_snapshot_sort_key",
            "naming_schema_has_utcoffset", "validate_snapshot_naming_schema"]
 
@@ -25,27 +32,142 @@ def get_snapshot_name(now: datetime, naming_schema: str) -> str:
     return now.strftime(naming_schema).replace("+", "--")
 
 
-def parse_snapshot_name(name: str, naming_schema: str) -> ParsedSnapshotName:
-    if "%s" in naming_schema:
+# Directives that `CompiledNamingSchema` converts itself. Naming schemas that use any other directive are parsed with
+# `datetime.strptime`.
+REQUIRED_DIRECTIVES = {"Y", "m", "d", "H", "M"}
+SUPPORTED_DIRECTIVES = REQUIRED_DIRECTIVES | {"S", "z"}
+# Minimum length of the text matched by each supported directive
+DIRECTIVES_MIN_LENGTHS = {"Y": 4, "m": 1, "d": 1, "H": 1, "M": 1, "S": 1, "z": 1}
+
+
+class CompiledNamingSchema:
+    """
+    Parses snapshot names according to a naming schema. The regular expression and the name prefilter are built only
+    once per naming schema. For the common naming schemas, the datetime is built from the regular expression groups
+    directly (the regular expression is the one `datetime.strptime` would use, so the results are the same).
+    """
+
+    def __init__(self, naming_schema: str) -> None:
+        self.naming_schema = naming_schema
+        self.has_utcoffset = naming_schema_has_utcoffset(naming_schema)
+        self.has_timestamp = "%s" in naming_schema
+
+        self.timestamp_regex: re.Pattern[str] | None = None
+        self.timestamp_regex_error: str | None = None
+        self.regex: re.Pattern[str] | None = None
+        self.prefix = ""
+        self.min_length = 0
+
+        if self.has_timestamp:
+            try:
+                self.timestamp_regex = re.compile(naming_schema.replace("%s", "(?P<s>[0-9]+)") + "$")
+            except re.error as e:
+                self.timestamp_regex_error = e.msg
+        else:
+            self._compile()
+
+    def _compile(self) -> None:
+        directives = set(re.findall("%(.)", self.naming_schema))
+        if not (REQUIRED_DIRECTIVES <= directives <= SUPPORTED_DIRECTIVES):
+            return
+
         try:
-            if not (m := re.match(naming_schema.replace("%s", "(?P<s>[0-9]+)") + "$", name)):
-                raise ValueError(f"time data {name!r} does not match format {naming_schema!r}")
-        except re.error as e:
-            raise ValueError(f"Invalid naming schema: {e.msg}")
+            self.regex = re.compile(_strptime._TimeRE_cache.pattern(self.naming_schema), re.IGNORECASE)
+        except Exception:
+            # Let `datetime.strptime` raise an appropriate error
+            return
 
-        d = datetime.fromtimestamp(int(m.group("s")))
-    else:
-        strptime_name = name
-        if naming_schema_has_utcoffset(naming_schema):
-            if "--" in strptime_name:
-                strptime_name = strptime_name.replace("--", "+")
+        if (prefix := re.split(r"%|\s", self.naming_schema, maxsplit=1)[0]).isascii():
+            self.prefix = prefix.lower()
+
+        # Each whitespace sequence is matched as `\s+`
+        self.min_length = len(re.sub(r"\s+", " ", re.sub("%.", "", self.naming_schema))) + sum(
+            DIRECTIVES_MIN_LENGTHS[directive] for directive in re.findall("%(.)", self.naming_schema)
+        )
+
+    def parse(self, name: str) -> ParsedSnapshotName:
+        if self.has_timestamp:
+            d = self._parse_timestamp(name)
+        else:
+            strptime_name = name
+            if self.has_utcoffset:
+                if "--" in strptime_name:
+                    strptime_name = strptime_name.replace("--", "+")
+                else:
+                    # Before https://github.com/truenas/zettarepl/issues/218 we used to use `:` instead of `+` but it
+                    # turned out to be incompatible with Samba
+                    strptime_name = strptime_name.replace(":", "+")
+
+            if self.regex is not None:
+                d = self._parse_datetime(strptime_name)
             else:
-                # Before https://github.com/truenas/zettarepl/issues/218 we used to use `:` instead of `+` but it
-                # turned out to be incompatible with Samba
-                strptime_name = strptime_name.replace(":", "+")
+                d = self._strptime(strptime_name)
+
+        return ParsedSnapshotName(self.naming_schema, name, d, d.replace(tzinfo=None), d.tzinfo)
+
+    def _parse_timestamp(self, name: str) -> datetime:
+        if self.timestamp_regex is None:
+            raise ValueError(f"Invalid naming schema: {self.timestamp_regex_error}")
+
+        if not (m := self.timestamp_regex.match(name)):
+            raise ValueError(f"time data {name!r} does not match format {self.naming_schema!r}")
+
+        return datetime.fromtimestamp(int(m.group("s")))
+
+    def _parse_datetime(self, name: str) -> datetime:
+        assert self.regex is not None
+
+        if not self._prefilter(name) or not (m := self.regex.match(name)):
+            raise ValueError(f"time data {name!r} does not match format {self.naming_schema!r}")
+
+        if len(name) != m.end():
+            raise ValueError(f"unconverted data remains: {name[m.end():]}")
+
+        groups = m.groupdict()
+
+        tz = None
+        if (z := groups.get("z")) is not None:
+            tz = self._parse_utcoffset(z)
+
+        return datetime(int(groups["Y"]), int(groups["m"]), int(groups["d"]), int(groups["H"]), int(groups["M"]),
+                        int(groups.get("S") or 0), 0, tz)
+
+    def _prefilter(self, name: str) -> bool:
+        if len(name) < self.min_length:
+            return False
 
+        prefix = name[:len(self.prefix)]
+        # Non-ASCII characters might be matched case-insensitively in the ways `str.lower` does not account for
+        if prefix.isascii() and prefix.lower() != self.prefix:
+            return False
+
+        return True
+
+    def _parse_utcoffset(self, z: str) -> timezone:
+        # Same as `_strptime._strptime` does
+        if z == "Z":
+            return timezone(timedelta(0))
+
+        utcoffset = z
+        if z[3] == ":":
+            z = z[:3] + z[4:]
+            if len(z) > 5:
+                if z[5] != ":":
+                    raise ValueError(f"Inconsistent use of : in {utcoffset}")
+                z = z[:5] + z[6:]
+
+        gmtoff = int(z[1:3]) * 3600 + int(z[3:5]) * 60 + int(z[5:7] or 0)
+        gmtoff_remainder = z[8:]
+        gmtoff_fraction = int(gmtoff_remainder + "0" * (6 - len(gmtoff_remainder)))
+        if z.startswith("-"):
+            gmtoff = -gmtoff
+            gmtoff_fraction = -gmtoff_fraction
+
+        return timezone(timedelta(seconds=gmtoff, microseconds=gmtoff_fraction))
+
+    def _strptime(self, name: str) -> datetime:
         try:
-            d = datetime.strptime(strptime_name, naming_schema)
+            return datetime.strptime(name, self.naming_schema)
         except ValueError:
             raise
         except re.error as e:
@@ -53,14 +175,93 @@ def parse_snapshot_name(name: str, naming_schema: str) -> ParsedSnapshotName:
         except Exception as e:
             raise ValueError(f"Invalid naming schema: {e!r}")
 
-    return ParsedSnapshotName(naming_schema, name, d, d.replace(tzinfo=None), d.tzinfo)
+
+@functools.lru_cache(maxsize=256)
+def compile_naming_schema(naming_schema: str) -> CompiledNamingSchema:
+    return CompiledNamingSchema(naming_schema)
+
+
+class ParsedSnapshotNameCacheInfo(NamedTuple):
+    hits: int
+    misses: int
+    maxsize: int
+    currsize: int
+
+
+class ParsedSnapshotNameCache:
+    """
+    Bounded LRU cache of `parse_snapshot_name` results (both successful and failed) keyed by `(name, naming_schema)`.
+    It lives for the whole process lifetime so that the same snapshot names are not parsed over and over again.
+    """
+
+    def __init__(self, maxsize: int) -> None:
+        self.maxsize = maxsize
+        self.lock = threading.Lock()
+        self.cache: OrderedDict[tuple[str, str], ParsedSnapshotName | str] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def parse(self, name: str, compiled_naming_schema: CompiledNamingSchema) -> ParsedSnapshotName:
+        if compiled_naming_schema.has_timestamp:
+            # Result depends on the local timezone
+            return compiled_naming_schema.parse(name)
+
+        key = (name, compiled_naming_schema.naming_schema)
+        with self.lock:
+            result = self.cache.get(key)
+            if result is not None:
+                self.hits += 1
+                self.cache.move_to_end(key)
+            else:
+                self.misses += 1
+
+        if result is None:
+            try:
+                result = compiled_naming_schema.parse(name)
+            except ValueError as e:
+                result = str(e)
+
+            with self.lock:
+                self.cache[key] = result
+                while len(self.cache) > self.maxsize:
+                    self.cache.popitem(last=False)
+
+        if isinstance(result, str):
+            raise ValueError(result)
+
+        return result
+
+    def resize(self, maxsize: int) -> None:
+        with self.lock:
+            self.maxsize = maxsize
+            while len(self.cache) > self.maxsize:
+                self.cache.popitem(last=False)
+
+    def cache_info(self) -> ParsedSnapshotNameCacheInfo:
+        with self.lock:
+            return ParsedSnapshotNameCacheInfo(self.hits, self.misses, self.maxsize, len(self.cache))
+
+    def cache_clear(self) -> None:
+        with self.lock:
+            self.cache.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+parsed_snapshot_names_cache = ParsedSnapshotNameCache(maxsize=100000)
+
+
+def parse_snapshot_name(name: str, naming_schema: str) -> ParsedSnapshotName:
+    return parsed_snapshot_names_cache.parse(name, compile_naming_schema(naming_schema))
 
 
 def parse_snapshots_names(names: Iterable[str], naming_schema: str) -> list[ParsedSnapshotName]:
+    compiled_naming_schema = compile_naming_schema(naming_schema)
+
     result = []
     for name in names:
         try:
-            result.append(parse_snapshot_name(name, naming_schema))
+            result.append(parsed_snapshot_names_cache.parse(name, compiled_naming_schema))
         except ValueError:
             pass
 
@@ -0,0 +1,71 @@
+# -*- coding=utf-8 -*-
+from collections.abc import Iterable, Iterator, Mapping
+import logging
+
+from .snapshot import Snapshot
+
+logger = logging.getLogger(__name__)
+
+__all__ = ["SnapshotTable"]
+
+
+class SnapshotTable(Mapping[str, list[str]]):
+    """
+    Compact storage for a large amount of snapshots. Each dataset name is stored once (snapshots only reference the
+    dataset id) and equal snapshot names (i.e. snapshots of the same recursive snapshot) share the same string object.
+
+    It is a `dataset -> [snapshot name]` mapping ordered by dataset name (like `group_snapshots_by_datasets` result).
+    Returned lists are the table's own storage, not copies.
+    """
+
+    __slots__ = ("_datasets", "_datasets_ids", "_names", "_names_intern", "_sorted_datasets")
+
+    def __init__(self) -> None:
+        self._datasets: list[str] = []
+        self._datasets_ids: dict[str, int] = {}
+        self._names: list[list[str]] = []
+        self._names_intern: dict[str, str] = {}
+        self._sorted_datasets: list[str] | None = None
+
+    @classmethod
+    def from_snapshots(cls, snapshots: Iterable[Snapshot]) -> "SnapshotTable":
+        table = cls()
+        for snapshot in snapshots:
+            table.add(snapshot.dataset, snapshot.name)
+        return table
+
+    def add(self, dataset: str, name: str) -> None:
+        dataset_id = self._datasets_ids.get(dataset)
+        if dataset_id is None:
+            dataset_id = self._datasets_ids[dataset] = len(self._datasets)
+            self._datasets.append(dataset)
+            self._names.append([])
+            self._sorted_datasets = None
+
+        self._names[dataset_id].append(self._names_intern.setdefault(name, name))
+
+    def snapshots(self) -> Iterator[Snapshot]:
+        for dataset in self:
+            for name in self._names[self._datasets_ids[dataset]]:
+                yield Snapshot(dataset, name)
+
+    def snapshots_count(self) -> int:
+        return sum(map(len, self._names))
+
+    def __getitem__(self, dataset: str) -> list[str]:
+        return self._names[self._datasets_ids[dataset]]
+
+    def __contains__(self, dataset: object) -> bool:
+        return dataset in self._datasets_ids
+
+    def __iter__(self) -> Iterator[str]:
+        if self._sorted_datasets is None:
+            self._sorted_datasets = sorted(self._datasets)
+
+        return iter(self._sorted_datasets)
+
+    def __len__(self) -> int:
+        return len(self._datasets)
+
+    def __repr__(self) -> str:
+        return f"<SnapshotTable datasets={len(self)} snapshots={self.snapshots_count()}>"
@@ -1,4 +1,5 @@
 # -*- coding=utf-8 -*-
+import itertools
 import logging
 import os
 
@@ -6,25 +7,45 @@ from .task import PeriodicSnapshotTask
 
 logger = logging.getLogger(__name__)
 
-__all__ = ["calculate_nonintersecting_sets"]
+__all__ = ["calculate_nonintersecting_sets", "interleave_sets_by_pool"]
 
 
 def calculate_nonintersecting_sets(tasks: list[PeriodicSnapshotTask]) -> list[list[PeriodicSnapshotTask]]:
-    sets: list[list[PeriodicSnapshotTask]] = []
-    for task in tasks:
-        added = False
-        for set_tasks in sets:
-            for set_task in set_tasks:
-                if tasks_intersect(task, set_task):
-                    set_tasks.append(task)
-                    added = True
-                    break
-            if added:
-                break
-        if not added:
-            sets.append([task])
-
-    return sets
+    """
+    Groups tasks into sets so that tasks of different sets never intersect. Intersection is not transitive
+    (i.e. `pool/a` and `pool/b` both intersect recursive `pool` but not each other), so all sets that a task intersects
+    are merged together. Tasks keep their relative order within each set.
+    """
+    sets: list[list[int]] = []
+    for i, task in enumerate(tasks):
+        intersecting = [set_indexes for set_indexes in sets
+                        if any(tasks_intersect(task, tasks[j]) for j in set_indexes)]
+        if not intersecting:
+            sets.append([i])
+            continue
+
+        sets[sets.index(intersecting[0])] = sorted(itertools.chain([i], *intersecting))
+        for set_indexes in intersecting[1:]:
+            sets.remove(set_indexes)
+
+    return [[tasks[i] for i in set_indexes] for set_indexes in sets]
+
+
+def interleave_sets_by_pool(sets: list[list[PeriodicSnapshotTask]]) -> list[list[PeriodicSnapshotTask]]:
+    """
+    Reorders task sets so that the first sets of each pool go first, then the second ones, etc. (all tasks of the set
+    belong to the same pool as intersecting tasks always do). Sets of the same pool keep their relative order.
+    """
+    pools: dict[str, list[list[PeriodicSnapshotTask]]] = {}
+    for set_tasks in sets:
+        pools.setdefault(set_tasks[0].dataset.split("/")[0], []).append(set_tasks)
+
+    return [
+        set_tasks
+        for sets_group in itertools.zip_longest(*pools.values())
+        for set_tasks in sets_group
+        if set_tasks is not None
+    ]
 
 
 def tasks_intersect(t1: PeriodicSnapshotTask, t2: PeriodicSnapshotTask) -> bool:
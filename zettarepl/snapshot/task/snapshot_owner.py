@@ -22,6 +22,9 @@ class PeriodicSnapshotTaskSnapshotOwner(SnapshotOwner):
     def get_naming_schemas(self) -> set[str | None]:
         return {self.periodic_snapshot_task.naming_schema}
 
+    def get_root_datasets(self) -> list[str] | None:
+        return [self.periodic_snapshot_task.dataset]
+
     def owns_dataset(self, dataset: str) -> bool:
         return belongs_to_tree(dataset, self.periodic_snapshot_task.dataset, self.periodic_snapshot_task.recursive,
                                self.periodic_snapshot_task.exclude)
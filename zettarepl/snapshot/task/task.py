@@ -5,8 +5,10 @@ from typing import Any, Self
 
 import isodate
 
+from zettarepl.dataset.exclude import ExcludeList
 from zettarepl.definition.schema import periodic_snapshot_task_validator
 from zettarepl.scheduler.cron import CronSchedule
+from zettarepl.scheduler.spread import parse_spread
 from zettarepl.snapshot.name import validate_snapshot_naming_schema
 from zettarepl.task import Task
 
@@ -17,18 +19,23 @@ __all__ = ["PeriodicSnapshotTask"]
 
 class PeriodicSnapshotTask(Task):
     def __init__(self, id: str, dataset: str, recursive: bool, exclude: list[str], lifetime: timedelta,
-                 naming_schema: str, schedule: CronSchedule, allow_empty: bool) -> None:
+                 naming_schema: str, schedule: CronSchedule, allow_empty: bool,
+                 spread: timedelta = timedelta(0)) -> None:
         self.id = id
         self.dataset = dataset
         self.recursive = recursive
-        self.exclude = exclude
+        self.exclude = ExcludeList(exclude)
         self.lifetime = lifetime
         self.naming_schema = naming_schema
         self.schedule = schedule
         self.allow_empty = allow_empty
+        self.spread = spread
 
         validate_snapshot_naming_schema(self.naming_schema)
 
+        if self.spread >= timedelta(minutes=1):
+            raise ValueError("Snapshot creation can't be spread over a minute or more")
+
     def __repr__(self) -> str:
         return f"<Periodic Snapshot Task {self.id!r}>"
 
@@ -38,6 +45,7 @@ class PeriodicSnapshotTask(Task):
 
         data.setdefault("exclude", [])
         data.setdefault("allow-empty", True)
+        data.setdefault("spread", "PT0S")
 
         if "lifetime" in data:
             lifetime = isodate.parse_duration(data["lifetime"])
@@ -48,4 +56,5 @@ class PeriodicSnapshotTask(Task):
 
         return cls(
             id, data["dataset"], data["recursive"], data["exclude"], lifetime,
-            data["naming-schema"], CronSchedule.from_data(data["schedule"]), data["allow-empty"])
+            data["naming-schema"], CronSchedule.from_data(data["schedule"]), data["allow-empty"],
+            parse_spread(data["spread"]))
@@ -143,6 +143,7 @@ class SshTransportShell(Shell):
         super().__init__(*args, **kwargs)
 
         self._client: paramiko.SSHClient | None = None
+        self._client_lock = threading.Lock()
         self._sftp: paramiko.SFTPClient | None = None
 
     def close(self) -> None:
@@ -156,29 +157,32 @@ class SshTransportShell(Shell):
             self._sftp = None
 
     def get_client(self) -> paramiko.SSHClient:
-        if self._client is None:
-            self.logger.debug("Connecting...")
-            hkes = [paramiko.hostkeys.HostKeyEntry.from_line(line) for line in self.transport.get_host_key_entries()]
-            client = paramiko.SSHClient()
-            if any(threading.current_thread().name.startswith(prefix)
-                   for prefix in ("replication_task__", "retention")):
-                client.set_log_channel(f"zettarepl.paramiko.{threading.current_thread().name}")
-            for hke in hkes:
-                client.get_host_keys().add(hke.hostnames[0], hke.key.get_name(), hke.key)
-            client.connect(
-                self.transport.hostname,
-                self.transport.port,
-                self.transport.username,
-                pkey=self._parse_private_key(self.transport.private_key),
-                timeout=self.transport.connect_timeout,
-                allow_agent=False,
-                look_for_keys=False,
-                banner_timeout=self.transport.connect_timeout,
-                auth_timeout=self.transport.connect_timeout,
-            )
-            self._client = client
-
-        return self._client
+        # The shell might be used by multiple threads at once, they all should use the same connection
+        with self._client_lock:
+            if self._client is None:
+                self.logger.debug("Connecting...")
+                hkes = [paramiko.hostkeys.HostKeyEntry.from_line(line)
+                        for line in self.transport.get_host_key_entries()]
+                client = paramiko.SSHClient()
+                if any(threading.current_thread().name.startswith(prefix)
+                       for prefix in ("replication_task__", "retention")):
+                    client.set_log_channel(f"zettarepl.paramiko.{threading.current_thread().name}")
+                for hke in hkes:
+                    client.get_host_keys().add(hke.hostnames[0], hke.key.get_name(), hke.key)
+                client.connect(
+                    self.transport.hostname,
+                    self.transport.port,
+                    self.transport.username,
+                    pkey=self._parse_private_key(self.transport.private_key),
+                    timeout=self.transport.connect_timeout,
+                    allow_agent=False,
+                    look_for_keys=False,
+                    banner_timeout=self.transport.connect_timeout,
+                    auth_timeout=self.transport.connect_timeout,
+                )
+                self._client = client
+
+            return self._client
 
     def _parse_private_key(self, private_key: str) -> paramiko.PKey:
         for key_class in (paramiko.RSAKey, paramiko.ECDSAKey, paramiko.Ed25519Key):
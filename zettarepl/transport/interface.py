@@ -26,13 +26,15 @@ class AsyncExec:
     :param [str] args: Command arguments
     :param str encoding: Encoding to decode command output
     :param fd stdout: Queue to stream command output line-by-line instead of returning it upon command completion
+    :param int stdout_lines_per_chunk: Put up to this many lines (concatenated) into `stdout` queue at once
     """
     def __init__(self, shell: "Shell", args: list[str], encoding: str = "utf8",
-                 stdout: queue.Queue[str | None] | None = None) -> None:
+                 stdout: queue.Queue[str | None] | None = None, *, stdout_lines_per_chunk: int = 1) -> None:
         self.shell = shell
         self.args = args
         self.encoding = encoding
         self.stdout = stdout
+        self.stdout_lines_per_chunk = stdout_lines_per_chunk
 
         self.logger = PrefixLoggerAdapter(self.shell.logger, f"async_exec:{next(self._logger_counter)}")
 
@@ -47,13 +49,22 @@ class AsyncExec:
 
     def _copy_stdout_from(self, file_like: IOBase) -> None:
         def target():
+            assert self.stdout is not None
+
             try:
+                chunk: list[str] = []
                 while True:
                     line = self._stdout_file_like_readline(file_like)
                     if not line:
                         break
 
-                    self.stdout.put(line)
+                    chunk.append(line)  # type: ignore[arg-type]
+                    if len(chunk) >= self.stdout_lines_per_chunk:
+                        self.stdout.put("".join(chunk))
+                        chunk = []
+
+                if chunk:
+                    self.stdout.put("".join(chunk))
             except Exception as e:
                 self.logger.warning("Copying stdout from %r failed: %r", file_like, e)
             finally:
@@ -98,8 +109,8 @@ class Shell:
         return self.exec_async(args, encoding, stdout).wait(timeout)
 
     def exec_async(self, args: list[str], encoding: str = "utf8",
-                   stdout: queue.Queue[str | None] | None = None) -> AsyncExec:
-        async_exec = self.async_exec(self, args, encoding, stdout)
+                   stdout: queue.Queue[str | None] | None = None, *, stdout_lines_per_chunk: int = 1) -> AsyncExec:
+        async_exec = self.async_exec(self, args, encoding, stdout, stdout_lines_per_chunk=stdout_lines_per_chunk)
         async_exec.run()
         return async_exec
 
@@ -2,14 +2,17 @@
 import hashlib
 import logging
 import os
-import typing
+import weakref
 
 from .encryption_context import EncryptionContext
 from .interface import ReplicationProcess, Shell
 
 logger = logging.getLogger(__name__)
 
-__all__ = ["get_properties_exclude_override", "put_file"]
+__all__ = ["get_properties_exclude_override", "put_file", "forget_put_file"]
+
+# Remote paths of the files that were uploaded using each shell
+uploaded_files: weakref.WeakKeyDictionary[Shell, set[str]] = weakref.WeakKeyDictionary()
 
 
 def get_properties_exclude_override(
@@ -38,19 +41,18 @@ def put_file(name: str, shell: Shell) -> str:
         f.seek(0)
 
         remote_path = f"/tmp/zettarepl--{name.replace('/', '--')}--{md5}"
-        if not shell.exists(remote_path):
-            shell.put_file(f, remote_path)
-
-    return remote_path
+        shell_uploaded_files = uploaded_files.setdefault(shell, set())
+        if remote_path not in shell_uploaded_files:
+            if not shell.exists(remote_path):
+                shell.put_file(f, remote_path)
 
+            shell_uploaded_files.add(remote_path)
 
-def put_buffer(buffer: typing.IO[bytes], name: str, shell: Shell) -> str:
-    buffer.seek(0)
-    md5 = hashlib.md5(buffer.read()).hexdigest()
-    buffer.seek(0)
+    return remote_path
 
-    remote_path = f"/tmp/zettarepl--{name.replace('/', '--')}--{md5}"
-    if not shell.exists(remote_path):
-        shell.put_file(buffer, remote_path)
 
-    return remote_path
+def forget_put_file(remote_path: str, shell: Shell) -> None:
+    """
+    Makes the next `put_file` call check the file existence again (i.e. if it was removed by a `/tmp` cleaner).
+    """
+    uploaded_files.get(shell, set()).discard(remote_path)
@@ -0,0 +1,27 @@
+-- Snapshots to destroy are passed as arguments: "defer" or "no-defer", then snapshot names.
+-- Either all of them are destroyed (in the same transaction group), or none.
+argv = ...
+argv = argv["argv"]
+
+defer = argv[1] == "defer"
+
+snapshots_to_destroy = {}
+errors = {}
+for i = 2, #argv do
+    local snapshot = argv[i]
+    local err = zfs.check.destroy{snapshot, defer=defer}
+    if (err == 0) then
+        table.insert(snapshots_to_destroy, snapshot)
+    elseif (err ~= 2) then
+        -- Snapshots that no longer exist (ENOENT) might have been destroyed by another process
+        table.insert(errors, "snapshot=" .. snapshot .. " error=" .. tostring(err))
+    end
+end
+
+if (#errors ~= 0) then
+    error(table.concat(errors, ", "))
+end
+
+for _, snapshot in ipairs(snapshots_to_destroy) do
+    assert(zfs.sync.destroy{snapshot, defer=defer} == 0)
+end
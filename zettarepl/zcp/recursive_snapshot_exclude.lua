@@ -1,6 +1,63 @@
-snapshots_to_create = {}
-function populate_snapshots_to_create(dataset)
-    table.insert(snapshots_to_create, dataset .. "@" .. snapshot_name)
+-- Snapshots to create are passed as arguments. Each of them is:
+-- dataset, snapshot name, "recursive" or "non-recursive",
+-- number of excluded datasets, excluded datasets...,
+-- number of excluded datasets patterns, patterns (anchored Lua patterns)...,
+-- number of properties, property name, property value, ...
+argv = ...
+argv = argv["argv"]
+
+snapshots = {}
+i = 1
+while i <= #argv do
+    local snapshot = {dataset = argv[i], snapshot_name = argv[i + 1], recursive = argv[i + 2] == "recursive",
+                      excluded_datasets = {}, excluded_patterns = {}, properties = {}}
+    i = i + 3
+
+    local count = tonumber(argv[i])
+    i = i + 1
+    for _ = 1, count do
+        snapshot.excluded_datasets[argv[i]] = true
+        i = i + 1
+    end
+
+    count = tonumber(argv[i])
+    i = i + 1
+    for _ = 1, count do
+        table.insert(snapshot.excluded_patterns, argv[i])
+        i = i + 1
+    end
+
+    count = tonumber(argv[i])
+    i = i + 1
+    for _ = 1, count do
+        snapshot.properties[argv[i]] = argv[i + 1]
+        i = i + 2
+    end
+
+    table.insert(snapshots, snapshot)
+end
+
+function is_excluded(dataset, snapshot)
+    if snapshot.excluded_datasets[dataset] then
+        return true
+    end
+
+    for _, pattern in ipairs(snapshot.excluded_patterns) do
+        if string.find(dataset, pattern) ~= nil then
+            return true
+        end
+    end
+
+    return false
+end
+
+-- Children of excluded datasets are not visited
+function populate_snapshots_to_create(snapshots_to_create, dataset, snapshot)
+    table.insert(snapshots_to_create, dataset .. "@" .. snapshot.snapshot_name)
+
+    if not snapshot.recursive then
+        return
+    end
 
     local iterator = zfs.list.children(dataset)
     while true do
@@ -9,32 +66,55 @@ function populate_snapshots_to_create(dataset)
             break
         end
 
-        local include = true
-        for _, excl in ipairs(excluded_datasets) do
-            if child == excl then
-                include = false
-                break
-            end
+        if not is_excluded(child, snapshot) then
+            populate_snapshots_to_create(snapshots_to_create, child, snapshot)
         end
-        if include then
-            populate_snapshots_to_create(child)
+    end
+end
+
+if zfs.sync.set_prop == nil then
+    for _, snapshot in ipairs(snapshots) do
+        if next(snapshot.properties) ~= nil then
+            error("setting snapshot properties is not supported")
         end
     end
 end
-populate_snapshots_to_create(dataset)
 
+-- Each task is created atomically: either all of its snapshots are created, or none
 errors = {}
-for _, snapshot in ipairs(snapshots_to_create) do
-    local error = zfs.check.snapshot(snapshot)
-    if (error ~= 0) then
-        table.insert(errors, "snapshot=" .. snapshot .. " error=" .. tostring(error))
+for task, snapshot in ipairs(snapshots) do
+    local snapshots_to_create = {}
+    local task_errors = {}
+    if zfs.exists(snapshot.dataset) then
+        populate_snapshots_to_create(snapshots_to_create, snapshot.dataset, snapshot)
+
+        for _, snapshot_to_create in ipairs(snapshots_to_create) do
+            local err = zfs.check.snapshot(snapshot_to_create)
+            if (err ~= 0) then
+                table.insert(task_errors, "task=" .. task .. " snapshot=" .. snapshot_to_create .. " error=" ..
+                                          tostring(err))
+            end
+        end
+    else
+        -- ENOENT
+        table.insert(task_errors, "task=" .. task .. " snapshot=" .. snapshot.dataset .. "@" ..
+                                  snapshot.snapshot_name .. " error=2")
+    end
+
+    if (#task_errors == 0) then
+        for _, snapshot_to_create in ipairs(snapshots_to_create) do
+            assert(zfs.sync.snapshot(snapshot_to_create) == 0)
+            for property, value in pairs(snapshot.properties) do
+                assert(zfs.sync.set_prop(snapshot_to_create, property, value) == 0)
+            end
+        end
+    else
+        for _, task_error in ipairs(task_errors) do
+            table.insert(errors, task_error)
+        end
     end
 end
 
 if (#errors ~= 0) then
     error(table.concat(errors, ", "))
 end
-
-for _, snapshot in ipairs(snapshots_to_create) do
-    assert(zfs.sync.snapshot(snapshot) == 0)
-end
@@ -1,29 +1,85 @@
 # -*- coding=utf-8 -*-
 import logging
-import os
+import re
 import typing
 
 logger = logging.getLogger(__name__)
 
-__all__ = ["render_zcp"]
+__all__ = ["ZCP_DESTROY_PROGRAM", "ZCP_PROGRAM", "ZcpSnapshot", "fnmatch_to_lua_pattern", "render_zcp_args"]
 
-with open(os.path.join(os.path.dirname(__file__), "recursive_snapshot_exclude.lua")) as f:
-    zcp_program = f.read()
+ZCP_PROGRAM = "zcp/recursive_snapshot_exclude.lua"
+ZCP_DESTROY_PROGRAM = "zcp/destroy_snapshots.lua"
 
 
-def render_vars(buffer: typing.IO[bytes], dataset: str, snapshot_name: str,
-                excluded_datasets: typing.Iterable[str]) -> None:
-    buffer.write(f'dataset = "{dataset}"\n'.encode("utf-8"))
-    buffer.write(f'snapshot_name = "{snapshot_name}"\n'.encode("utf-8"))
-    buffer.write('excluded_datasets = {'.encode("utf-8"))
+class ZcpSnapshot(typing.NamedTuple):
+    dataset: str
+    snapshot_name: str
+    recursive: bool
+    excluded_datasets: list[str]
+    excluded_patterns: list[str]
+    properties: dict[str, str]
 
-    for excluded_dataset in excluded_datasets:
-        buffer.write(f'"{excluded_dataset}", '.encode("utf-8"))
 
-    buffer.write('}\n'.encode("utf-8"))
+def render_zcp_args(snapshots: typing.Iterable[ZcpSnapshot]) -> list[str]:
+    args = []
+    for snapshot in snapshots:
+        args.extend([snapshot.dataset, snapshot.snapshot_name, "recursive" if snapshot.recursive else "non-recursive"])
 
+        args.append(str(len(snapshot.excluded_datasets)))
+        args.extend(snapshot.excluded_datasets)
 
-def render_zcp(buffer: typing.IO[bytes], dataset: str, snapshot_name: str,
-               excluded_datasets: typing.Iterable[str]) -> None:
-    render_vars(buffer, dataset, snapshot_name, excluded_datasets)
-    buffer.write(zcp_program.encode("utf-8"))
+        args.append(str(len(snapshot.excluded_patterns)))
+        args.extend(snapshot.excluded_patterns)
+
+        args.append(str(len(snapshot.properties)))
+        for property, value in snapshot.properties.items():
+            args.extend([property, value])
+
+    return args
+
+
+def fnmatch_to_lua_pattern(pattern: str) -> str | None:
+    """
+    Translates `fnmatch` pattern to the anchored Lua pattern. Returns `None` for the patterns that can't be
+    translated exactly (i.e. non-ASCII or with sets that contain anything but letters, digits and ranges of them).
+    """
+    if not pattern.isascii():
+        return None
+
+    result = "^"
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        i += 1
+        if c == "*":
+            result += ".*"
+        elif c == "?":
+            result += "."
+        elif c == "[":
+            # Same as `fnmatch.translate`
+            j = i
+            if j < len(pattern) and pattern[j] == "!":
+                j += 1
+            if j < len(pattern) and pattern[j] == "]":
+                j += 1
+            j = pattern.find("]", j)
+            if j == -1:
+                result += "%["
+                continue
+
+            chars = pattern[i:j]
+            i = j + 1
+
+            negate = chars.startswith("!")
+            if negate:
+                chars = chars[1:]
+            if not re.fullmatch(r"([A-Za-z0-9](-[A-Za-z0-9])?)+", chars):
+                return None
+
+            result += "[" + ("^" if negate else "") + chars + "]"
+        elif c.isalnum():
+            result += c
+        else:
+            result += "%" + c
+
+    return result + "$"
@@ -3,34 +3,50 @@ from __future__ import annotations
 
 from collections import namedtuple
 from collections.abc import Callable
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
 import functools
 import logging
 import threading
 from typing import Any, Sequence
 
 from zettarepl.dataset.relationship import is_child
+from zettarepl.dataset.topology import dataset_topologies
+from zettarepl.dataset.tree import DatasetTree
 from zettarepl.definition.definition import Definition
 from zettarepl.observer import (notify, ObserverMessage, PeriodicSnapshotTaskStart, PeriodicSnapshotTaskSuccess,
                                 PeriodicSnapshotTaskError, ReplicationTaskScheduled)
 from zettarepl.replication.run import run_replication_tasks
 from zettarepl.replication.task.dataset import get_target_dataset
 from zettarepl.replication.task.direction import ReplicationDirection
+from zettarepl.replication.task.naming_schema import replication_task_naming_schemas
+from zettarepl.replication.task.should_replicate import (replication_task_replicates_target_dataset,
+                                                         replication_task_should_replicate_dataset)
 from zettarepl.replication.task.snapshot_owner import *
 from zettarepl.replication.task.snapshot_query import *
 from zettarepl.replication.task.task import *
 from zettarepl.retention.calculate import calculate_snapshots_to_remove
 from zettarepl.retention.snapshot_owner import SnapshotOwner
 from zettarepl.retention.snapshot_removal_date_snapshot_owner import SnapshotRemovalDateSnapshotOwner
+from zettarepl.retention.vectorized import vectorized_retention_enabled, vectorized_retention_options
 from zettarepl.scheduler.clock import Clock
+from zettarepl.scheduler.event_clock import EventClock
+from zettarepl.scheduler.heap_scheduler import HeapScheduler
 from zettarepl.scheduler.tz_clock import TzClock
-from zettarepl.scheduler.scheduler import Scheduler
+from zettarepl.scheduler.scheduler import Scheduler, SchedulerResult
+from zettarepl.scheduler.spread import spread_offset
 from zettarepl.snapshot.create import *
-from zettarepl.snapshot.destroy import destroy_snapshots
-from zettarepl.snapshot.empty import get_empty_snapshots_for_deletion
+from zettarepl.snapshot.destroy import destroy_snapshots, destroy_snapshots_options
+from zettarepl.snapshot.destroy_queue import DestroyQueues
+from zettarepl.snapshot.empty import EmptySnapshotsCheck, get_empty_snapshots_for_deletion, get_empty_snapshots_tasks
+from zettarepl.snapshot.inventory import snapshot_inventories
 from zettarepl.snapshot.list import *
-from zettarepl.snapshot.name import get_snapshot_name, parse_snapshot_name, parsed_snapshot_sort_key
+from zettarepl.snapshot.name import (
+    get_snapshot_name, parse_snapshot_name, parse_snapshots_names_with_multiple_schemas, parsed_snapshot_names_cache,
+    parsed_snapshot_sort_key,
+)
 from zettarepl.snapshot.snapshot import Snapshot
+from zettarepl.snapshot.task.nonintersecting_sets import calculate_nonintersecting_sets, interleave_sets_by_pool
 from zettarepl.snapshot.task.snapshot_owner import PeriodicSnapshotTaskSnapshotOwner
 from zettarepl.snapshot.task.task import PeriodicSnapshotTask
 from zettarepl.task import Task
@@ -38,7 +54,7 @@ from zettarepl.transport.compare import are_same_host
 from zettarepl.transport.interface import Shell, Transport
 from zettarepl.transport.local import LocalShell
 from zettarepl.truenas.removal_dates import get_removal_dates
-from zettarepl.utils.itertools import bisect_by_class, select_by_class, sortedgroupby
+from zettarepl.utils.itertools import bisect, bisect_by_class, select_by_class, sortedgroupby
 from zettarepl.utils.logging import ReplicationTaskLoggingLevelFilter
 
 logger = logging.getLogger(__name__)
@@ -53,23 +69,59 @@ ScheduledPeriodicSnapshotTask = namedtuple("ScheduledPeriodicSnapshotTask", [
 def create_zettarepl(definition: Definition, clock_args: tuple[Any, ...] | None = None) -> Zettarepl:
     clock_args = clock_args or tuple()
 
-    clock = Clock(*clock_args)
+    clock = (EventClock if definition.event_clock else Clock)(*clock_args)
     tz_clock = TzClock(definition.timezone, clock.now)
 
-    scheduler = Scheduler(clock, tz_clock)
+    if definition.snapshot_names_cache_size is not None:
+        parsed_snapshot_names_cache.resize(definition.snapshot_names_cache_size)
+
+    snapshot_inventories.set_ttl(definition.snapshot_inventory_ttl)
+    dataset_topologies.set_ttl(definition.dataset_topology_ttl)
+
+    destroy_snapshots_options.max_parallel_pools = definition.snapshot_destruction_max_parallel_pools
+    destroy_snapshots_options.adaptive = definition.adaptive_snapshot_destruction
+    destroy_snapshots_options.ranges = definition.snapshot_destruction_ranges
+    destroy_snapshots_options.channel_program = definition.snapshot_destruction_channel_program
+
+    vectorized_retention_options.enabled = definition.vectorized_retention
+    if definition.vectorized_retention and not vectorized_retention_enabled():
+        logger.warning("NumPy is not installed, vectorized retention is disabled")
+
+    scheduler = (HeapScheduler if definition.heap_scheduler else Scheduler)(clock, tz_clock)
+    if isinstance(clock, EventClock) and isinstance(scheduler, HeapScheduler):
+        clock.next_wakeup = scheduler.next_run_utc
     local_shell = LocalShell()
 
-    return Zettarepl(scheduler, local_shell, definition.max_parallel_replication_tasks, definition.use_removal_dates)
+    destroy_queues = None
+    if definition.snapshot_destruction_queue:
+        destroy_queues = DestroyQueues(definition.snapshot_destruction_rate, definition.deferred_snapshot_destruction)
+
+    return Zettarepl(scheduler, local_shell, definition.max_parallel_replication_tasks, definition.use_removal_dates,
+                     definition.batch_snapshot_creation, definition.empty_snapshots_check,
+                     definition.max_parallel_periodic_snapshot_tasks, definition.non_blocking_scheduler,
+                     definition.replication_trigger_debounce, destroy_queues)
 
 
 class Zettarepl:
     def __init__(self, scheduler: Scheduler, local_shell: LocalShell,
                  max_parallel_replication_tasks: int | None = None,
-                 use_removal_dates: bool = False) -> None:
+                 use_removal_dates: bool = False, batch_snapshot_creation: bool = False,
+                 empty_snapshots_check: EmptySnapshotsCheck = EmptySnapshotsCheck.AFTER_CREATION,
+                 max_parallel_periodic_snapshot_tasks: int = 1, non_blocking_scheduler: bool = False,
+                 replication_trigger_debounce: float | None = None,
+                 destroy_queues: DestroyQueues | None = None) -> None:
         self.scheduler = scheduler
         self.local_shell = local_shell
         self.max_parallel_replication_tasks = max_parallel_replication_tasks
         self.use_removal_dates = use_removal_dates
+        self.batch_snapshot_creation = batch_snapshot_creation
+        self.empty_snapshots_check = empty_snapshots_check
+        self.max_parallel_periodic_snapshot_tasks = max_parallel_periodic_snapshot_tasks
+        self.non_blocking_scheduler = non_blocking_scheduler
+        self.replication_trigger_debounce = replication_trigger_debounce
+        self.destroy_queues = destroy_queues
+        if self.destroy_queues is not None:
+            self.destroy_queues.on_batch_done = self._on_retention_snapshots_destroyed
 
         self.observer: Callable[[ObserverMessage], Any] | None = None
 
@@ -82,6 +134,11 @@ class Zettarepl:
         self.retention_datetime: datetime | None = None
         self.retention_running: bool = False
         self.retention_shells: dict[Transport, Shell] = {}
+        self.scheduled_lock = threading.Lock()
+        self.pending_scheduled: list[tuple[SchedulerResult, bool]] = []
+        self.triggered_lock = threading.Lock()
+        self.triggered_replication_tasks: list[tuple[datetime, ReplicationTask]] = []
+        self.triggered_timer: threading.Timer | None = None
 
     def set_observer(self, observer: Callable[[ObserverMessage], Any] | None) -> None:
         self.observer = observer
@@ -101,37 +158,251 @@ class Zettarepl:
         return False
 
     def run(self) -> None:
+        if self.non_blocking_scheduler:
+            self._run_non_blocking()
+            return
+
         for scheduled in self.scheduler.schedule():
-            logger.debug("Scheduled: %r", scheduled)
+            legit_step_back = self._process_scheduled(scheduled)
+            self._run_scheduled_tasks(scheduled, legit_step_back)
+
+    def _run_non_blocking(self) -> None:
+        """
+        Scheduled tasks are run by a single worker thread, so the scheduler keeps ticking while snapshots are being
+        created. If the worker is late, the ticks that are waiting for it are run one after another as soon as it is
+        free (each with its own datetime so that snapshot names match the tasks schedules). A task that is still
+        waiting for an earlier tick is not run again for the later one.
+        """
+        # Event clock (with heap scheduler) skips minutes without scheduled tasks on purpose
+        report_missed_ticks = not isinstance(getattr(self.scheduler, "clock", None), EventClock)
+        previous_utc_datetime = None
+        with ThreadPoolExecutor(1, thread_name_prefix="scheduled_tasks") as executor:
+            for scheduled in self.scheduler.schedule():
+                legit_step_back = self._process_scheduled(scheduled)
+
+                utc_datetime = scheduled.datetime.utc_datetime.replace(second=0, microsecond=0)
+                if not scheduled.interrupted:
+                    if (
+                        report_missed_ticks and
+                        previous_utc_datetime is not None and
+                        utc_datetime - previous_utc_datetime > timedelta(minutes=1)
+                    ):
+                        logger.warning("Missed %d scheduler tick(s) between %r and %r",
+                                       (utc_datetime - previous_utc_datetime) // timedelta(minutes=1) - 1,
+                                       previous_utc_datetime, utc_datetime)
+
+                    previous_utc_datetime = utc_datetime
+
+                if not scheduled.tasks:
+                    continue
 
-            if scheduled.datetime.legit_step_back:
-                self.legit_step_back_until = scheduled.datetime.utc_datetime + scheduled.datetime.legit_step_back
+                with self.scheduled_lock:
+                    if self.pending_scheduled:
+                        logger.warning(
+                            "Scheduled tasks for %r have not started yet as previous tasks are still running, "
+                            "scheduled tasks for %r will run after them",
+                            self.pending_scheduled[0][0].datetime.datetime, scheduled.datetime.datetime,
+                        )
+                        pending_tasks = [task for pending, _ in self.pending_scheduled for task in pending.tasks]
+                        tasks = [task for task in scheduled.tasks if task not in pending_tasks]
+                        if tasks:
+                            self.pending_scheduled.append((scheduled._replace(tasks=tasks), legit_step_back))
+                    else:
+                        self.pending_scheduled.append((scheduled, legit_step_back))
+                        executor.submit(self._run_pending_scheduled_tasks)
+
+    def _run_pending_scheduled_tasks(self) -> None:
+        with self.scheduled_lock:
+            pending_scheduled = self.pending_scheduled
+            self.pending_scheduled = []
+
+        for scheduled, legit_step_back in pending_scheduled:
+            try:
+                self._run_scheduled_tasks(scheduled, legit_step_back)
+            except Exception:
+                logger.error("Unhandled exception while running scheduled tasks %r", scheduled.tasks, exc_info=True)
 
-            legit_step_back = (
-                self.legit_step_back_until is not None and
-                scheduled.datetime.utc_datetime < self.legit_step_back_until
-            )
+    def _process_scheduled(self, scheduled: SchedulerResult) -> bool:
+        logger.debug("Scheduled: %r", scheduled)
 
-            self.retention_datetime = scheduled.datetime.datetime
+        if scheduled.datetime.legit_step_back:
+            self.legit_step_back_until = scheduled.datetime.utc_datetime + scheduled.datetime.legit_step_back
 
-            tasks = scheduled.tasks
-            if tasks:
-                logger.info("Scheduled tasks: %r", tasks)
+        legit_step_back = (
+            self.legit_step_back_until is not None and
+            scheduled.datetime.utc_datetime < self.legit_step_back_until
+        )
 
-                periodic_snapshot_tasks, tasks = bisect_by_class(PeriodicSnapshotTask, tasks)
-                self._run_periodic_snapshot_tasks(scheduled.datetime.offset_aware_datetime, periodic_snapshot_tasks,
-                                                  legit_step_back, scheduled.interrupted)
+        self.retention_datetime = scheduled.datetime.datetime
 
-                replication_tasks, tasks = bisect_by_class(ReplicationTask, tasks)
-                replication_tasks.extend(
-                    self._replication_tasks_for_periodic_snapshot_tasks(
-                        bisect_by_class(ReplicationTask, self.tasks)[0], periodic_snapshot_tasks))
-                self._spawn_replication_tasks(scheduled.datetime.offset_aware_datetime, replication_tasks)
+        return legit_step_back
 
-                assert tasks == []
+    def _run_scheduled_tasks(self, scheduled: SchedulerResult, legit_step_back: bool) -> None:
+        tasks = scheduled.tasks
+        if tasks:
+            logger.info("Scheduled tasks: %r", tasks)
 
-    def _run_periodic_snapshot_tasks(self, now: datetime, tasks: list[PeriodicSnapshotTask],
-                                     legit_step_back: bool, interrupted: bool) -> None:
+            # Spread offsets are counted from the beginning of the scheduled minute
+            spread_base = scheduled.datetime.utc_datetime.replace(second=0, microsecond=0)
+
+            periodic_snapshot_tasks, tasks = bisect_by_class(PeriodicSnapshotTask, tasks)
+            replication_tasks, tasks = bisect_by_class(ReplicationTask, tasks)
+            periodic_snapshot_replication_tasks = self._replication_tasks_for_periodic_snapshot_tasks(
+                bisect_by_class(ReplicationTask, self.tasks)[0], periodic_snapshot_tasks)
+
+            on_tasks_set_done = None
+            if self.replication_trigger_debounce is not None:
+                # Replication tasks that are not spread are spawned as soon as all their periodic snapshot tasks are
+                # done instead of waiting for all the other periodic snapshot tasks
+                triggered_replication_tasks, periodic_snapshot_replication_tasks = bisect(
+                    lambda replication_task: not replication_task.spread, periodic_snapshot_replication_tasks,
+                )
+                on_tasks_set_done = self._replication_trigger(
+                    scheduled.datetime.offset_aware_datetime, triggered_replication_tasks, periodic_snapshot_tasks,
+                )
+
+            replication_tasks.extend(periodic_snapshot_replication_tasks)
+
+            def spawn_replication_tasks() -> None:
+                for offset, replication_tasks_group in self._spread_replication_tasks(
+                    replication_tasks, scheduled.interrupted,
+                ):
+                    self._spawn_replication_tasks_at(spread_base + offset, scheduled.datetime.offset_aware_datetime,
+                                                     replication_tasks_group)
+
+            periodic_snapshot_tasks_groups = self._spread_periodic_snapshot_tasks(periodic_snapshot_tasks,
+                                                                                  scheduled.interrupted)
+            if periodic_snapshot_tasks_groups:
+                self._run_periodic_snapshot_tasks_groups(spread_base, scheduled.datetime.offset_aware_datetime,
+                                                         periodic_snapshot_tasks_groups, legit_step_back,
+                                                         scheduled.interrupted, on_tasks_set_done,
+                                                         spawn_replication_tasks)
+            else:
+                spawn_replication_tasks()
+
+            assert tasks == []
+
+    def _spread_periodic_snapshot_tasks(
+        self, tasks: list[PeriodicSnapshotTask], interrupted: bool,
+    ) -> list[tuple[timedelta, list[PeriodicSnapshotTask]]]:
+        if interrupted:
+            return [(timedelta(0), tasks)] if tasks else []
+
+        # Snapshots of intersecting tasks depend on each other (i.e. recursive snapshot should be created before
+        # non-recursive snapshot with the same name), so they are always created together.
+        offsets = {}
+        for tasks_set in calculate_nonintersecting_sets(tasks):
+            offset = min(spread_offset(task.id, task.spread) for task in tasks_set)
+            for task in tasks_set:
+                offsets[task] = offset
+
+        return sortedgroupby(tasks, lambda task: offsets[task])
+
+    def _spread_replication_tasks(
+        self, replication_tasks: list[ReplicationTask], interrupted: bool,
+    ) -> list[tuple[timedelta, list[ReplicationTask]]]:
+        if interrupted:
+            return [(timedelta(0), replication_tasks)] if replication_tasks else []
+
+        return sortedgroupby(
+            replication_tasks,
+            lambda replication_task: spread_offset(replication_task.id, replication_task.spread),
+        )
+
+    def _run_periodic_snapshot_tasks_groups(
+        self, spread_base: datetime, now: datetime,
+        periodic_snapshot_tasks_groups: list[tuple[timedelta, list[PeriodicSnapshotTask]]], legit_step_back: bool,
+        interrupted: bool, on_tasks_set_done: Callable[[list[PeriodicSnapshotTask]], None] | None,
+        on_done: Callable[[], None],
+    ) -> None:
+        # Snapshots of non-intersecting tasks still affect each other's emptiness (i.e. non-recursive `pool` snapshot
+        # is not empty if `pool/a` snapshot is not), so empty snapshots are checked for all the groups at once
+        tasks_with_snapshot_names = self._schedule_periodic_snapshot_tasks(
+            now, [task for _, tasks in periodic_snapshot_tasks_groups for task in tasks],
+        )
+
+        # Empty snapshots are destroyed once all the groups are done
+        groups_lock = threading.Lock()
+        groups_left = len(periodic_snapshot_tasks_groups)
+        deferred_tasks_sets: list[list[PeriodicSnapshotTask]] = []
+
+        def on_group_done(group_deferred_tasks_sets: list[list[PeriodicSnapshotTask]]) -> None:
+            nonlocal groups_left
+
+            with groups_lock:
+                groups_left -= 1
+                deferred_tasks_sets.extend(group_deferred_tasks_sets)
+                done = groups_left == 0
+
+            if done:
+                try:
+                    self._destroy_empty_snapshots(tasks_with_snapshot_names)
+                finally:
+                    if on_tasks_set_done is not None:
+                        for tasks_set in deferred_tasks_sets:
+                            on_tasks_set_done(tasks_set)
+
+                    on_done()
+
+        for offset, periodic_snapshot_tasks_group in periodic_snapshot_tasks_groups:
+            self._run_periodic_snapshot_tasks_at(
+                spread_base + offset,
+                [(task, snapshot_name) for task, snapshot_name in tasks_with_snapshot_names
+                 if task in periodic_snapshot_tasks_group],
+                legit_step_back, interrupted, on_tasks_set_done, on_group_done,
+            )
+
+    def _run_periodic_snapshot_tasks_at(
+        self, utc_datetime: datetime, tasks_with_snapshot_names: list[tuple[PeriodicSnapshotTask, str]],
+        legit_step_back: bool, interrupted: bool,
+        on_tasks_set_done: Callable[[list[PeriodicSnapshotTask]], None] | None,
+        on_done: Callable[[list[list[PeriodicSnapshotTask]]], None],
+    ) -> None:
+        def run() -> None:
+            deferred_tasks_sets = []
+            try:
+                deferred_tasks_sets = self._create_periodic_snapshots(tasks_with_snapshot_names, legit_step_back,
+                                                                      interrupted, on_tasks_set_done)
+            finally:
+                # Other groups and replication tasks should not be held back by this group's failure
+                on_done(deferred_tasks_sets)
+
+        def run_delayed() -> None:
+            try:
+                run()
+            except Exception:
+                logger.error("Unhandled exception while running periodic snapshot tasks %r",
+                             tasks_with_snapshot_names, exc_info=True)
+
+        delay = (utc_datetime - datetime.utcnow()).total_seconds()
+        if delay > 0:
+            # Do not block the scheduler thread while waiting
+            logger.debug("Running periodic snapshot tasks %r in %.3f seconds", tasks_with_snapshot_names, delay)
+            threading.Timer(delay, run_delayed).start()
+        else:
+            run()
+
+    def _spawn_replication_tasks_at(self, utc_datetime: datetime, now: datetime,
+                                    replication_tasks: list[ReplicationTask]) -> None:
+        delay = (utc_datetime - datetime.utcnow()).total_seconds()
+        if delay > 0:
+            logger.debug("Spawning replication tasks %r in %.3f seconds", replication_tasks, delay)
+            threading.Timer(delay, self._spawn_replication_tasks, (now, replication_tasks)).start()
+        else:
+            self._spawn_replication_tasks(now, replication_tasks)
+
+    def _run_periodic_snapshot_tasks(self, now: datetime, tasks: list[PeriodicSnapshotTask], legit_step_back: bool,
+                                     interrupted: bool) -> None:
+        tasks_with_snapshot_names = self._schedule_periodic_snapshot_tasks(now, tasks)
+        self._create_periodic_snapshots(tasks_with_snapshot_names, legit_step_back, interrupted)
+        self._destroy_empty_snapshots(tasks_with_snapshot_names)
+
+    def _schedule_periodic_snapshot_tasks(self, now: datetime,
+                                          tasks: list[PeriodicSnapshotTask]) -> list[tuple[PeriodicSnapshotTask, str]]:
+        """
+        Returns tasks with the names of the snapshots they should create, in the order the snapshots should be
+        created in.
+        """
         scheduled_tasks = []
         for task in tasks:
             snapshot_name = get_snapshot_name(now, task.naming_schema)
@@ -173,8 +444,73 @@ class Zettarepl:
             for scheduled_task in scheduled_tasks
         ]
 
-        created_snapshots = set()
-        for task, snapshot_name in tasks_with_snapshot_names:
+        if self.empty_snapshots_check == EmptySnapshotsCheck.BEFORE_CREATION:
+            empty_tasks = get_empty_snapshots_tasks(self.local_shell, tasks_with_snapshot_names)
+            for task, snapshot_name in empty_tasks:
+                logger.info("Not creating %r as nothing has been written since the previous snapshot",
+                            Snapshot(task.dataset, snapshot_name))
+                # Same as if it was created and then destroyed as empty
+                notify(self.observer, PeriodicSnapshotTaskSuccess(task.id, task.dataset, snapshot_name, False))
+
+            tasks_with_snapshot_names = [
+                task_with_snapshot_name
+                for task_with_snapshot_name in tasks_with_snapshot_names
+                if task_with_snapshot_name not in empty_tasks
+            ]
+
+        return tasks_with_snapshot_names
+
+    def _create_periodic_snapshots(
+        self, tasks_with_snapshot_names: list[tuple[PeriodicSnapshotTask, str]], legit_step_back: bool,
+        interrupted: bool, on_tasks_set_done: Callable[[list[PeriodicSnapshotTask]], None] | None = None,
+    ) -> list[list[PeriodicSnapshotTask]]:
+        """
+        Returns task sets whose `on_tasks_set_done` should only be called once empty snapshots are destroyed (so that
+        their replication tasks do not replicate snapshots that are about to be destroyed).
+        """
+        deferred_tasks_sets = []
+
+        def run_tasks_set(tasks_set: list[tuple[PeriodicSnapshotTask, str]]) -> None:
+            self._run_periodic_snapshot_tasks_set(tasks_set, legit_step_back, interrupted)
+            if on_tasks_set_done is not None:
+                tasks = [task for task, _ in tasks_set]
+                if all(task.allow_empty for task in tasks):
+                    on_tasks_set_done(tasks)
+                else:
+                    deferred_tasks_sets.append(tasks)
+
+        if self.max_parallel_periodic_snapshot_tasks > 1:
+            # Non-intersecting task sets do not depend on each other, so they can be created concurrently
+            snapshot_names = dict(tasks_with_snapshot_names)
+            tasks_sets = calculate_nonintersecting_sets([task for task, _ in tasks_with_snapshot_names])
+            if len(tasks_sets) > 1:
+                # Interleave pools so that each of them gets its own worker when there are enough of them
+                tasks_sets = interleave_sets_by_pool(tasks_sets)
+                with ThreadPoolExecutor(min(self.max_parallel_periodic_snapshot_tasks, len(tasks_sets)),
+                                        thread_name_prefix="periodic_snapshot") as executor:
+                    futures = [
+                        executor.submit(run_tasks_set, [(task, snapshot_names[task]) for task in tasks_set])
+                        for tasks_set in tasks_sets
+                    ]
+                    for future in futures:
+                        future.result()
+
+                return deferred_tasks_sets
+
+        run_tasks_set(tasks_with_snapshot_names)
+        return deferred_tasks_sets
+
+    def _run_periodic_snapshot_tasks_set(self, tasks_with_snapshot_names: list[tuple[PeriodicSnapshotTask, str]],
+                                         legit_step_back: bool, interrupted: bool) -> None:
+        created_snapshots: set[Snapshot] = set()
+        if self.batch_snapshot_creation and len(tasks_with_snapshot_names) > 1:
+            tasks_with_snapshot_names_to_create = self._create_periodic_snapshots_batch(
+                tasks_with_snapshot_names, created_snapshots, legit_step_back, interrupted,
+            )
+        else:
+            tasks_with_snapshot_names_to_create = tasks_with_snapshot_names
+
+        for task, snapshot_name in tasks_with_snapshot_names_to_create:
             snapshot = Snapshot(task.dataset, snapshot_name)
             if snapshot in created_snapshots:
                 notify(self.observer, PeriodicSnapshotTaskSuccess(task.id, snapshot.dataset, snapshot.name, False))
@@ -184,37 +520,82 @@ class Zettarepl:
             try:
                 create_snapshot(self.local_shell, snapshot, task.recursive, task.exclude, options.properties)
             except CreateSnapshotError as e:
-                logger.warning("Error creating %r: %r", snapshot, e)
+                self._periodic_snapshot_task_error(task, snapshot, e, legit_step_back, interrupted)
+            else:
+                self._periodic_snapshot_task_success(task, snapshot, created_snapshots)
 
-                already_exists = (
-                    e.snapshots_errors and
-                    all(se[1] == "snapshot already exists" for se in e.snapshots_errors)
-                )
-                if already_exists and (legit_step_back or interrupted):
-                    if legit_step_back:
-                        logger.warning(
-                            "This is due to the DST offset change, notifying replication task success anyway"
-                        )
+    def _destroy_empty_snapshots(self, tasks_with_snapshot_names: list[tuple[PeriodicSnapshotTask, str]]) -> None:
+        empty_snapshots = get_empty_snapshots_for_deletion(
+            self.local_shell, tasks_with_snapshot_names,
+            self.empty_snapshots_check != EmptySnapshotsCheck.AFTER_CREATION,
+        )
+        if empty_snapshots:
+            logger.info("Destroying empty snapshots: %r", empty_snapshots)
+            destroy_snapshots(self.local_shell, empty_snapshots)
 
-                    if interrupted:
-                        logger.warning(
-                            "Periodic snapshot task was called manually, notifying replication task success anyway "
-                            "so that TrueNAS alerts don't trigger"
-                        )
+    def _create_periodic_snapshots_batch(
+        self, tasks_with_snapshot_names: list[tuple[PeriodicSnapshotTask, str]], created_snapshots: set[Snapshot],
+        legit_step_back: bool, interrupted: bool,
+    ) -> list[tuple[PeriodicSnapshotTask, str]]:
+        """
+        Creates all snapshots at once. Returns tasks whose snapshots are the same as some other task's. They should be
+        processed (after this batch) the usual way.
+        """
+        batch = []
+        batch_snapshots = set()
+        duplicates = []
+        for task, snapshot_name in tasks_with_snapshot_names:
+            snapshot = Snapshot(task.dataset, snapshot_name)
+            if snapshot in batch_snapshots:
+                duplicates.append((task, snapshot_name))
+                continue
 
-                    notify(self.observer, PeriodicSnapshotTaskSuccess(task.id, snapshot.dataset, snapshot.name, True))
-                else:
-                    notify(self.observer, PeriodicSnapshotTaskError(task.id, str(e)))
+            options = notify(self.observer, PeriodicSnapshotTaskStart(task.id))
+            batch.append((task, snapshot, options.properties))
+            batch_snapshots.add(snapshot)
+
+        errors = create_snapshots(self.local_shell, [
+            SnapshotToCreate(snapshot, task.recursive, task.exclude, properties)
+            for task, snapshot, properties in batch
+        ])
+        for (task, snapshot, _), error in zip(batch, errors):
+            if error is None:
+                self._periodic_snapshot_task_success(task, snapshot, created_snapshots)
             else:
-                logger.info("Created %r", snapshot)
-                created_snapshots.add(snapshot)
+                self._periodic_snapshot_task_error(task, snapshot, error, legit_step_back, interrupted)
 
-                notify(self.observer, PeriodicSnapshotTaskSuccess(task.id, snapshot.dataset, snapshot.name, False))
+        return duplicates
 
-        empty_snapshots = get_empty_snapshots_for_deletion(self.local_shell, tasks_with_snapshot_names)
-        if empty_snapshots:
-            logger.info("Destroying empty snapshots: %r", empty_snapshots)
-            destroy_snapshots(self.local_shell, empty_snapshots)
+    def _periodic_snapshot_task_success(self, task: PeriodicSnapshotTask, snapshot: Snapshot,
+                                        created_snapshots: set[Snapshot]) -> None:
+        logger.info("Created %r", snapshot)
+        created_snapshots.add(snapshot)
+
+        notify(self.observer, PeriodicSnapshotTaskSuccess(task.id, snapshot.dataset, snapshot.name, False))
+
+    def _periodic_snapshot_task_error(self, task: PeriodicSnapshotTask, snapshot: Snapshot, e: CreateSnapshotError,
+                                      legit_step_back: bool, interrupted: bool) -> None:
+        logger.warning("Error creating %r: %r", snapshot, e)
+
+        already_exists = (
+            e.snapshots_errors and
+            all(se[1] == "snapshot already exists" for se in e.snapshots_errors)
+        )
+        if already_exists and (legit_step_back or interrupted):
+            if legit_step_back:
+                logger.warning(
+                    "This is due to the DST offset change, notifying replication task success anyway"
+                )
+
+            if interrupted:
+                logger.warning(
+                    "Periodic snapshot task was called manually, notifying replication task success anyway "
+                    "so that TrueNAS alerts don't trigger"
+                )
+
+            notify(self.observer, PeriodicSnapshotTaskSuccess(task.id, snapshot.dataset, snapshot.name, True))
+        else:
+            notify(self.observer, PeriodicSnapshotTaskError(task.id, str(e)))
 
     def _replication_tasks_for_periodic_snapshot_tasks(
         self, replication_tasks: list[ReplicationTask],
@@ -232,6 +613,68 @@ class Zettarepl:
 
         return result
 
+    def _replication_trigger(
+        self, now: datetime, replication_tasks: list[ReplicationTask],
+        periodic_snapshot_tasks: list[PeriodicSnapshotTask],
+    ) -> Callable[[list[PeriodicSnapshotTask]], None]:
+        """
+        Returns a callback that is called with each set of periodic snapshot tasks once it is done and triggers the
+        replication tasks all of whose scheduled periodic snapshot tasks are done.
+        """
+        lock = threading.Lock()
+        waiting = [
+            (replication_task, [
+                periodic_snapshot_task
+                for periodic_snapshot_task in periodic_snapshot_tasks
+                if periodic_snapshot_task in replication_task.periodic_snapshot_tasks
+            ])
+            for replication_task in replication_tasks
+        ]
+
+        def on_tasks_set_done(tasks_set: list[PeriodicSnapshotTask]) -> None:
+            nonlocal waiting
+
+            with lock:
+                ready = []
+                still_waiting = []
+                for replication_task, remaining in waiting:
+                    remaining = [task for task in remaining if task not in tasks_set]
+                    if remaining:
+                        still_waiting.append((replication_task, remaining))
+                    else:
+                        ready.append(replication_task)
+
+                waiting = still_waiting
+
+            if ready:
+                self._trigger_replication_tasks(now, ready)
+
+        return on_tasks_set_done
+
+    def _trigger_replication_tasks(self, now: datetime, replication_tasks: list[ReplicationTask]) -> None:
+        assert self.replication_trigger_debounce is not None
+
+        with self.triggered_lock:
+            for replication_task in replication_tasks:
+                if not any(rt == replication_task for _, rt in self.triggered_replication_tasks):
+                    self.triggered_replication_tasks.append((now, replication_task))
+
+            # Tasks triggered during the debounce interval are spawned together
+            if self.triggered_timer is None:
+                self.triggered_timer = threading.Timer(self.replication_trigger_debounce,
+                                                       self._spawn_triggered_replication_tasks)
+                self.triggered_timer.start()
+
+    def _spawn_triggered_replication_tasks(self) -> None:
+        with self.triggered_lock:
+            triggered_replication_tasks = self.triggered_replication_tasks
+            self.triggered_replication_tasks = []
+            self.triggered_timer = None
+
+        logger.info("Triggered replication tasks: %r", [rt for _, rt in triggered_replication_tasks])
+        for now, replication_tasks in sortedgroupby(triggered_replication_tasks, lambda v: v[0]):
+            self._spawn_replication_tasks(now, [rt for _, rt in replication_tasks])
+
     def _spawn_replication_tasks(self, now: datetime, replication_tasks: list[ReplicationTask]) -> None:
         with self.tasks_lock:
             for replication_task in replication_tasks:
@@ -256,6 +699,11 @@ class Zettarepl:
         if self.retention_running:
             return "Waiting for retention to complete"
 
+        if self.destroy_queues is not None:
+            # Replication task could otherwise use a snapshot that is about to be destroyed
+            if self._replication_task_uses_pending_destroy_snapshots(replication_task):
+                return "Waiting for retention to destroy snapshots"
+
         if self.max_parallel_replication_tasks is not None:
             if len(self.running_tasks) >= self.max_parallel_replication_tasks:
                 return f"Waiting for {len(self.running_tasks)} running replication tasks to finish"
@@ -267,18 +715,54 @@ class Zettarepl:
 
         return None
 
+    def _replication_task_uses_pending_destroy_snapshots(self, replication_task: ReplicationTask) -> bool:
+        """
+        Checks if any of the snapshots that are queued for destruction could be sent (or used as an incremental base)
+        by the replication task. Snapshots of other transports, datasets or naming schemas do not hold it back.
+        """
+        assert self.destroy_queues is not None
+
+        pending_snapshots = self.destroy_queues.pending_snapshots()
+        if not pending_snapshots:
+            return False
+
+        if replication_task.direction == ReplicationDirection.PULL:
+            src_transport, dst_transport = replication_task.transport, self.local_shell.transport
+        else:
+            src_transport, dst_transport = self.local_shell.transport, replication_task.transport
+
+        names = [
+            snapshot.name
+            for snapshot in pending_snapshots.get(src_transport, [])
+            if replication_task_should_replicate_dataset(replication_task, snapshot.dataset)
+        ] + [
+            snapshot.name
+            for snapshot in pending_snapshots.get(dst_transport, [])
+            if replication_task_replicates_target_dataset(replication_task, snapshot.dataset)
+        ]
+        if not names:
+            return False
+
+        if replication_task.name_pattern:
+            # Any common snapshot can be used as an incremental base
+            return True
+
+        try:
+            return bool(parse_snapshots_names_with_multiple_schemas(
+                names, replication_task_naming_schemas(replication_task),
+            ))
+        except ValueError:
+            return True
+
     def _replication_tasks_can_run_in_parallel(self, t1: ReplicationTask, t2: ReplicationTask) -> bool:
         if t1.direction == t2.direction:
             if not are_same_host(t1.transport, t2.transport):
                 return True
 
+            t1_target_datasets = DatasetTree(get_target_dataset(t1, dataset) for dataset in t1.source_datasets)
             return not any(
-                (
-                    is_child(get_target_dataset(t1, dataset1), get_target_dataset(t2, dataset2)) or
-                    is_child(get_target_dataset(t2, dataset2), get_target_dataset(t1, dataset1))
-                )
-                for dataset1 in t1.source_datasets
-                for dataset2 in t2.source_datasets
+                t1_target_datasets.intersects(get_target_dataset(t2, dataset))
+                for dataset in t2.source_datasets
             )
         else:
             if t1.direction == ReplicationDirection.PULL and t2.direction == ReplicationDirection.PUSH:
@@ -361,10 +845,23 @@ class Zettarepl:
         except Exception:
             logger.error("Unhandled exception while running retention", exc_info=True)
 
+        logger.debug("Parsed snapshot names cache: %r", parsed_snapshot_names_cache.cache_info())
+
         with self.tasks_lock:
             self.retention_running = False
             self._spawn_pending_tasks()
 
+    def _on_retention_snapshots_destroyed(self) -> None:
+        with self.tasks_lock:
+            self._spawn_pending_tasks()
+
+    def _destroy_retention_snapshots(self, shell: Shell, snapshots: list[Snapshot]) -> None:
+        if self.destroy_queues is not None:
+            # Snapshots are destroyed in background so that retention does not block replication tasks
+            self.destroy_queues.enqueue(shell, snapshots)
+        else:
+            destroy_snapshots(shell, snapshots)
+
     def _transport_for_replication_tasks(
         self,
         replication_tasks: list[ReplicationTask],
@@ -422,7 +919,8 @@ class Zettarepl:
         ])
         if snapshot_removal_date_owner:
             local_snapshots_queries.extend([(dataset, False) for dataset in snapshot_removal_date_owner.datasets])
-        local_snapshots = multilist_snapshots(self.local_shell, local_snapshots_queries, ignore_nonexistent=True)
+        local_snapshots = multilist_snapshots(self.local_shell, local_snapshots_queries, ignore_nonexistent=True,
+                                              batch=True)
         local_snapshots_grouped = group_snapshots_by_datasets(local_snapshots)
 
         owners: list[SnapshotOwner] = []
@@ -451,7 +949,8 @@ class Zettarepl:
             shell = self._get_retention_shell(transport)
             remote_snapshots_queries = replication_tasks_source_datasets_queries(replication_tasks)
             try:
-                remote_snapshots = multilist_snapshots(shell, remote_snapshots_queries, ignore_nonexistent=True)
+                remote_snapshots = multilist_snapshots(shell, remote_snapshots_queries, ignore_nonexistent=True,
+                                                       batch=True)
             except Exception as e:
                 logger.warning("Local retention failed: error listing snapshots on %r: %r", transport, e)
                 continue
@@ -464,7 +963,7 @@ class Zettarepl:
 
         snapshots_to_destroy = calculate_snapshots_to_remove(owners, local_snapshots)
         logger.info("Retention destroying local snapshots: %r", snapshots_to_destroy)
-        destroy_snapshots(self.local_shell, snapshots_to_destroy)
+        self._destroy_retention_snapshots(self.local_shell, snapshots_to_destroy)
 
     def _run_remote_retention(self, now: datetime, pending_running_tasks: list[ReplicationTask]) -> None:
         push_replication_tasks = [
@@ -479,12 +978,14 @@ class Zettarepl:
             self.local_shell,
             replication_tasks_source_datasets_queries(push_replication_tasks),
             ignore_nonexistent=True,
+            batch=True,
         ))
         for transport, replication_tasks in self._transport_for_replication_tasks(push_replication_tasks):
             shell = self._get_retention_shell(transport)
             remote_snapshots_queries = replication_tasks_target_datasets_queries(replication_tasks)
             try:
-                remote_snapshots = multilist_snapshots(shell, remote_snapshots_queries, ignore_nonexistent=True)
+                remote_snapshots = multilist_snapshots(shell, remote_snapshots_queries, ignore_nonexistent=True,
+                                                       batch=True)
             except Exception as e:
                 logger.warning("Remote retention failed on %r: error listing snapshots: %r",
                                transport, e)
@@ -499,7 +1000,7 @@ class Zettarepl:
             snapshots_to_destroy = calculate_snapshots_to_remove(owners, remote_snapshots)
             logger.info("Retention on %r destroying snapshots: %r", transport, snapshots_to_destroy)
             try:
-                destroy_snapshots(shell, snapshots_to_destroy)
+                self._destroy_retention_snapshots(shell, snapshots_to_destroy)
             except Exception as e:
                 logger.warning("Remote retention failed on %r: error destroying snapshots: %r",
                                transport, e)